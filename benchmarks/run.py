@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+
+import workbooks
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+sys.path.insert(0, SRC)
+
+import diff
+
+
+# times the stages of a workbook diff on synthetic workbooks:
+#   python benchmarks/run.py --modules 150 --lines 400 --output results.json
+#   python benchmarks/run.py --compare results.json
+
+DEFAULT_THRESHOLD = 0.2
+NULL_OID = '0' * 40
+
+
+def measure(function, repeat):
+    # one untimed run first: imports and caches of the first call are not what is measured
+    function()
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        runs.append(time.perf_counter() - start)
+    return {
+        'min': min(runs),
+        'median': statistics.median(runs),
+        'mean': statistics.mean(runs),
+        'runs': runs,
+    }
+
+
+def write_workbooks(tmp, container_format, args):
+    # an old and a new version of the same workbook, `changed_modules` of them churned
+    old_modules = workbooks.make_modules(args.modules, args.lines, seed=args.seed)
+    new_modules = dict(old_modules)
+    for i, name in enumerate(list(new_modules)[2:2 + args.changed_modules]):
+        new_modules[name] = workbooks.churn(new_modules[name], args.churn, seed=args.seed + i)
+
+    paths = []
+    for label, modules in (('old', old_modules), ('new', new_modules)):
+        path = os.path.join(tmp, f'{label}.{container_format}')
+        with open(path, 'wb') as f:
+            f.write(workbooks.build_workbook(container_format, modules))
+        paths.append(path)
+    return paths
+
+
+def run_benchmarks(args):
+    results = {}
+    env = dict(os.environ, GIT_XL_CACHE='0', GIT_XL_TRACE='')
+    os.environ.update(GIT_XL_CACHE='0', GIT_XL_TRACE='')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for container_format in args.formats:
+            old_path, new_path = write_workbooks(tmp, container_format, args)
+
+            results[f'get_vba[{container_format}]'] = measure(lambda: diff.get_vba(new_path), args.repeat)
+
+            def changed_modules():
+                return diff.changed_modules(diff.VBAModules(new_path), diff.VBAModules(old_path))
+            results[f'changed_modules[{container_format}]'] = measure(changed_modules, args.repeat)
+
+            new_modules, old_modules = diff.get_vba(new_path), diff.get_vba(old_path)
+
+            def render():
+                diffs = diff.diff_modules('Book1.' + container_format, new_modules, old_modules, 3, args.algorithm)
+                diff.print_diffs('Book1.' + container_format, diffs, io.StringIO(), color=True)
+            results[f'diff_render[{container_format}]'] = measure(render, args.repeat)
+
+            def render_json():
+                diffs = diff.diff_modules('Book1.' + container_format, new_modules, old_modules, 3, args.algorithm)
+                diff.print_json('Book1.' + container_format, diffs, io.StringIO(), ndjson=True)
+            results[f'diff_ndjson[{container_format}]'] = measure(render_json, args.repeat)
+
+            def stat():
+                stats = diff.count_changes(new_modules, old_modules)
+                diff.print_stat('Book1.' + container_format, stats, io.StringIO(), color=True)
+            results[f'diff_stat[{container_format}]'] = measure(stat, args.repeat)
+
+            # the whole diff driver as git runs it, including interpreter start-up
+            command = [sys.executable, os.path.join(SRC, 'diff.py'), f'--diff-algorithm={args.algorithm}',
+                       'Book1.' + container_format, old_path, NULL_OID, '100644', new_path, NULL_OID, '100644']
+            results[f'diff_process[{container_format}]'] = measure(
+                lambda: subprocess.run(command, cwd=tmp, env=env, stdout=subprocess.DEVNULL, check=True), args.repeat)
+
+    command = [sys.executable, os.path.join(SRC, 'cli.py'), 'version']
+    results['cli_startup'] = measure(
+        lambda: subprocess.run(command, env=env, stdout=subprocess.DEVNULL, check=True), args.repeat)
+    return results
+
+
+def compare(results, baseline, threshold):
+    # flags benchmarks whose fastest run got slower than the baseline's by more than `threshold`,
+    # the minimum is the measure least affected by noise from other processes
+    regressions = []
+    print(f'{"benchmark":<32} {"baseline":>10} {"current":>10} {"change":>8}')
+    for name, result in results.items():
+        if name not in baseline.get('results', {}):
+            print(f'{name:<32} {"-":>10} {result["min"]:>10.4f} {"new":>8}')
+            continue
+        before = baseline['results'][name]['min']
+        change = result['min'] / before - 1 if before else 0
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print(f'{name:<32} {before:>10.4f} {result["min"]:>10.4f} {change:>+8.1%}{flag}')
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark git-xl on synthetic workbooks.')
+    parser.add_argument('--modules', type=int, default=50, help='number of standard modules per workbook')
+    parser.add_argument('--lines', type=int, default=300, help='lines per module')
+    parser.add_argument('--changed-modules', type=int, default=1, help='modules that differ between both versions')
+    parser.add_argument('--churn', type=float, default=0.05, help='fraction of lines changed per changed module')
+    parser.add_argument('--formats', type=lambda value: value.split(','), default=list(workbooks.FORMATS),
+                        help='comma separated container formats (default: xls,xlsm,xlsb)')
+    parser.add_argument('--algorithm', default='myers', help='diff algorithm')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per benchmark')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--compare', metavar='BASELINE', help='compare against a JSON results file')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='relative slowdown reported as regression (default: 0.2)')
+    args = parser.parse_args(argv)
+
+    for container_format in args.formats:
+        if container_format not in workbooks.FORMATS:
+            parser.error(f'unsupported container format: {container_format}')
+
+    results = run_benchmarks(args)
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        # the workload: results recorded with other parameters are not comparable
+        'parameters': {key: value for key, value in vars(args).items()
+                       if key not in ('output', 'compare', 'threshold', 'repeat')},
+        'repeat': args.repeat,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get('parameters') != report['parameters']:
+            print('warning: baseline was recorded with different parameters', file=sys.stderr)
+        if compare(results, baseline, args.threshold):
+            return 1
+    elif not args.output:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
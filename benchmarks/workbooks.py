@@ -0,0 +1,350 @@
+import io
+import random
+import struct
+import zipfile
+
+
+# synthetic workbook generator: writes xls/xlsm/xlsb containers with a real VBA project
+# (compound file + MS-OVBA compressed dir and module streams) so that oletools can parse them
+
+SECTOR_SIZE = 4096
+MINI_SECTOR_SIZE = 64
+MINI_STREAM_CUTOFF = 4096
+FREESECT = 0xFFFFFFFF
+ENDOFCHAIN = 0xFFFFFFFE
+FATSECT = 0xFFFFFFFD
+NOSTREAM = 0xFFFFFFFF
+
+FORMATS = ('xls', 'xlsm', 'xlsb')
+
+WORDS = ['Value', 'Total', 'Count', 'Index', 'Rate', 'Price', 'Amount', 'Result', 'Item', 'Range', 'Sheet',
+         'Cell', 'Row', 'Column', 'Name', 'Data', 'Table', 'Offset', 'Factor', 'Balance']
+
+
+def compress(data):
+    # MS-OVBA 2.4.1.3.6, greedy matching within each 4096 byte chunk
+    out = bytearray(b'\x01')
+    for chunk_start in range(0, len(data), 4096):
+        chunk = data[chunk_start:chunk_start + 4096]
+        compressed = compress_chunk(chunk)
+        if len(compressed) > 4096 and len(chunk) == 4096:
+            out += struct.pack('<H', 0x3FFF) + chunk
+        else:
+            out += struct.pack('<H', 0xB000 | (len(compressed) - 1)) + compressed
+    return bytes(out)
+
+
+def compress_chunk(chunk):
+    out = bytearray()
+    candidates = {}
+    position = 0
+    while position < len(chunk):
+        flag_position = len(out)
+        out.append(0)
+        flags = 0
+        for bit in range(8):
+            if position >= len(chunk):
+                break
+            bit_count = max((position - 1).bit_length(), 4)
+            length_mask = 0xFFFF >> bit_count
+            max_length = length_mask + 3
+            best_length, best_offset = 0, 0
+            key = chunk[position:position + 3]
+            for candidate in reversed(candidates.get(key, [])[-32:]):
+                length = 0
+                limit = min(max_length, len(chunk) - position)
+                while length < limit and chunk[candidate + length] == chunk[position + length]:
+                    length += 1
+                if length > best_length:
+                    best_length, best_offset = length, position - candidate
+                    if length == limit:
+                        break
+            if best_length >= 3:
+                token = ((best_offset - 1) << (16 - bit_count)) | (best_length - 3)
+                out += struct.pack('<H', token)
+                flags |= 1 << bit
+                step = best_length
+            else:
+                out.append(chunk[position])
+                step = 1
+            for i in range(position, position + step):
+                candidates.setdefault(chunk[i:i + 3], []).append(i)
+            position += step
+        out[flag_position] = flags
+    return out
+
+
+def record(record_id, data=b''):
+    return struct.pack('<HI', record_id, len(data)) + data
+
+
+def build_dir_stream(modules, codepage):
+    codec = f'cp{codepage}'
+    name = b'VBAProject'
+    stream = bytearray()
+    stream += record(0x0001, struct.pack('<I', 3))
+    stream += record(0x0002, struct.pack('<I', 0x409))
+    stream += record(0x0014, struct.pack('<I', 0x409))
+    stream += record(0x0003, struct.pack('<H', codepage))
+    stream += record(0x0004, name)
+    stream += record(0x0005) + record(0x0040)
+    stream += record(0x0006) + record(0x003D)
+    stream += record(0x0007, struct.pack('<I', 0))
+    stream += record(0x0008, struct.pack('<I', 0))
+    stream += struct.pack('<HIIH', 0x0009, 4, 1, 0)
+    stream += record(0x000C) + record(0x003C)
+    stream += record(0x000F, struct.pack('<H', len(modules)))
+    stream += record(0x0013, struct.pack('<H', 0xFFFF))
+    for module_name, module_type in modules:
+        encoded_name = module_name.encode(codec)
+        unicode_name = module_name.encode('utf-16-le')
+        stream += record(0x0019, encoded_name) + record(0x0047, unicode_name)
+        stream += record(0x001A, encoded_name) + record(0x0032, unicode_name)
+        stream += record(0x001C) + record(0x0048)
+        stream += record(0x0031, struct.pack('<I', 0))
+        stream += record(0x001E, struct.pack('<I', 0))
+        stream += record(0x002C, struct.pack('<H', 0xFFFF))
+        stream += record(0x0021 if module_type == 'module' else 0x0022)
+        stream += record(0x002B)
+    stream += record(0x0010)
+    return bytes(stream)
+
+
+def build_vba_storage(modules, codepage=1252):
+    # modules: {name: source} where document modules are named ThisWorkbook or Sheet<n>
+    codec = f'cp{codepage}'
+    module_types = [(name, 'document' if name == 'ThisWorkbook' or name.startswith('Sheet') else 'module')
+                    for name in modules]
+    vba = {
+        '_VBA_PROJECT': b'\xcc\x61\xff\xff\x00\x00\x00',
+        'dir': compress(build_dir_stream(module_types, codepage)),
+    }
+    project = ['ID="{00000000-0000-0000-0000-000000000000}"']
+    for name, module_type in module_types:
+        vba[name] = compress(module_stream_text(name, modules[name], module_type).encode(codec))
+        if module_type == 'document':
+            project.append(f'Document={name}/&H00000000')
+        else:
+            project.append(f'Module={name}')
+    project += ['Name="VBAProject"', 'HelpContextID="0"', 'VersionCompatible32="393222000"', '',
+                '[Host Extender Info]', '&H00000001={3832D640-CF90-11CF-8E43-00A0C911005A};VBE;&H00000000', '']
+    return {
+        'PROJECT': '\r\n'.join(project).encode(codec),
+        'PROJECTwm': b''.join(name.encode(codec) + b'\x00' + name.encode('utf-16-le') + b'\x00\x00'
+                              for name, _ in module_types) + b'\x00',
+        'VBA': vba,
+    }
+
+
+def module_stream_text(name, source, module_type):
+    if module_type == 'document':
+        attributes = [f'Attribute VB_Name = "{name}"', 'Attribute VB_Base = "0{00020820-0000-0000-C000-000000000046}"',
+                      'Attribute VB_GlobalNameSpace = False', 'Attribute VB_Creatable = False',
+                      'Attribute VB_PredeclaredId = True', 'Attribute VB_Exposed = True',
+                      'Attribute VB_TemplateDerived = False', 'Attribute VB_Customizable = True']
+    else:
+        attributes = [f'Attribute VB_Name = "{name}"']
+    return '\r\n'.join(attributes + source.split('\n')) + '\r\n'
+
+
+class _Entry:
+
+    def __init__(self, name, data=None, children=None):
+        self.name = name
+        self.data = data
+        self.children = children
+        self.sid = None
+        self.left = self.right = self.child = NOSTREAM
+        self.start = ENDOFCHAIN
+        self.size = 0
+
+
+def _sort_key(entry):
+    # compound file directory order: shorter names first, then case-insensitive comparison
+    return len(entry.name), entry.name.upper()
+
+
+def _build_tree(entries):
+    # balanced binary tree of siblings, returns the sid of the subtree root
+    if not entries:
+        return NOSTREAM
+    middle = len(entries) // 2
+    root = entries[middle]
+    root.left = _build_tree(entries[:middle])
+    root.right = _build_tree(entries[middle + 1:])
+    return root.sid
+
+
+def build_ole(tree):
+    # tree: {name: bytes | dict} written as a version 4 compound file (4096 byte sectors)
+    root = _Entry('Root Entry', children=[])
+    entries = [root]
+
+    def add(parent, items):
+        for name, value in items.items():
+            if isinstance(value, dict):
+                entry = _Entry(name, children=[])
+                parent.children.append(entry)
+                entry.sid = len(entries)
+                entries.append(entry)
+                add(entry, value)
+            else:
+                entry = _Entry(name, data=bytes(value))
+                parent.children.append(entry)
+                entry.sid = len(entries)
+                entries.append(entry)
+
+    root.sid = 0
+    add(root, tree)
+    for entry in entries:
+        if entry.children is not None:
+            entry.child = _build_tree(sorted(entry.children, key=_sort_key))
+
+    fat = []
+    sectors = []
+
+    def allocate(data, sector_size=SECTOR_SIZE, table=fat, store=sectors):
+        count = (len(data) + sector_size - 1) // sector_size
+        if count == 0:
+            return ENDOFCHAIN
+        start = len(table)
+        for i in range(count):
+            table.append(start + i + 1 if i < count - 1 else ENDOFCHAIN)
+            store.append(data[i * sector_size:(i + 1) * sector_size].ljust(sector_size, b'\x00'))
+        return start
+
+    # small streams live in the mini stream, large streams in regular sectors
+    minifat = []
+    mini_sectors = []
+    for entry in entries:
+        if entry.data is None:
+            continue
+        entry.size = len(entry.data)
+        if entry.size < MINI_STREAM_CUTOFF:
+            entry.start = allocate(entry.data, MINI_SECTOR_SIZE, minifat, mini_sectors)
+        else:
+            entry.start = allocate(entry.data)
+
+    mini_stream = b''.join(mini_sectors)
+    root.start = allocate(mini_stream)
+    root.size = len(mini_stream)
+    minifat_data = b''.join(struct.pack('<I', value) for value in minifat)
+    if len(minifat) % (SECTOR_SIZE // 4):
+        minifat_data += struct.pack('<I', FREESECT) * (SECTOR_SIZE // 4 - len(minifat) % (SECTOR_SIZE // 4))
+    first_minifat = allocate(minifat_data) if minifat else ENDOFCHAIN
+    minifat_count = len(minifat_data) // SECTOR_SIZE if minifat else 0
+
+    directory = b''.join(_direntry(entry) for entry in entries)
+    entries_per_sector = SECTOR_SIZE // 128
+    if len(entries) % entries_per_sector:
+        directory += _direntry(None) * (entries_per_sector - len(entries) % entries_per_sector)
+    first_directory = allocate(directory)
+    directory_count = len(directory) // SECTOR_SIZE
+
+    # the FAT has to describe its own sectors as well
+    per_fat_sector = SECTOR_SIZE // 4
+    fat_count = 1
+    while (len(fat) + fat_count) > fat_count * per_fat_sector:
+        fat_count += 1
+    if fat_count > 109:
+        raise ValueError('workbook too large for the synthetic compound file writer')
+    fat_sectors = list(range(len(fat), len(fat) + fat_count))
+    fat += [FATSECT] * fat_count
+    fat += [FREESECT] * (fat_count * per_fat_sector - len(fat))
+    fat_data = b''.join(struct.pack('<I', value) for value in fat)
+    for i in range(fat_count):
+        sectors.append(fat_data[i * SECTOR_SIZE:(i + 1) * SECTOR_SIZE])
+
+    header = bytearray(b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1' + b'\x00' * 16)
+    header += struct.pack('<HHHHH', 0x003E, 0x0004, 0xFFFE, 0x000C, 0x0006) + b'\x00' * 6
+    header += struct.pack('<IIIIIIIII', directory_count, fat_count, first_directory, 0, MINI_STREAM_CUTOFF,
+                          first_minifat, minifat_count, ENDOFCHAIN, 0)
+    header += b''.join(struct.pack('<I', sector) for sector in fat_sectors)
+    header += struct.pack('<I', FREESECT) * (109 - fat_count)
+    return bytes(header.ljust(SECTOR_SIZE, b'\x00')) + b''.join(sectors)
+
+
+def _direntry(entry):
+    if entry is None:
+        return b'\x00' * 64 + struct.pack('<HBBIII', 0, 0, 0, NOSTREAM, NOSTREAM, NOSTREAM) + b'\x00' * 52
+    name = entry.name.encode('utf-16-le') + b'\x00\x00'
+    entry_type = 5 if entry.sid == 0 else (1 if entry.children is not None else 2)
+    return (name.ljust(64, b'\x00') + struct.pack('<HBBIII', len(name), entry_type, 1, entry.left, entry.right,
+                                                  entry.child)
+            + b'\x00' * 16 + b'\x00' * 4 + b'\x00' * 16 + struct.pack('<IQ', entry.start, entry.size))
+
+
+CONTENT_TYPES = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                 '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                 '<Default Extension="bin" ContentType="application/vnd.ms-office.vbaProject"/>'
+                 '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+                 '<Default Extension="xml" ContentType="application/xml"/>'
+                 '</Types>')
+
+ROOT_RELS = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+             '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+             '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/'
+             'officeDocument" Target="{target}"/></Relationships>')
+
+
+def build_workbook(container_format, modules, codepage=1252):
+    # returns the workbook file content for xls, xlsm or xlsb containers
+    if container_format not in FORMATS:
+        raise ValueError(f'unsupported container format: {container_format}')
+    vba_storage = build_vba_storage(modules, codepage)
+    if container_format == 'xls':
+        # BIFF8 BOF + EOF records are enough for a workbook stream VBA tools accept
+        workbook_stream = struct.pack('<HHHHII', 0x0809, 16, 0x0600, 0x0005, 0, 0) + struct.pack('<HH', 0x000A, 0)
+        return build_ole({'Workbook': workbook_stream, '_VBA_PROJECT_CUR': vba_storage})
+
+    workbook_part = 'xl/workbook.bin' if container_format == 'xlsb' else 'xl/workbook.xml'
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as z:
+        z.writestr('[Content_Types].xml', CONTENT_TYPES)
+        z.writestr('_rels/.rels', ROOT_RELS.format(target=workbook_part))
+        z.writestr(workbook_part, b'' if container_format == 'xlsb' else
+                   '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"/>')
+        z.writestr('xl/vbaProject.bin', build_ole(vba_storage))
+    return buffer.getvalue()
+
+
+def make_module_source(lines, seed=0):
+    # procedural VBA code with Subs and Functions of varying length
+    rnd = random.Random(seed)
+    source = ['Option Explicit', '']
+    procedure = 0
+    while len(source) < lines:
+        procedure += 1
+        kind = rnd.choice(['Sub', 'Function'])
+        name = f'{rnd.choice(WORDS)}{rnd.choice(WORDS)}{procedure}'
+        source.append(f'Public {kind} {name}(ByVal {rnd.choice(WORDS).lower()} As Long)' +
+                      (' As Double' if kind == 'Function' else ''))
+        for _ in range(rnd.randint(3, 30)):
+            source.append(f'    {rnd.choice(WORDS)}{rnd.randint(0, 99)} = {rnd.choice(WORDS)}{rnd.randint(0, 99)}'
+                          f' * {rnd.randint(1, 1000)}')
+        source.append(f'End {kind}')
+        source.append('')
+    return '\n'.join(source[:lines])
+
+
+def churn(source, fraction, seed=0):
+    # modify, insert and delete roughly `fraction` of the lines of a module
+    rnd = random.Random(seed)
+    lines = source.split('\n')
+    for _ in range(max(1, int(len(lines) * fraction))):
+        index = rnd.randrange(2, max(3, len(lines)))
+        operation = rnd.choice(['modify', 'insert', 'delete'])
+        if operation == 'modify' and index < len(lines):
+            lines[index] = f'    {rnd.choice(WORDS)}Changed = {rnd.randint(0, 10000)}'
+        elif operation == 'insert':
+            lines.insert(index, f'    {rnd.choice(WORDS)}Inserted = {rnd.randint(0, 10000)}')
+        elif index < len(lines):
+            del lines[index]
+    return '\n'.join(lines)
+
+
+def make_modules(module_count, module_lines, seed=0):
+    modules = {'ThisWorkbook': '', 'Sheet1': ''}
+    for i in range(module_count):
+        modules[f'Module{i + 1}'] = make_module_source(module_lines, seed=seed + i)
+    return modules
@@ -0,0 +1,167 @@
+import os
+import sys
+import subprocess
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import diff
+import cells
+import renames
+from cli import FILE_EXTENSIONS
+from cache import ExtractionCache, is_blob_oid
+
+
+class CatFile:
+    # one long-lived `git cat-file --batch` process serving all blob reads
+
+    def __init__(self, path=None):
+        self.process = subprocess.Popen(['git', 'cat-file', '--batch'], cwd=path,
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    def read(self, object_name):
+        # revision:path names may hold a path of changed_workbooks() with its undecodable bytes as surrogates
+        self.process.stdin.write(object_name.encode('utf-8', 'surrogateescape') + b'\n')
+        self.process.stdin.flush()
+        header = self.process.stdout.readline().decode('utf-8').split()
+        if len(header) != 3:
+            # "<object> missing" or "<object> ambiguous"
+            return None
+        size = int(header[2])
+        data = self.process.stdout.read(size)
+        self.process.stdout.read(1)
+        return data
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.wait()
+        self.process.stdout.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def is_workbook(path):
+    name = path.rsplit('/', 1)[-1]
+    return not name.startswith('~$') and name.rsplit('.', 1)[-1].lower() in FILE_EXTENSIONS
+
+
+def changed_workbooks(revisions, path=None):
+    # one `git diff --raw` call lists status, paths and blob oids of every changed workbook, in git's path order
+    output = subprocess.run(['git', 'diff', '--raw', '-z', '--no-abbrev'] + revisions, cwd=path,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True).stdout
+    # paths that are not valid UTF-8 keep their bytes as surrogates, so that they can still be opened and printed
+    fields = output.decode('utf-8', 'surrogateescape').split('\0')
+    i = 0
+    while i < len(fields) - 1:
+        _, _, oid_a, oid_b, status = fields[i][1:].split(' ')
+        if status[0] in 'RC':
+            path_a, path_b = fields[i + 1], fields[i + 2]
+            i += 3
+        else:
+            path_a = path_b = fields[i + 1]
+            i += 2
+        if is_workbook(path_a) or is_workbook(path_b):
+            yield {
+                'status': status[0],
+                'path_a': None if status[0] == 'A' else path_a,
+                'path_b': None if status[0] == 'D' else path_b,
+                'oid_a': oid_a,
+                'oid_b': oid_b,
+            }
+
+
+def extract(workbook_a, oid_a, workbook_b, oid_b, workbook_name='', sheets=False):
+    # runs in a worker process: workbooks are blob contents or, for the working tree, paths;
+    # both sides are compared in the same worker so that only changed modules are decompressed
+    cache = ExtractionCache.from_environment()
+    modules_a = diff.VBAModules(workbook_a, oid=oid_a, cache=cache)
+    modules_b = diff.VBAModules(workbook_b, oid=oid_b, cache=cache)
+    sheet_changes = []
+    if sheets and not modules_a.digests and not modules_b.digests:
+        # macro-free workbooks: cell diffs of their worksheets, computed here while the workbooks are at hand
+        sheet_changes = [materialize(sheet) for sheet in diff.diff_worksheets(workbook_name, workbook_a, workbook_b)]
+    return diff.changed_modules(modules_a, modules_b) + (sheet_changes,)
+
+
+def materialize(sheet):
+    # generators can not be sent back from a worker: only the (row, column, old, new) changes are listed,
+    # the parent renders them with render()
+    return (sheet['module'], sheet['a'], sheet['b'], sheet['status'], list(sheet['changes']))
+
+
+def render(sheet):
+    sheet_name, a, b, status, changes = sheet
+    return cells.sheet_diff(sheet_name, a, b, status, changes)
+
+
+def load(cat_file, path, oid, root):
+    if path is None:
+        return None
+    if is_blob_oid(oid):
+        return cat_file.read(oid)
+    # working tree side of the diff: git reports the null oid
+    return os.path.join(root, path)
+
+
+def submit(pool, cat_file, change, root, sheets):
+    # git's "a" side is the old version, diff.py calls the new version workbook_a
+    return pool.submit(extract, load(cat_file, change['path_b'], change['oid_b'], root), change['oid_b'],
+                       load(cat_file, change['path_a'], change['oid_a'], root), change['oid_a'],
+                       change['path_b'] or change['path_a'], sheets)
+
+
+def extract_changes(revisions, jobs=None, path=None, sheets=False):
+    # yields every changed workbook with its new and old changed modules and, with sheets, the cell changes of
+    # macro-free workbooks, in git's order
+    root = subprocess.run(['git', 'rev-parse', '--show-toplevel'], cwd=path, stdout=subprocess.PIPE,
+                          universal_newlines=True, encoding='utf-8', check=True).stdout.strip()
+    jobs = jobs or os.cpu_count() or 1
+
+    with CatFile(root) as cat_file, ProcessPoolExecutor(max_workers=jobs) as pool:
+        # keep a bounded window of workbooks in flight
+        pending = deque()
+        for change in changed_workbooks(revisions, path=root):
+            pending.append((change, submit(pool, cat_file, change, root, sheets)))
+            if len(pending) >= 2 * jobs:
+                change, future = pending.popleft()
+                yield change, future.result()
+        while pending:
+            change, future = pending.popleft()
+            yield change, future.result()
+
+
+def run(revisions, jobs=None, numlines=3, algorithm='myers', color=True, out=None, path=None,
+        threshold=renames.DEFAULT_THRESHOLD, copies=False, output_format='text'):
+    # threshold: minimum similarity of renamed and copied modules, None turns rename detection off;
+    # with --format=json the workbooks are streamed as the elements of one JSON array
+    out = out or sys.stdout
+    first = True
+    for change, (new_modules, old_modules, sheets) in extract_changes(revisions, jobs=jobs, path=path, sheets=True):
+        workbook_name = change['path_b'] or change['path_a']
+        sheets = [render(sheet) for sheet in sheets]
+        found = renames.find_renames(new_modules, old_modules, threshold, copies) if threshold is not None else {}
+        diffs = diff.diff_modules(workbook_name, new_modules, old_modules, numlines, algorithm, found)
+        if output_format == 'json':
+            out.write('[' if first else ',')
+        diff.print_output(workbook_name, sheets or diffs, out, output_format, color)
+        first = False
+    if output_format == 'json':
+        out.write('[]\n' if first else ']\n')
+
+
+def stat(revisions, jobs=None, numstat=False, z=False, color=True, out=None, path=None,
+         threshold=renames.DEFAULT_THRESHOLD, copies=False):
+    # counts inserted and deleted lines per module without computing hunks, renamed modules are counted against
+    # their old version like in run()
+    out = out or sys.stdout
+    for change, (new_modules, old_modules, _) in extract_changes(revisions, jobs=jobs, path=path):
+        workbook_name = change['path_b'] or change['path_a']
+        found = renames.find_renames(new_modules, old_modules, threshold, copies) if threshold is not None else {}
+        stats = diff.count_changes(new_modules, old_modules, found)
+        if numstat:
+            diff.print_numstat(workbook_name, stats, out, z)
+        else:
+            diff.print_stat(workbook_name, stats, out, color)
@@ -0,0 +1,105 @@
+import sys
+import time
+import subprocess
+
+import diff
+from batch import CatFile
+from cache import ExtractionCache
+from diff_engine import diff_opcodes
+from procedures import split_procedures
+
+
+# the commit that last changed every line of a VBA module:
+#   git xl blame Model.xlsm Pricing
+# every version of the workbook is read through a single `git cat-file --batch`; the module digests of a
+# version and the sources of the module are kept in the extraction cache, so blaming again reads no workbook
+
+
+def walk(path, revision='HEAD', cwd=None):
+    # the commits that changed the workbook, oldest first, with the blob of the workbook after the commit
+    # (None where the commit deleted it). Merges are compared to their first parent, like git blame --first-parent
+    command = ['git', 'log', '--first-parent', '--reverse', '--raw', '-z', '--no-abbrev', '--no-renames',
+               '--format=%x01%H%x00%at%x00%an%x00%s', revision, '--', path]
+    # raises CalledProcessError with git's message, for example for an unknown revision
+    process = subprocess.run(command, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    for record in process.stdout.decode('utf-8', 'replace').split('\x01')[1:]:
+        fields = record.split('\0')
+        oid, commit_time, author, subject = fields[:4]
+        raw = next((field.lstrip('\n') for field in fields[4:] if field.lstrip('\n').startswith(':')), None)
+        if raw is None:
+            continue
+        _, _, _, blob, status = raw[1:].split(' ')
+        yield {'oid': oid, 'time': int(commit_time), 'author': author, 'subject': subject,
+               'blob': None if status == 'D' else blob}
+
+
+class ModuleVersions:
+    # reads one module from many versions of a workbook: from the extraction cache if the version was extracted
+    # before, from the cat-file pipe otherwise
+
+    def __init__(self, cat_file, cache, module):
+        self.cat_file = cat_file
+        self.cache = cache
+        self.module = module
+        self.workbook = None
+
+    def open(self, blob):
+        if self.workbook is None or self.workbook[0] != blob:
+            self.workbook = (blob, diff.VBAModules(self.cat_file.read(blob), oid=blob, cache=self.cache))
+        return self.workbook[1]
+
+    def digest(self, blob):
+        digests = self.cache.get(blob.lower()) if self.cache is not None else None
+        if digests is None:
+            digests = self.open(blob).digests
+        return dict(digests).get(self.module)
+
+    def source(self, blob, digest):
+        source = self.cache.get('module-' + digest) if self.cache is not None else None
+        return source if source is not None else self.open(blob).source(self.module)
+
+
+def blame(path, module, revision='HEAD', algorithm='myers', cwd=None):
+    # returns the lines of the module at revision and, for every line, the commit that introduced it
+    lines, owners = [], []
+    previous = None
+    with CatFile(cwd) as cat_file:
+        versions = ModuleVersions(cat_file, ExtractionCache.from_environment(cwd), module)
+        for commit in walk(path, revision, cwd):
+            digest = versions.digest(commit['blob']) if commit['blob'] is not None else None
+            if digest == previous:
+                # the workbook changed, the module did not
+                continue
+            previous = digest
+            if digest is None:
+                lines, owners = [], []
+                continue
+            source_lines = versions.source(commit['blob'], digest).split('\n')
+            new_owners = [commit] * len(source_lines)
+            codes = diff_opcodes(lines, source_lines, algorithm, split_procedures(lines),
+                                 split_procedures(source_lines))
+            for tag, i1, i2, j1, j2 in codes:
+                if tag == 'equal':
+                    new_owners[j1:j2] = owners[i1:i2]
+            lines, owners = source_lines, new_owners
+    return lines, owners
+
+
+def print_blame(lines, owners, out, color=True):
+    colors = diff.get_colors(color)
+    author_width = max((len(commit['author']) for commit in owners), default=0)
+    number_width = len(str(len(lines)))
+    for number, (line, commit) in enumerate(zip(lines, owners), 1):
+        date = time.strftime('%Y-%m-%d', time.localtime(commit['time']))
+        out.write(f'{colors["commit"]}{commit["oid"][:8]}{colors["reset"]} ({commit["author"]:<{author_width}} '
+                  f'{date} {number:>{number_width}}) {line}\n')
+
+
+def run(path, module, revision='HEAD', algorithm='myers', color=True, out=None):
+    out = out or sys.stdout
+    lines, owners = blame(path, module, revision, algorithm)
+    if not owners:
+        print(f'No module "{module}" in {path} at {revision}', file=out)
+        return 1
+    print_blame(lines, owners, out, color)
+    return 0
@@ -0,0 +1,175 @@
+import os
+import time
+
+
+CACHE_VERSION = 2
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+DEFAULT_MAX_AGE = 30 * 24 * 60 * 60
+PRUNE_INTERVAL = 24 * 60 * 60
+
+
+def find_git_dir(path):
+    # honour GIT_DIR when git hands it down, otherwise walk up from path looking for .git
+    if os.environ.get('GIT_DIR'):
+        git_dir = os.path.abspath(os.environ['GIT_DIR'])
+    else:
+        git_dir = None
+        current = os.path.abspath(path)
+        while True:
+            candidate = os.path.join(current, '.git')
+            if os.path.isdir(candidate):
+                git_dir = candidate
+                break
+            if os.path.isfile(candidate):
+                # worktrees and submodules: .git is a file pointing to the real git dir
+                with open(candidate, 'r') as f:
+                    content = f.read().strip()
+                if content.startswith('gitdir:'):
+                    git_dir = os.path.join(current, content[len('gitdir:'):].strip())
+                break
+            parent = os.path.dirname(current)
+            if parent == current:
+                break
+            current = parent
+
+    if git_dir is None or not os.path.isdir(git_dir):
+        return None
+
+    # linked worktrees share the object store (and therefore the cache) with the main repository
+    commondir = os.path.join(git_dir, 'commondir')
+    if os.path.isfile(commondir):
+        with open(commondir, 'r') as f:
+            git_dir = os.path.join(git_dir, f.read().strip())
+    return os.path.normpath(git_dir)
+
+
+def is_blob_oid(oid):
+    # git passes the null oid for working tree files it did not hash
+    if not oid or len(oid) not in (40, 64):
+        return False
+    try:
+        int(oid, 16)
+    except ValueError:
+        return False
+    return oid.strip('0') != ''
+
+
+def get_int_env(name, default):
+    try:
+        return int(os.environ[name])
+    except (KeyError, ValueError):
+        return default
+
+
+class ExtractionCache:
+
+    def __init__(self, path, max_size=DEFAULT_MAX_SIZE, max_age=DEFAULT_MAX_AGE):
+        self.path = path
+        self.max_size = max_size
+        self.max_age = max_age
+
+    @classmethod
+    def from_environment(cls, cwd=None):
+        if os.environ.get('GIT_XL_CACHE', '1') in ('0', 'false', 'no', 'off'):
+            return None
+        git_dir = find_git_dir(cwd or os.getcwd())
+        if git_dir is None:
+            return None
+        return cls(path=os.path.join(git_dir, 'xl', 'cache', f'v{CACHE_VERSION}'),
+                   max_size=get_int_env('GIT_XL_CACHE_MAX_SIZE', DEFAULT_MAX_SIZE),
+                   max_age=get_int_env('GIT_XL_CACHE_MAX_AGE', DEFAULT_MAX_AGE))
+
+    def key(self, workbook, oid=None):
+        if is_blob_oid(oid):
+            return oid.lower()
+        if not isinstance(workbook, str):
+            # in-memory workbooks can only be cached by blob oid
+            return None
+        # working tree files have no blob oid: key on path and stat info instead
+        import hashlib
+        st = os.stat(workbook)
+        fingerprint = f'{os.path.abspath(workbook)}\0{st.st_size}\0{st.st_mtime_ns}\0{st.st_ino}'
+        return 'stat-' + hashlib.sha1(fingerprint.encode('utf-8')).hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.path, key[-2:], key + '.json')
+
+    def get(self, key):
+        # json is imported lazily, macro-free workbooks never touch the cache
+        import json
+        path = self.entry_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                value = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # refresh the entry's mtime so that eviction removes the least recently used entries first
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    def set(self, key, value):
+        import json
+        path = self.entry_path(key)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(value, f)
+            os.replace(tmp_path, path)
+        except OSError:
+            # the cache is an optimisation only, never fail a diff because of it
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self.maybe_prune()
+
+    def entries(self):
+        for root, _, files in os.walk(self.path):
+            for file in files:
+                if file.endswith('.json'):
+                    path = os.path.join(root, file)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    yield path, st.st_size, st.st_mtime
+
+    def prune(self):
+        now = time.time()
+        entries = []
+        for path, size, mtime in self.entries():
+            if now - mtime > self.max_age:
+                self.remove(path)
+            else:
+                entries.append((mtime, size, path))
+
+        # evict least recently used entries until the cache fits into max_size
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            self.remove(path)
+            total_size -= size
+
+    def maybe_prune(self):
+        stamp = os.path.join(self.path, 'last-prune')
+        try:
+            if time.time() - os.stat(stamp).st_mtime < PRUNE_INTERVAL:
+                return
+        except OSError:
+            pass
+        self.prune()
+        try:
+            with open(stamp, 'w'):
+                pass
+        except OSError:
+            pass
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
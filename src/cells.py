@@ -0,0 +1,348 @@
+import io
+import re
+import posixpath
+
+from vba import ZipMemberStream, zip_directory
+
+
+# cell level diff of the worksheets of OOXML workbooks (xlsx, xltx): sheets are parsed as a stream of cells,
+# memory use depends on the shared strings table but not on the size of the sheets
+WORKSHEET_RELATIONSHIP = '/worksheet'
+WORKBOOK_PATH = 'xl/workbook.xml'
+CHUNK_SIZE = 64 * 1024
+ROW = re.compile(rb'<(?:[\w.-]+:)?row\b([^>]*?)(?:/>|>.*?</(?:[\w.-]+:)?row>)', re.DOTALL)
+ROW_NUMBER = re.compile(rb'\br="(\d+)"')
+
+
+def local_name(tag):
+    # transitional and strict OOXML use different namespaces for the same elements
+    return tag.rpartition('}')[2]
+
+
+def parse(stream, events=('end',)):
+    from xml.etree.ElementTree import iterparse
+    return iterparse(stream, events=events)
+
+
+def column_number(letters):
+    number = 0
+    for letter in letters.upper():
+        number = number * 26 + ord(letter) - 64
+    return number
+
+
+def column_letters(number):
+    letters = ''
+    while number:
+        number, remainder = divmod(number - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+class Package:
+    # the parts of an OOXML package that a cell diff needs, read from the zip central directory
+
+    def __init__(self, data):
+        self.data = data
+        self.entries = {entry['name']: entry for entry in zip_directory(data)}
+        self._shared_strings = None
+
+    @staticmethod
+    def is_spreadsheet(data):
+        try:
+            return any(entry['name'] == WORKBOOK_PATH for entry in zip_directory(data))
+        except ValueError:
+            return False
+
+    def open(self, name):
+        return io.BufferedReader(ZipMemberStream(self.data, self.entries[name]))
+
+    def crc(self, name):
+        entry = self.entries.get(name)
+        return (entry['crc'], entry['size']) if entry is not None else None
+
+    def sheets(self):
+        # {sheet name: part name} in workbook order
+        relationships = {}
+        rels_path = 'xl/_rels/workbook.xml.rels'
+        if rels_path in self.entries:
+            for _, element in parse(self.open(rels_path)):
+                if local_name(element.tag) == 'Relationship' and \
+                        element.get('Type', '').endswith(WORKSHEET_RELATIONSHIP):
+                    target = element.get('Target', '')
+                    if target.startswith('/'):
+                        target = target[1:]
+                    else:
+                        target = posixpath.normpath(posixpath.join('xl', target))
+                    relationships[element.get('Id')] = target
+        sheets = {}
+        for _, element in parse(self.open(WORKBOOK_PATH)):
+            if local_name(element.tag) == 'sheet':
+                relationship_id = next((value for key, value in element.attrib.items() if local_name(key) == 'id'),
+                                       None)
+                if relationship_id in relationships and relationships[relationship_id] in self.entries:
+                    sheets[element.get('name')] = relationships[relationship_id]
+        return sheets
+
+    def shared_strings_part(self):
+        return next((name for name in self.entries if name.lower() == 'xl/sharedstrings.xml'), None)
+
+    def shared_strings(self):
+        if self._shared_strings is None:
+            self._shared_strings = []
+            part = self.shared_strings_part()
+            if part is not None:
+                for _, element in parse(self.open(part)):
+                    if local_name(element.tag) == 'si':
+                        self._shared_strings.append(string_item_text(element))
+                        element.clear()
+        return self._shared_strings
+
+    def rows(self, part):
+        # yields (row number, raw XML, XML before the first row) for every row of a worksheet; rows are found with a
+        # regular expression, only rows that differ are handed to the XML parser
+        stream = self.open(part)
+        buffer = b''
+        prefix = None
+        row_number = 0
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            buffer += chunk
+            position = 0
+            for match in ROW.finditer(buffer):
+                if prefix is None:
+                    prefix = buffer[:match.start()]
+                number = ROW_NUMBER.search(match.group(1))
+                row_number = int(number.group(1)) if number else row_number + 1
+                if not match.group().endswith(b'/>'):
+                    # rows without cells only carry formatting
+                    yield row_number, match.group(), prefix
+                position = match.end()
+            buffer = buffer[position:]
+            if not chunk:
+                break
+
+
+class RowParser:
+    # parses single rows of a worksheet, in order, with expat: its callbacks are much cheaper than
+    # building an element per cell
+
+    def __init__(self, shared_strings):
+        self.shared_strings = shared_strings
+        self.parser = None
+        self.cells = []
+        self.row = 0
+        self.column = 0
+        self.type = None
+        self.value = None
+        self.formula = None
+        self.text = None
+        self.inline = None
+        self.phonetic = False
+
+    def parse(self, row_number, xml, prefix):
+        # returns the (row, column, content) of every cell with a value or formula, in column order
+        if self.parser is None:
+            from xml.parsers import expat
+            self.parser = expat.ParserCreate(namespace_separator=' ')
+            self.parser.buffer_text = True
+            self.parser.StartElementHandler = self.start
+            self.parser.EndElementHandler = self.end
+            self.parser.CharacterDataHandler = self.data
+            # the worksheet element and its namespace declarations
+            self.parser.Parse(prefix, False)
+        self.row = row_number - 1
+        self.parser.Parse(xml, False)
+        cells, self.cells = self.cells, []
+        return cells
+
+    def start(self, name, attributes):
+        tag = name[name.rfind(' ') + 1:]
+        if tag == 'c':
+            reference = attributes.get('r')
+            self.column = column_number(reference.rstrip('0123456789')) if reference else self.column + 1
+            self.type = attributes.get('t')
+            self.value = self.formula = None
+        elif tag == 'v' or tag == 'f' or tag == 't':
+            self.text = []
+        elif tag == 'row':
+            self.row = int(attributes['r']) if 'r' in attributes else self.row + 1
+            self.column = 0
+        elif tag == 'is':
+            self.inline = []
+        elif tag == 'rPh':
+            self.phonetic = True
+
+    def data(self, text):
+        if self.text is not None:
+            self.text.append(text)
+
+    def end(self, name):
+        tag = name[name.rfind(' ') + 1:]
+        if tag == 'c':
+            content = self.content()
+            if content is not None:
+                self.cells.append((self.row, self.column, content))
+        elif tag == 'v':
+            self.value = ''.join(self.text)
+            self.text = None
+        elif tag == 'f':
+            self.formula = ''.join(self.text) or None
+            self.text = None
+        elif tag == 't':
+            if self.inline is not None and not self.phonetic:
+                self.inline.append(''.join(self.text))
+            self.text = None
+        elif tag == 'is':
+            self.value = ''.join(self.inline)
+            self.inline = None
+        elif tag == 'rPh':
+            self.phonetic = False
+
+    def content(self):
+        # the formula of formula cells, the displayed value of all others
+        if self.formula is not None:
+            return '=' + self.formula
+        value = self.value
+        if value is None:
+            return None
+        if self.type == 's':
+            try:
+                return self.shared_strings()[int(value)]
+            except (ValueError, IndexError):
+                return value
+        if self.type == 'b':
+            return 'TRUE' if value == '1' else 'FALSE'
+        return value
+
+
+def string_item_text(element):
+    # plain and rich text strings, without phonetic runs
+    texts = []
+    for child in element:
+        tag = local_name(child.tag)
+        if tag == 't':
+            texts.append(child.text or '')
+        elif tag == 'r':
+            texts.extend(run.text or '' for run in child if local_name(run.tag) == 't')
+    return ''.join(texts)
+
+
+def format_content(content):
+    return content.replace('\\', '\\\\').replace('\r', '\\r').replace('\n', '\\n')
+
+
+def diff_cells(cells_a, cells_b):
+    # merges both sorted cell streams into (row, column, old content, new content) changes, None for a missing
+    # cell; cells_a is the new version, as in diff.py
+    missing = (float('inf'), 0, None)
+    cells_a, cells_b = iter(cells_a), iter(cells_b)
+    cell_a, cell_b = next(cells_a, missing), next(cells_b, missing)
+    while cell_a is not missing or cell_b is not missing:
+        position_a, position_b = cell_a[:2], cell_b[:2]
+        if position_a == position_b:
+            if cell_a[2] != cell_b[2]:
+                yield position_a + (cell_b[2], cell_a[2])
+            cell_a, cell_b = next(cells_a, missing), next(cells_b, missing)
+        elif position_a < position_b:
+            yield position_a + (None, cell_a[2])
+            cell_a = next(cells_a, missing)
+        else:
+            yield position_b + (cell_b[2], None)
+            cell_b = next(cells_b, missing)
+
+
+def cell_lines(sheet_name, changes):
+    # one hunk per changed cell, in the form of a unified diff
+    for row, column, old, new in changes:
+        yield f'@@ {sheet_name}!{column_letters(column)}{row} @@'
+        if old is not None:
+            yield '-' + format_content(old)
+        if new is not None:
+            yield '+' + format_content(new)
+
+
+def cell_records(changes):
+    for row, column, old, new in changes:
+        yield {'cell': f'{column_letters(column)}{row}', 'old': old, 'new': new}
+
+
+def diff_rows(package_a, part_a, package_b, part_b, strings_unchanged):
+    # merges the rows of both versions of a worksheet by row number; rows with the same XML are skipped
+    # unless the shared strings they refer to changed
+    missing = (float('inf'), None, None)
+    parser_a, parser_b = RowParser(package_a.shared_strings), RowParser(package_b.shared_strings)
+    rows_a, rows_b = package_a.rows(part_a), package_b.rows(part_b)
+    row_a, row_b = next(rows_a, missing), next(rows_b, missing)
+    while row_a is not missing or row_b is not missing:
+        if row_a[0] == row_b[0]:
+            if row_a[1] != row_b[1] or not strings_unchanged:
+                yield from diff_cells(parser_a.parse(*row_a), parser_b.parse(*row_b))
+            row_a, row_b = next(rows_a, missing), next(rows_b, missing)
+        elif row_a[0] < row_b[0]:
+            yield from diff_cells(parser_a.parse(*row_a), [])
+            row_a = next(rows_a, missing)
+        else:
+            yield from diff_cells([], parser_b.parse(*row_b))
+            row_b = next(rows_b, missing)
+
+
+def sheet_cells(package, part):
+    parser = RowParser(package.shared_strings)
+    for row in package.rows(part):
+        yield from parser.parse(*row)
+
+
+def sheet_diff(sheet_name, a, b, status, changes):
+    # the changes are rendered either as text lines or as records, whichever is consumed
+    return {'module': sheet_name, 'a': a, 'b': b, 'status': status, 'changes': changes,
+            'lines': cell_lines(sheet_name, changes), 'cells': cell_records(changes)}
+
+
+def diff_sheets(workbook_name, workbook_a, workbook_b):
+    # yields one diff per changed worksheet, in the same form as diff.diff_modules; a sheet whose zip entry has
+    # the same CRC-32 and size on both sides is skipped without being decompressed, as long as the shared strings
+    # it refers to did not change
+    package_a = Package(workbook_a) if workbook_a is not None else None
+    package_b = Package(workbook_b) if workbook_b is not None else None
+    sheets_a = package_a.sheets() if package_a is not None else {}
+    sheets_b = package_b.sheets() if package_b is not None else {}
+    strings_unchanged = None
+
+    for sheet_name, part_a in sheets_a.items():
+        path = workbook_name + '/' + sheet_name
+        if sheet_name not in sheets_b:
+            yield sheet_diff(sheet_name, '--- /dev/null', '+++ b/' + path, 'added',
+                             diff_cells(sheet_cells(package_a, part_a), []))
+            continue
+        part_b = sheets_b[sheet_name]
+        if strings_unchanged is None:
+            strings_unchanged = shared_strings_unchanged(package_a, package_b)
+        if strings_unchanged and package_a.crc(part_a) == package_b.crc(part_b):
+            continue
+        changes = diff_rows(package_a, part_a, package_b, part_b, strings_unchanged)
+        first = next(changes, None)
+        if first is not None:
+            yield sheet_diff(sheet_name, '--- a/' + path, '+++ b/' + path, 'modified', prepend(first, changes))
+
+    for sheet_name, part_b in sheets_b.items():
+        if sheet_name not in sheets_a:
+            yield sheet_diff(sheet_name, '--- a/' + workbook_name + '/' + sheet_name, '+++ /dev/null', 'removed',
+                             diff_cells([], sheet_cells(package_b, part_b)))
+
+
+def shared_strings_unchanged(package_a, package_b):
+    # unchanged sheets still show other values if the strings their indices point to changed;
+    # strings that were only appended to the table do not matter
+    part_a, part_b = package_a.shared_strings_part(), package_b.shared_strings_part()
+    if part_a is None or part_b is None:
+        return part_a == part_b
+    if package_a.crc(part_a) == package_b.crc(part_b):
+        return True
+    strings_a, strings_b = package_a.shared_strings(), package_b.shared_strings()
+    return strings_a[:len(strings_b)] == strings_b
+
+
+def prepend(first, lines):
+    yield first
+    yield from lines
@@ -3,7 +3,13 @@ import sys
 import os
 import fnmatch
 import subprocess
-import colorama
+import multiprocessing
+
+import tracing
+import diff_engine
+import renames
+from cache import find_git_dir
+from gitconfig import GitConfig
 
 
 VERSION = '0.0.0'
@@ -12,6 +18,8 @@ PYTHON_VERSION = f'{sys.version_info.major}.{sys.version_info.minor}.{sys.versio
 FILE_EXTENSIONS = ['xls', 'xlt', 'xla', 'xlam', 'xlsx', 'xlsm', 'xlsb', 'xltx', 'xltm']
 GIT_ATTRIBUTES_DIFFER = ['*.' + file_ext + ' diff=xl' for file_ext in FILE_EXTENSIONS]
 GIT_IGNORE = ['~$*.' + file_ext for file_ext in FILE_EXTENSIONS]
+# first line after the shebang of the pre-commit hook, tells it apart from hooks git xl did not write
+GIT_XL_HOOK = '# pre-commit hook of git xl: exports the VBA modules of staged workbooks'
 
 
 def is_frozen():
@@ -26,17 +34,29 @@ def is_git_repository(path):
     return False
 
 
+def format_git_error(error):
+    # git's own message of a failed subprocess.run(..., check=True)
+    stderr = error.stderr.decode('utf-8', 'replace') if isinstance(error.stderr, bytes) else error.stderr or ''
+    return stderr.strip() or str(error)
+
+
 class Installer:
 
-    def __init__(self, mode='global', path=None):
+    def __init__(self, mode='global', path=None, textconv=False, hook=False):
 
         # determine if running as exe or in dev mode
         if is_frozen():
             self.GIT_XL_DIFF = 'git-xl-diff.exe'
+            self.GIT_XL_TEXTCONV = 'git-xl.exe textconv'
+            self.GIT_XL_EXPORT = 'git-xl.exe export --staged'
         else:
             executable_path = sys.executable.replace('\\', '/')
-            differ_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'diff.py').replace('\\', '/')
+            # the client forwards to a running `git xl daemon` and falls back to diffing in-process
+            differ_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'diff_client.py').replace('\\', '/')
             self.GIT_XL_DIFF = f'{executable_path} {differ_path}'
+            cli_path = os.path.abspath(__file__).replace('\\', '/')
+            self.GIT_XL_TEXTCONV = f'{executable_path} {cli_path} textconv'
+            self.GIT_XL_EXPORT = f'{executable_path} {cli_path} export --staged'
 
         if mode == 'global' and path:
             raise ValueError('must not specify repository path when installing globally')
@@ -44,11 +64,19 @@ class Installer:
         if mode == 'local' and not path:
             raise ValueError('must specify repository path when installing locally')
 
-        if mode == 'local' and not is_git_repository(path):
+        if hook and mode != 'local':
+            raise ValueError('the pre-commit hook can only be installed in a repository (--local)')
+
+        # every lookup below is answered from a single `git config` call
+        self.config = GitConfig.read(path)
+
+        if mode == 'local' and not self.config.is_repository:
             raise ValueError('not a Git repository')
 
         self.mode = mode
         self.path = path
+        self.textconv = textconv
+        self.hook = hook
 
         # global config dir (only set when running in `global` mode)
         self.git_global_config_dir = self.get_global_gitconfig_dir() if self.mode == 'global' else None
@@ -59,7 +87,11 @@ class Installer:
 
     def install(self):
         # 1. gitconfig: set-up diff.xl.command
-        self.execute(['diff.xl.command', self.GIT_XL_DIFF])
+        self.config.set('diff.xl.command', self.GIT_XL_DIFF, self.mode)
+        if self.textconv:
+            # used by git log -p, blame, grep --textconv and --stat, git caches the output in refs/notes/textconv/xl
+            self.config.set('diff.xl.textconv', self.GIT_XL_TEXTCONV, self.mode)
+            self.config.set('diff.xl.cachetextconv', 'true', self.mode)
 
         # 2. set-up gitattributes (define custom differ)
         self.update_git_file(path=self.git_attributes_path, keys=GIT_ATTRIBUTES_DIFFER, operation='SET')
@@ -70,15 +102,21 @@ class Installer:
         # 4. update gitconfig (only relevent when running in `global` mode)
         if self.mode == 'global':
             # set core.attributesfile
-            self.execute(['core.attributesfile', self.git_attributes_path])
+            self.config.set('core.attributesfile', self.git_attributes_path, self.mode)
             # set core.excludesfile
-            self.execute(['core.excludesfile', self.git_ignore_path])
+            self.config.set('core.excludesfile', self.git_ignore_path, self.mode)
+
+        # all config changes in one write, none at all if git xl is already installed
+        self.config.write()
+
+        # 5. pre-commit hook that exports the VBA modules of staged workbooks next to them
+        if self.hook:
+            self.install_hook()
 
     def uninstall(self):
         # 1. gitconfig: remove diff.xl.command from gitconfig
-        keys = self.execute(['--list']).split('\n')
-        if [key for key in keys if key.startswith('diff.xl.command')]:
-            self.execute(['--remove-section', 'diff.xl'])
+        if self.config.get('diff.xl.command', self.mode) is not None:
+            self.config.remove_section('diff.xl', self.mode)
 
         # 2. gitattributes: remove keys
         gitattributes_keys = self.update_git_file(path=self.git_attributes_path, keys=GIT_ATTRIBUTES_DIFFER,
@@ -86,7 +124,7 @@ class Installer:
         # when in global mode and gitattributes is empty, update gitconfig and delete gitattributes
         if not gitattributes_keys:
             if self.mode == 'global':
-                self.execute(['--unset', 'core.attributesfile'])
+                self.config.unset('core.attributesfile', self.mode)
             self.delete_git_file(self.git_attributes_path)
 
         # 3. gitignore: remove keys
@@ -94,35 +132,28 @@ class Installer:
         # when in global mode and gitignore is empty, update gitconfig and delete gitignore
         if not gitignore_keys:
             if self.mode == 'global':
-                self.execute(['--unset', 'core.excludesfile'])
+                self.config.unset('core.excludesfile', self.mode)
             self.delete_git_file(self.git_ignore_path)
-    
-    def execute(self, args):
-        command = ['git', 'config']
-        if self.mode == 'global':
-            command.append('--global')
-        command += args
-        return subprocess.run(command, cwd=self.path, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                              universal_newlines=True,encoding='utf-8').stdout
 
-    def get_global_gitconfig_dir(self):
-        # put .gitattributes in same folder as global .gitconfig
-        # determine .gitconfig path
-        # this requires Git 2.8+ (March 2016)
-        f = self.execute(['--list', '--show-origin'])
-        p = self.execute(['--list'])
+        # 4. pre-commit hook, only if git xl wrote it
+        hook_path = self.get_hook_path()
+        if hook_path is not None and os.path.exists(hook_path):
+            with open(hook_path, 'r') as f:
+                if GIT_XL_HOOK in f.read():
+                    os.remove(hook_path)
 
-        f = f.split('\n')[0]
-        p = p.split('\n')[0]
+        self.config.write()
 
-        return f[:f.index(p)][5:][:-11]
+    def get_global_gitconfig_dir(self):
+        # put .gitattributes in same folder as global .gitconfig
+        return os.path.dirname(self.config.file_path('global'))
 
     def get_git_attributes_path(self):
         if self.mode == 'local':
             return os.path.join(self.path, '.gitattributes')
 
         # check if core.attributesfile is configured
-        core_attributesfile = self.execute(['--get', 'core.attributesfile']).split('\n')[0]
+        core_attributesfile = self.config.get('core.attributesfile', 'global')
         if core_attributesfile:
             return os.path.expanduser(core_attributesfile)
 
@@ -134,29 +165,94 @@ class Installer:
             return os.path.join(self.path, '.gitignore')
 
         # check if core.excludesfile is configured
-        core_excludesfile = self.execute(['--get', 'core.excludesfile']).split('\n')[0]
+        core_excludesfile = self.config.get('core.excludesfile', 'global')
         if core_excludesfile:
             return os.path.expanduser(core_excludesfile)
 
         # put .gitattributes into same directory as global .gitconfig
         return os.path.join(self.git_global_config_dir, '.gitignore')
 
-    def update_git_file(self, path, keys, operation):
-        assert operation in ('SET', 'REMOVE')
+    def get_hook_path(self):
+        # core.hooksPath or the hooks directory of the repository, None when installing globally
+        if self.mode != 'local':
+            return None
+        hooks_path = self.config.get('core.hooksPath')
+        if hooks_path:
+            return os.path.join(self.path, os.path.expanduser(hooks_path), 'pre-commit')
+        git_dir = find_git_dir(self.path)
+        return os.path.join(git_dir, 'hooks', 'pre-commit') if git_dir is not None else None
+
+    def get_hook_content(self):
+        return f'#!/bin/sh\n{GIT_XL_HOOK}\nexec {self.GIT_XL_EXPORT}\n'
+
+    def install_hook(self):
+        path = self.get_hook_path()
+        if path is None:
+            raise ValueError('not a Git repository')
+        content = self.get_hook_content()
         if os.path.exists(path):
             with open(path, 'r') as f:
-                content = [line for line in f.read().split('\n') if line]
-        else:
-            content = []
+                existing = f.read()
+            if existing == content:
+                return
+            if GIT_XL_HOOK not in existing:
+                raise ValueError(f'{path} already exists, add "{self.GIT_XL_EXPORT}" to it instead')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', newline='\n') as f:
+            f.write(content)
+        os.chmod(path, 0o755)
+
+    def verify(self):
+        # what install() would change, as a list of problems: empty when git xl is installed
+        problems = []
+        expected = [('diff.xl.command', self.GIT_XL_DIFF)]
+        if self.textconv:
+            expected += [('diff.xl.textconv', self.GIT_XL_TEXTCONV), ('diff.xl.cachetextconv', 'true')]
+        if self.mode == 'global':
+            expected += [('core.attributesfile', self.git_attributes_path),
+                         ('core.excludesfile', self.git_ignore_path)]
+        for key, value in expected:
+            current = self.config.get(key, self.mode)
+            if current is None:
+                problems.append(f'{key} is not set')
+            elif current != value:
+                problems.append(f'{key} is "{current}" instead of "{value}"')
+
+        for path, keys in ((self.git_attributes_path, GIT_ATTRIBUTES_DIFFER), (self.git_ignore_path, GIT_IGNORE)):
+            content = self.read_git_file(path)
+            missing = [key for key in keys if key not in content]
+            if missing:
+                problems.append(f'{os.path.basename(path)} is missing {len(missing)} of {len(keys)} entries')
+
+        if self.hook:
+            path = self.get_hook_path()
+            content = None
+            if path is not None and os.path.exists(path):
+                with open(path, 'r') as f:
+                    content = f.read()
+            if content != self.get_hook_content():
+                problems.append('pre-commit hook is not installed')
+        return problems
+
+    def read_git_file(self, path):
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                return [line for line in f.read().split('\n') if line]
+        return []
+
+    def update_git_file(self, path, keys, operation):
+        assert operation in ('SET', 'REMOVE')
+        existing = self.read_git_file(path)
 
         if operation == 'SET':
             # create union set: keys + existing content
-            content = sorted(list(set(content).union(set(keys))))
+            content = sorted(list(set(existing).union(set(keys))))
         else:
             # remove keys from content
-            content = [line for line in content if line and line not in keys]
+            content = [line for line in existing if line and line not in keys]
 
-        if content:
+        # files that already have the content are not rewritten
+        if content and content != existing:
             with open(path, 'w') as f:
                 f.writelines('\n'.join(content))
 
@@ -184,7 +280,27 @@ Commands
 * git xl install:
     Install Git xl.
 * git xl uninstall:
-    Uninstall Git xl."""
+    Uninstall Git xl.
+* git xl verify:
+    Check that Git xl is installed.
+* git xl daemon:
+    Run a diff worker that keeps Git xl loaded between diffs.
+* git xl diff:
+    Show VBA changes of all workbooks between two revisions.
+* git xl stat:
+    Show inserted and deleted lines per VBA module between two revisions.
+* git xl index:
+    Record the history of all VBA modules in a database under .git/xl.
+* git xl log:
+    Show the commits that changed a VBA module.
+* git xl blame:
+    Show the commit that last changed every line of a VBA module.
+* git xl scan:
+    List VBA modules that are identical or similar across workbooks.
+* git xl export:
+    Write the VBA modules of every workbook to <workbook>.vba/<module>.bas.
+* git xl textconv:
+    Print the VBA modules of a workbook as text."""
 
 HELP_ENV = 'git xl env\n\nDisplay the current Git XL environment.'
 
@@ -197,7 +313,35 @@ Without any options, git xl install will setup the Excel differ and
 .gitignore globally.\n
 * --local:
     Sets the .gitignore filters and the git-diff Excel drop-in replacement
-    in the local repository, instead of the global git config (~/.gitconfig)."""
+    in the local repository, instead of the global git config (~/.gitconfig).
+* --textconv:
+    Also configure `git xl textconv` as textconv filter (diff.xl.textconv) with
+    git's textconv cache enabled, for git log -p, blame, grep --textconv and --stat.
+* --hook:
+    With --local, also install a pre-commit hook that runs `git xl export --staged`.
+* --repos <file|glob>:
+    With --local, install into every repository listed in <file>, one per line,
+    or matching <glob>, and print one line per repository. Repositories that
+    are already set up are left alone.
+* -j <n>, --jobs=<n>:
+    With --repos, number of repositories set up at the same time."""
+
+HELP_VERIFY = """git xl verify [options]\n
+Check that Git xl is installed: the diff driver in the git config and the
+Excel entries of .gitattributes and .gitignore. Prints what git xl install
+would change and exits with status 1 if anything is missing.\n
+Options:\n
+* --local:
+    Check the local repository instead of the global git config.
+* --textconv:
+    Also check the textconv filter of `git xl install --textconv`.
+* --hook:
+    With --local, also check the pre-commit hook of `git xl install --hook`.
+* --repos <file|glob>:
+    Check every repository listed in <file>, one per line, or matching <glob>,
+    and print one line per repository.
+* -j <n>, --jobs=<n>:
+    With --repos, number of repositories checked at the same time."""
 
 HELP_UNINSTALL = """git xl uninstall [options]\n
 Uninstalls Git XL:\n
@@ -208,6 +352,129 @@ replacement for Excel files and .gitignore globally.\n
     Removes the .gitignore filters and the git-diff Excel drop-in replacement
     in the local repository, instead globally."""
 
+HELP_DAEMON = """git xl daemon [options]\n
+Run a diff worker on a Unix domain socket. While the daemon is running,
+git-diff hands Excel files to the already loaded worker instead of starting
+a new Python process per workbook. Without a daemon, diffs run in-process.\n
+Options:\n
+* --idle-timeout=<seconds>:
+    Shut the daemon down after <seconds> without requests (default: 900).
+* --stop:
+    Stop the running daemon."""
+
+HELP_TEXTCONV = """git xl textconv <workbook>\n
+Print the VBA modules of <workbook> as text, sorted by module name. Each module
+starts with its Attribute VB_Name line. Used by git as textconv filter of the
+xl diff driver, see `git xl install --textconv`."""
+
+HELP_DIFF = """git xl diff [options] <commit> [<commit>]
+git xl diff [options] <commit>..<commit>\n
+Show the VBA changes of all workbooks that differ between two commits, or
+between a commit and the working tree. Workbooks are extracted in parallel
+and printed in the same order and format as git-diff.\n
+Options:\n
+* -j <n>, --jobs=<n>:
+    Number of worker processes (default: number of CPUs).
+* -U<n>, --unified=<n>:
+    Generate diffs with <n> lines of context (default: 3).
+* --diff-algorithm=<algorithm>:
+    One of myers, minimal, patience or histogram (default: git's diff.algorithm).
+* -M[<n>], --find-renames[=<n>]:
+    Detect renamed modules that are at least <n> similar (default: 50%).
+* -C[<n>], --find-copies[=<n>]:
+    Detect copied modules as well as renamed ones.
+* --no-renames:
+    Turn off rename detection (default: git's diff.renames).
+* --format=<format>:
+    text, json for one JSON array of workbooks, or ndjson for one JSON object
+    per module and line (default: text). The diff driver takes the same option
+    in diff.xl.command, where json prints one object per workbook."""
+
+HELP_STAT = """git xl stat [options] <commit> [<commit>]\n
+Show the number of inserted and deleted lines of every VBA module that
+differs between two commits, or between a commit and the working tree, like
+git diff --stat. Lines are counted without computing the diff itself: a
+line that only moved within a module is not counted.\n
+Options:\n
+* -j <n>, --jobs=<n>:
+    Number of worker processes (default: number of CPUs).
+* -M[<n>], --find-renames[=<n>]:
+    Count renamed modules that are at least <n> similar against their old
+    version (default: 50%).
+* -C[<n>], --find-copies[=<n>]:
+    Detect copied modules as well as renamed ones.
+* --no-renames:
+    Turn off rename detection (default: git's diff.renames).
+* --numstat:
+    Show tab separated insertions, deletions and module path, like git diff --numstat.
+* -z:
+    With --numstat, terminate records with NUL instead of newline."""
+
+HELP_INDEX = """git xl index [options]\n
+Record which commits changed which VBA module of every workbook in a SQLite
+database under .git/xl, for git xl log. Commits of all branches, tags and
+remote branches are indexed; running it again, for example after a fetch,
+only indexes the new commits.\n
+Options:\n
+* -j <n>, --jobs=<n>:
+    Number of worker processes (default: number of CPUs)."""
+
+HELP_LOG = """git xl log [options] <workbook>/<module>\n
+List the commits that changed a VBA module, newest first, from the index
+built by git xl index.\n
+Options:\n
+* -p, --patch:
+    Show the changes of the module in each commit.
+* -U<n>, --unified=<n>:
+    Generate diffs with <n> lines of context (default: 3)."""
+
+
+HELP_BLAME = """git xl blame [options] [<commit>] <workbook> <module>\n
+Show every line of a VBA module with the commit that introduced it, its author
+and date. Lines are followed through the first parent of merges, like
+git blame --first-parent. Every version of the workbook is read through a
+single git cat-file process and kept in the extraction cache under .git/xl,
+so blaming a module again does not read any workbook.\n
+Options:\n
+* --diff-algorithm=<algorithm>:
+    Compare versions with myers, minimal, patience or histogram
+    (default: diff.algorithm or myers)."""
+
+
+HELP_SCAN = """git xl scan [options]\n
+List the VBA modules that occur in more than one place in the workbooks of
+the working tree: identical copies are grouped by content hash, together with
+versions of them that drifted apart. The modules of every workbook are kept
+in .git/xl/scan.json, so a rescan only reads the workbooks that changed.\n
+Options:\n
+* -j <n>, --jobs=<n>:
+    Number of worker processes (default: number of CPUs).
+* --similarity=<n>:
+    Minimum similarity of versions of the same module (default: 80%).
+* --format=<format>:
+    text or json (default: text)."""
+
+
+HELP_EXPORT = """git xl export [options] [<workbook>...]\n
+Write the VBA modules of the workbooks of the working tree as text files next
+to them, <workbook>.vba/<module>.bas, and delete the files of removed modules.
+.git/xl/export.json keeps the stat info of every workbook and a hash of every
+module, so only workbooks and modules that changed are read and written again.
+Prints every written (A, M) and deleted (D) file.\n
+Options:\n
+* -j <n>, --jobs=<n>:
+    Number of worker processes (default: number of CPUs).
+* --staged:
+    Only export the workbooks that are staged, as they are in the index, and
+    stage their modules, as the pre-commit hook of `git xl install --local --hook` does.
+* --watch:
+    Keep running and export every workbook shortly after it was saved."""
+
+
+class InvalidOption(ValueError):
+    # raised while a command parses its arguments, CommandParser.execute prints the usage error
+    pass
+
 
 class CommandParser:
 
@@ -229,19 +496,44 @@ class CommandParser:
                 f"""Error: unknown command "{command}" for "git-xl"\nRun 'git-xl --help' for usage.""")
 
         # execute command
-        getattr(self, command)(*args)
+        with tracing.region('command', command=command):
+            try:
+                return getattr(self, command)(*args)
+            except InvalidOption as e:
+                return print(
+                    f"""Invalid option "{e}" for "git-xl {self.args[0]}"\nRun 'git-xl --help' for usage.""")
+
+    def parse_jobs(self, arg, args, options):
+        # takes -j <n>, -j<n>, --jobs <n> and --jobs=<n> into options, returns False for any other argument
+        if arg in ('-j', '--jobs') and args:
+            value = args.pop(0)
+        elif arg.startswith('--jobs='):
+            value = arg[len('--jobs='):]
+        elif arg.startswith('-j'):
+            value = arg[2:]
+        else:
+            return False
+        options['jobs'] = self.parse_number(arg, value, minimum=1)
+        return True
+
+    def parse_number(self, arg, value, minimum=0):
+        # the value of a numeric option, raises InvalidOption with the option if it is not a whole number >= minimum
+        if not value.isdecimal() or int(value) < minimum:
+            raise InvalidOption(arg)
+        return int(value)
 
     def version(self, *args):
         print(GIT_XL_VERSION)
 
     def env(self):
         current_path = os.getcwd()
+        is_repository = is_git_repository(current_path)
         p = GIT_XL_VERSION + '\n\n'
-        p += 'LocalWorkingDir=' + (current_path if is_git_repository(current_path) else '') + '\n'
+        p += 'LocalWorkingDir=' + (current_path if is_repository else '') + '\n'
         p += 'LocalGitIgnore=' + (
-            os.path.join(current_path, '.gitignore') if is_git_repository(current_path) else '') + '\n'
+            os.path.join(current_path, '.gitignore') if is_repository else '') + '\n'
         p += 'LocalGitAttributes=' + (
-            os.path.join(current_path, '.gitattributes') if is_git_repository(current_path) else '') + '\n'
+            os.path.join(current_path, '.gitattributes') if is_repository else '') + '\n'
         print(p)
 
     def help(self, *args):
@@ -257,14 +549,80 @@ class CommandParser:
                 print(getattr(module, help_text))
 
     def install(self, *args):
-        if not args or args[0] == '--global':
-            installer = Installer(mode='global')
-        elif args[0] == '--local':
-            installer = Installer(mode='local', path=os.getcwd())
+        textconv = '--textconv' in args
+        hook = '--hook' in args
+        args = [arg for arg in args if arg not in ('--textconv', '--hook')]
+        fleet_options = {}
+        try:
+            args = self.parse_fleet_options(args, fleet_options)
+        except ValueError as e:
+            return print(f"""Invalid option "{e}" for "git-xl install"\nRun 'git-xl --help' for usage.""")
+        if 'spec' in fleet_options:
+            if args != ['--local']:
+                return print(
+                    f"""Invalid option "{args[0] if args else '--repos'}" for "git-xl install"\nRun 'git-xl --help' for usage.""")
+            import fleet
+            return fleet.run(textconv=textconv, hook=hook, **fleet_options)
+        if (not args or args[0] == '--global') and not hook:
+            installer = Installer(mode='global', textconv=textconv)
+        elif args and args[0] == '--local':
+            installer = Installer(mode='local', path=os.getcwd(), textconv=textconv, hook=hook)
+        else:
+            return print(
+                f"""Invalid option "{args[0] if args else '--hook'}" for "git-xl install"\nRun 'git-xl --help' for usage.""")
+        try:
+            installer.install()
+        except ValueError as e:
+            print(f'Error: {e}')
+
+    def verify(self, *args):
+        textconv = '--textconv' in args
+        hook = '--hook' in args
+        args = [arg for arg in args if arg not in ('--textconv', '--hook')]
+        fleet_options = {}
+        try:
+            args = self.parse_fleet_options(args, fleet_options)
+        except ValueError as e:
+            return print(f"""Invalid option "{e}" for "git-xl verify"\nRun 'git-xl --help' for usage.""")
+        if 'spec' in fleet_options:
+            if args and args != ['--local']:
+                return print(f"""Invalid option "{args[0]}" for "git-xl verify"\nRun 'git-xl --help' for usage.""")
+            import fleet
+            return fleet.run(verifying=True, textconv=textconv, hook=hook, **fleet_options)
+        if (not args or args[0] == '--global') and not hook:
+            installer = Installer(mode='global', textconv=textconv)
+        elif args and args[0] == '--local':
+            try:
+                installer = Installer(mode='local', path=os.getcwd(), textconv=textconv, hook=hook)
+            except ValueError as e:
+                print(f'Error: {e}')
+                return 1
         else:
             return print(
-                f"""Invalid option "{args[0]}" for "git-xl install"\nRun 'git-xl --help' for usage.""")
-        installer.install()
+                f"""Invalid option "{args[0] if args else '--hook'}" for "git-xl verify"\nRun 'git-xl --help' for usage.""")
+        problems = installer.verify()
+        for problem in problems:
+            print(problem)
+        return 1 if problems else None
+
+    def parse_fleet_options(self, args, options):
+        # takes --repos and -j out of args, raises ValueError with the offending option
+        args = list(args)
+        remaining = []
+        jobs_arg = None
+        while args:
+            arg = args.pop(0)
+            if arg.startswith(('-j', '--jobs')):
+                jobs_arg = arg
+            if arg == '--repos' and args:
+                options['spec'] = args.pop(0)
+            elif arg.startswith('--repos='):
+                options['spec'] = arg[len('--repos='):]
+            elif not self.parse_jobs(arg, args, options):
+                remaining.append(arg)
+        if 'jobs' in options and 'spec' not in options:
+            raise ValueError(jobs_arg)
+        return remaining
 
     def uninstall(self, *args):
         if args:
@@ -277,7 +635,285 @@ class CommandParser:
             installer = Installer(mode='global')
         installer.uninstall()
 
+    def daemon(self, *args):
+        options = {}
+        for arg in args:
+            if arg == '--stop':
+                import diff_client
+                if not diff_client.stop():
+                    print('git xl daemon is not running')
+                return
+            elif arg.startswith('--idle-timeout='):
+                options['idle_timeout'] = self.parse_number(arg, arg[len('--idle-timeout='):], minimum=1)
+            else:
+                return print(
+                    f"""Invalid option "{arg}" for "git-xl daemon"\nRun 'git-xl --help' for usage.""")
+
+        # imported here: loading the daemon module warms up oletools
+        import daemon
+        try:
+            daemon.serve(**options)
+        except OSError as e:
+            print(f'Error: {e}')
+
+    def textconv(self, *args):
+        if len(args) != 1:
+            return print(f"""Error: "git-xl textconv" requires one workbook\nRun 'git-xl --help' for usage.""")
+        import diff
+        # git reads the conversion as bytes: always UTF-8 with \n line endings, whatever the platform
+        sys.stdout.reconfigure(encoding='utf-8', newline='\n')
+        diff.textconv(args[0], sys.stdout)
+
+    def diff(self, *args):
+        options = {}
+        revisions = []
+        args = list(args)
+        while args:
+            arg = args.pop(0)
+            if self.parse_jobs(arg, args, options):
+                continue
+            if arg.startswith('--unified='):
+                options['numlines'] = self.parse_number(arg, arg[len('--unified='):])
+            elif arg.startswith('-U'):
+                options['numlines'] = self.parse_number(arg, arg[2:])
+            elif arg.startswith('--diff-algorithm='):
+                options['algorithm'] = arg[len('--diff-algorithm='):]
+                if options['algorithm'] not in diff_engine.ALGORITHMS:
+                    return print(
+                        f"""Invalid diff algorithm "{options['algorithm']}" for "git-xl diff"\nRun 'git-xl --help' for usage.""")
+            elif arg.startswith(('-M', '-C', '--find-renames', '--find-copies', '--no-renames')):
+                try:
+                    option = renames.parse_option(arg, options.get('threshold'), options.get('copies', False))
+                except ValueError:
+                    option = None
+                if option is None:
+                    return print(
+                        f"""Invalid option "{arg}" for "git-xl diff"\nRun 'git-xl --help' for usage.""")
+                options['threshold'], options['copies'] = option
+            elif arg in ('--format=text', '--format=json', '--format=ndjson'):
+                options['output_format'] = arg[len('--format='):]
+            elif arg.startswith('-'):
+                return print(
+                    f"""Invalid option "{arg}" for "git-xl diff"\nRun 'git-xl --help' for usage.""")
+            else:
+                revisions.append(arg)
+
+        if not revisions or len(revisions) > 2:
+            return print(f"""Error: "git-xl diff" requires one or two commits\nRun 'git-xl --help' for usage.""")
+
+        import batch
+        import diff
+        config = diff.get_git_config()
+        if 'algorithm' not in options:
+            options['algorithm'] = diff.get_diff_algorithm(config)
+        if 'threshold' not in options:
+            options['threshold'], options['copies'] = diff.get_renames(config)
+        options['color'] = options.get('output_format', 'text') == 'text' and \
+            diff.use_color(sys.stdout.isatty(), config)
+        # diffs are flushed once per workbook module instead of once per line, paths that are not valid UTF-8 are
+        # printed with their original bytes
+        sys.stdout.reconfigure(line_buffering=False, errors='surrogateescape')
+        if options['color']:
+            import colorama
+            colorama.init(strip=False)
+        try:
+            batch.run(revisions, **options)
+        except subprocess.CalledProcessError as e:
+            print(f'Error: {format_git_error(e)}')
+            return 1
+
+    def stat(self, *args):
+        options = {}
+        revisions = []
+        args = list(args)
+        while args:
+            arg = args.pop(0)
+            if self.parse_jobs(arg, args, options):
+                continue
+            if arg == '--numstat':
+                options['numstat'] = True
+            elif arg == '-z':
+                options['z'] = True
+            elif arg == '--stat':
+                pass
+            elif arg.startswith(('-M', '-C', '--find-renames', '--find-copies', '--no-renames')):
+                try:
+                    option = renames.parse_option(arg, options.get('threshold'), options.get('copies', False))
+                except ValueError:
+                    option = None
+                if option is None:
+                    return print(
+                        f"""Invalid option "{arg}" for "git-xl stat"\nRun 'git-xl --help' for usage.""")
+                options['threshold'], options['copies'] = option
+            elif arg.startswith('-'):
+                return print(
+                    f"""Invalid option "{arg}" for "git-xl stat"\nRun 'git-xl --help' for usage.""")
+            else:
+                revisions.append(arg)
+
+        if not revisions or len(revisions) > 2:
+            return print(f"""Error: "git-xl stat" requires one or two commits\nRun 'git-xl --help' for usage.""")
+
+        import batch
+        import diff
+        config = diff.get_git_config()
+        if 'threshold' not in options:
+            options['threshold'], options['copies'] = diff.get_renames(config)
+        options['color'] = not options.get('numstat') and diff.use_color(sys.stdout.isatty(), config)
+        if options['color']:
+            import colorama
+            colorama.init(strip=False)
+        try:
+            batch.stat(revisions, **options)
+        except subprocess.CalledProcessError as e:
+            print(f'Error: {format_git_error(e)}')
+            return 1
+
+    def index(self, *args):
+        options = {}
+        args = list(args)
+        while args:
+            arg = args.pop(0)
+            if not self.parse_jobs(arg, args, options):
+                return print(
+                    f"""Invalid option "{arg}" for "git-xl index"\nRun 'git-xl --help' for usage.""")
+
+        import history
+        current_path = os.getcwd()
+        if not is_git_repository(current_path):
+            return print('Error: not a Git repository')
+        root = subprocess.run(['git', 'rev-parse', '--show-toplevel'], stdout=subprocess.PIPE,
+                              universal_newlines=True, encoding='utf-8').stdout.strip()
+        with history.HistoryIndex.from_repository(current_path) as index:
+            try:
+                indexed = index.update(root, **options)
+            except subprocess.CalledProcessError as e:
+                print(f'Error: {format_git_error(e)}')
+                return 1
+        print(f'Indexed {indexed} new commit{"s" if indexed != 1 else ""}')
+
+    def scan(self, *args):
+        options = {}
+        args = list(args)
+        while args:
+            arg = args.pop(0)
+            if self.parse_jobs(arg, args, options):
+                continue
+            if arg.startswith('--similarity='):
+                try:
+                    options['similarity'] = renames.parse_score(arg[len('--similarity='):])
+                except ValueError:
+                    return print(
+                        f"""Invalid option "{arg}" for "git-xl scan"\nRun 'git-xl --help' for usage.""")
+            elif arg in ('--format=text', '--format=json'):
+                options['output_format'] = arg[len('--format='):]
+            else:
+                return print(
+                    f"""Invalid option "{arg}" for "git-xl scan"\nRun 'git-xl --help' for usage.""")
+
+        if not is_git_repository(os.getcwd()):
+            return print('Error: not a Git repository')
+        import diff
+        import scan
+        options['color'] = options.get('output_format', 'text') == 'text' and \
+            diff.use_color(sys.stdout.isatty(), diff.get_git_config())
+        if options['color']:
+            import colorama
+            colorama.init(strip=False)
+        scan.run(**options)
+
+    def export(self, *args):
+        options = {}
+        paths = []
+        args = list(args)
+        while args:
+            arg = args.pop(0)
+            if self.parse_jobs(arg, args, options):
+                continue
+            if arg == '--staged':
+                options['staged'] = True
+            elif arg == '--watch':
+                options['watching'] = True
+            elif arg.startswith('-'):
+                return print(
+                    f"""Invalid option "{arg}" for "git-xl export"\nRun 'git-xl --help' for usage.""")
+            else:
+                paths.append(arg)
+
+        if not is_git_repository(os.getcwd()):
+            return print('Error: not a Git repository')
+        import export
+        export.run(paths, **options)
+
+    def blame(self, *args):
+        options = {}
+        positional = []
+        for arg in args:
+            if arg.startswith('--diff-algorithm='):
+                options['algorithm'] = arg[len('--diff-algorithm='):]
+                if options['algorithm'] not in diff_engine.ALGORITHMS:
+                    return print(
+                        f"""Invalid diff algorithm "{options['algorithm']}" for "git-xl blame"\nRun 'git-xl --help' for usage.""")
+            elif arg.startswith('-'):
+                return print(
+                    f"""Invalid option "{arg}" for "git-xl blame"\nRun 'git-xl --help' for usage.""")
+            else:
+                positional.append(arg)
+
+        if len(positional) == 3:
+            options['revision'] = positional.pop(0)
+        if len(positional) != 2:
+            return print(f"""Error: "git-xl blame" requires a workbook and a module\nRun 'git-xl --help' for usage.""")
+
+        import blame
+        import diff
+        config = diff.get_git_config()
+        if 'algorithm' not in options:
+            options['algorithm'] = diff.get_diff_algorithm(config)
+        options['color'] = diff.use_color(sys.stdout.isatty(), config)
+        if options['color']:
+            import colorama
+            colorama.init(strip=False)
+        try:
+            return blame.run(*positional, **options)
+        except subprocess.CalledProcessError as e:
+            print(f'Error: {format_git_error(e)}')
+            return 1
+
+    def log(self, *args):
+        options = {}
+        module_paths = []
+        for arg in args:
+            if arg in ('-p', '--patch'):
+                options['patch'] = True
+            elif arg.startswith('--unified='):
+                options['numlines'] = self.parse_number(arg, arg[len('--unified='):])
+            elif arg.startswith('-U'):
+                options['numlines'] = self.parse_number(arg, arg[2:])
+            elif arg.startswith('-'):
+                return print(
+                    f"""Invalid option "{arg}" for "git-xl log"\nRun 'git-xl --help' for usage.""")
+            else:
+                module_paths.append(arg)
+
+        if len(module_paths) != 1:
+            return print(f"""Error: "git-xl log" requires one <workbook>/<module>\nRun 'git-xl --help' for usage.""")
+
+        import diff
+        import history
+        options['color'] = diff.use_color(sys.stdout.isatty(), diff.get_git_config())
+        if options['color']:
+            import colorama
+            colorama.init(strip=False)
+        return history.run(module_paths[0], **options)
+
 
 if __name__ == '__main__':
+    # required for worker pools in the frozen Windows executable
+    multiprocessing.freeze_support()
+    tracing.start(sys.argv)
     command_parser = CommandParser(sys.argv[1:])
-    command_parser.execute()
+    # only git xl verify and fleet installs set an exit status
+    status = command_parser.execute() or 0
+    tracing.exit(status)
+    sys.exit(status)
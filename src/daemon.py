@@ -0,0 +1,128 @@
+import io
+import os
+import json
+import socket
+import traceback
+import socketserver
+
+from diff_client import FRAME_HEADER, get_socket_path, connect, is_private_directory
+
+# import the heavy modules once, every forked worker inherits them warm
+import diff
+import oletools.olevba3
+
+
+DEFAULT_IDLE_TIMEOUT = 15 * 60
+# the request line is read before forking, a client that does not send it within this time is dropped
+REQUEST_TIMEOUT = 5
+
+
+class FrameWriter(io.RawIOBase):
+
+    def __init__(self, wfile, kind):
+        self.wfile = wfile
+        self.kind = kind
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        if b:
+            self.wfile.write(FRAME_HEADER.pack(self.kind, len(b)) + bytes(b))
+        return len(b)
+
+
+def read_request(sock):
+    # the client sends exactly one line and then waits for the response
+    data = b''
+    while not data.endswith(b'\n'):
+        chunk = sock.recv(65536)
+        if not chunk:
+            return None
+        data += chunk
+    return json.loads(data)
+
+
+class DiffRequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        # runs in a forked child: chdir and environment changes do not leak into the daemon
+        request = self.server.current_request
+        os.chdir(request['cwd'])
+        # the client sends all of its GIT_* variables, none of the daemon's own may be left over
+        for key in [key for key in os.environ if key.startswith('GIT_')]:
+            del os.environ[key]
+        os.environ.update(request.get('env', {}))
+        out = io.TextIOWrapper(io.BufferedWriter(FrameWriter(self.wfile, b'o')),
+                               encoding=request.get('encoding', 'utf-8'), errors='replace')
+        status = 0
+        try:
+            diff.main(request['args'], out=out, tty=request.get('tty', False))
+        except Exception:
+            status = 1
+            FrameWriter(self.wfile, b'e').write(traceback.format_exc().encode('utf-8'))
+        finally:
+            out.flush()
+        self.wfile.write(FRAME_HEADER.pack(b'x', len(str(status))) + str(status).encode('ascii'))
+
+
+class DiffServer(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+
+    def __init__(self, path, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+        self.timeout = idle_timeout
+        self.stopped = False
+        self.current_request = None
+        super().__init__(path, DiffRequestHandler)
+
+    def process_request(self, request, client_address):
+        # the request line is read before forking so that stop requests can end the serve loop
+        request.settimeout(REQUEST_TIMEOUT)
+        try:
+            self.current_request = read_request(request)
+        except (OSError, ValueError):
+            # stalled client or garbage
+            self.current_request = None
+        request.settimeout(None)
+        if self.current_request is None or self.current_request.get('command') == 'stop':
+            if self.current_request is not None:
+                self.stopped = True
+            self.shutdown_request(request)
+            return
+        super().process_request(request, client_address)
+
+    def handle_timeout(self):
+        super().handle_timeout()
+        self.stopped = True
+
+    def serve_until_idle(self):
+        # handle_request() waits at most `timeout` seconds: a full timeout without requests ends the daemon
+        while not self.stopped:
+            self.handle_request()
+
+
+def serve(path=None, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+    if not hasattr(socket, 'AF_UNIX'):
+        raise OSError('git xl daemon requires Unix domain sockets, which are not available on this platform')
+
+    path = path or get_socket_path()
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    if not is_private_directory(directory):
+        raise OSError(f'{directory} must be a directory of your own with mode 700')
+
+    sock = connect(path)
+    if sock is not None:
+        sock.close()
+        raise OSError(f'git xl daemon is already running on {path}')
+    if os.path.exists(path):
+        # stale socket of a daemon that did not shut down cleanly
+        os.remove(path)
+
+    server = DiffServer(path, idle_timeout=idle_timeout)
+    try:
+        server.serve_until_idle()
+    finally:
+        server.server_close()
+        if os.path.exists(path):
+            os.remove(path)
+
@@ -1,81 +1,675 @@
 import sys
 import os
-from difflib import unified_diff
+import signal
+import filecmp
+import multiprocessing
+from contextlib import contextmanager
 
-import colorama
-from oletools.olevba3 import VBA_Parser
-from colorama import Fore, Back, Style, init
+import tracing
+from cache import ExtractionCache, is_blob_oid
+from diff_engine import ALGORITHMS, structured_diff, unified_diff
+from procedures import split_procedures
+from limits import Limits, LimitExceeded
+import renames
+from vba import has_vba_project, open_vba_project, open_workbook
 
 
-def get_vba(workbook):
-    vba_parser = VBA_Parser(workbook)
-    vba_modules = vba_parser.extract_all_macros() if vba_parser.detect_vba_macros() else []
+FORMATS = ('text', 'json', 'ndjson')
+# both sides of a diff are extracted in child processes at the same time once a workbook is this large
+PARALLEL_SIZE = 1024 * 1024
 
-    modules = {}
 
+class VBAModules:
+    # the VBA modules of one workbook, identified by a digest of their compressed source stream:
+    # a module's source is only decompressed and decoded when it is asked for
+
+    def __init__(self, workbook, oid=None, cache=None, limits=None):
+        # workbook: path, bytes, memoryview or seekable binary stream
+        self.workbook = workbook
+        self.cache = cache
+        # limits.Limits of the diff driver, unlimited otherwise
+        self.limits = limits
+        self.vba_size = 0
+        self.sources = {}
+        self.streams = None
+        self.project = None
+        self.digests = self.load(oid)
+
+    def load(self, oid):
+        if self.workbook is None:
+            # missing side of an added or deleted workbook
+            return {}
+        with tracing.region('extract') as region, open_workbook(self.workbook) as data:
+            region.set(size=len(data))
+            if self.limits is not None:
+                self.limits.check_size(len(data))
+            if not has_vba_project(data):
+                region.set(vba=False)
+                return {}
+            key = self.cache.key(self.workbook, oid) if self.cache is not None else None
+            if key is not None:
+                digests = self.cache.get(key)
+                if digests is not None:
+                    region.set(cache='hit', modules=len(digests))
+                    return dict(digests)
+            digests = self.read(data)
+            region.set(cache='miss' if key is not None else 'off', modules=len(digests))
+        if key is not None:
+            # a list keeps the module order of the dir stream
+            self.cache.set(key, list(digests.items()))
+        return digests
+
+    def read(self, data):
+        import hashlib
+        try:
+            with tracing.region('parse', parser='dir'):
+                self.project = open_vba_project(data, self.limits.max_vba_size if self.limits is not None else None)
+                self.streams = dict(self.project.module_streams()) if self.project is not None else {}
+            codepage = str(self.project.codepage if self.project is not None else '').encode('ascii')
+            return {name: hashlib.sha1(codepage + stream).hexdigest() for name, stream in self.streams.items()}
+        except LimitExceeded:
+            raise
+        except Exception:
+            # anything the dir stream parser does not understand is left to oletools, which decodes every module
+            self.project = None
+            with tracing.region('parse', parser='oletools'):
+                self.streams = extract_modules(self.workbook, data)
+            if self.limits is not None:
+                self.limits.check_vba_size(sum(len(source) for source in self.streams.values()))
+            return {name: hashlib.sha1(source.encode('utf-8')).hexdigest() for name, source in self.streams.items()}
+
+    def decode(self, name):
+        if self.project is None:
+            return self.streams[name]
+        _, source = split_module(self.project.decode(self.streams[name]))
+        if self.limits is not None:
+            self.vba_size += len(source)
+            self.limits.check_vba_size(self.vba_size)
+        return source
+
+    def source(self, name):
+        if name not in self.sources:
+            key = 'module-' + self.digests[name]
+            source = self.cache.get(key) if self.cache is not None else None
+            if source is None:
+                if self.streams is None:
+                    # the module list came from the cache but the module's source did not
+                    with open_workbook(self.workbook) as data:
+                        self.read(data)
+                source = self.decode(name)
+                if self.cache is not None:
+                    self.cache.set(key, source)
+            self.sources[name] = source
+        return self.sources[name]
+
+    def items(self):
+        for name in self.digests:
+            yield name, self.source(name)
+
+
+def extract_modules(workbook, data):
+    # oletools is slow to import, only load it for workbooks that contain a VBA project
+    from oletools.olevba3 import VBA_Parser
+    filename = workbook if isinstance(workbook, str) else '<workbook>'
+    vba_parser = VBA_Parser(filename, data=data if isinstance(data, bytes) else bytes(data))
+    vba_modules = vba_parser.extract_all_macros() if vba_parser.detect_vba_macros() else []
+    modules = {}
     for _, _, _, content in vba_modules:
-        decoded_content = content
-        lines = []
-        if '\r\n' in decoded_content:
-            lines = decoded_content.split('\r\n')
-        else:
-            lines = decoded_content.split('\n')
-        if lines:
-            name = lines[0].replace('Attribute VB_Name = ', '').strip('"')
-            content = [line for line in lines[1:] if not (
-                line.startswith('Attribute') and 'VB_' in line)]
-            non_empty_lines_of_code = len([c for c in content if c])
-            modules[name] = '\n'.join(content)
+        name, source = split_module(content)
+        modules[name] = source
     return modules
 
 
-if __name__ == '__main__':
-    if not 8 <= len(sys.argv) <= 9:
-        print('Unexpected number of arguments')
-        sys.exit(0)
+def split_module(content):
+    # returns the module name from the VB_Name attribute and the source without the hidden attributes
+    if '\r\n' in content:
+        lines = content.split('\r\n')
+    else:
+        lines = content.split('\n')
+    name = lines[0].replace('Attribute VB_Name = ', '').strip('"')
+    content = [line for line in lines[1:] if not (line.startswith('Attribute') and 'VB_' in line)]
+    return name, '\n'.join(content)
 
-    if len(sys.argv) == 8:
-        _, workbook_name, workbook_b, _, _, workbook_a, _ , _ = sys.argv
-        numlines = 3
-    if len(sys.argv) == 9:
-        _, numlines, workbook_name, workbook_b, _, _, workbook_a, _, _ = sys.argv
-        numlines = int(numlines)
 
-    path_workbook_a = os.path.abspath(workbook_a) if workbook_a != 'nul' and workbook_a != '/dev/null' else None
-    path_workbook_b = os.path.abspath(workbook_b) if workbook_b != 'nul' and workbook_b != '/dev/null' else None
+def get_vba(workbook, oid=None, cache=None):
+    return dict(VBAModules(workbook, oid=oid, cache=cache).items())
+
+
+def changed_modules(workbook_a, workbook_b):
+    # only modules whose compressed streams differ are decompressed, unchanged modules are dropped from both sides
+    workbook_a_modules = {name: workbook_a.source(name) for name, digest in workbook_a.digests.items()
+                          if workbook_b.digests.get(name) != digest}
+    workbook_b_modules = {name: workbook_b.source(name) for name, digest in workbook_b.digests.items()
+                          if workbook_a.digests.get(name) != digest}
+    return workbook_a_modules, workbook_b_modules
+
+
+class ReceivedModules:
+    # the changed modules of one side of the diff, as sent by extract_side: asking for a module waits until
+    # it arrived, so that the first modules can be diffed while the child still decompresses the others
+
+    def __init__(self, connection, process, names):
+        self.connection = connection
+        self.process = process
+        self.names = names
+        self.sources = {}
+
+    def __getitem__(self, name):
+        if name not in self.names:
+            raise KeyError(name)
+        while name not in self.sources:
+            module, source = receive(self.connection, self.process)
+            self.sources[module] = source
+        return self.sources[name]
+
+    def __contains__(self, name):
+        return name in self.names
 
-    workbook_a_modules = get_vba(path_workbook_a)
-    workbook_b_modules = {} if workbook_b == 'nul' else get_vba(path_workbook_b)
+    def __iter__(self):
+        return iter(self.names)
 
-    diffs = []
+    def __len__(self):
+        return len(self.names)
+
+    def items(self):
+        for name in self.names:
+            yield name, self[name]
+
+
+def extract_side(connection, workbook, oid, limits):
+    # runs in a child process for one side of the diff: sends the digests of the workbook's modules, receives
+    # those of the other side and then sends every changed module as (name, source)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        modules = VBAModules(workbook, oid=oid, cache=ExtractionCache.from_environment(), limits=limits)
+        connection.send(modules.digests)
+        other = connection.recv()
+        changed = [name for name, digest in modules.digests.items() if other.get(name) != digest]
+        # modules the other side does not have come first, rename detection needs all of them
+        changed.sort(key=lambda name: name in other)
+        for name in changed:
+            source = modules.source(name)
+            limits.check_lines({name: source})
+            connection.send((name, source))
+    except (Exception, LimitExceeded) as exception:
+        connection.send(exception)
+
+
+def receive(connection, process):
+    try:
+        message = connection.recv()
+    except EOFError:
+        # the child died without a word: killed for running out of memory under GIT_XL_MAX_MEMORY, or an
+        # exception that could not be pickled
+        process.join(1)
+        status = f'killed by signal {-process.exitcode}' if process.exitcode is not None and process.exitcode < 0 \
+            else f'exit code {process.exitcode}'
+        raise LimitExceeded(f'extracting process ended unexpectedly ({status})')
+    if isinstance(message, BaseException):
+        raise message
+    return message
+
+
+@contextmanager
+def extract_changes(path_workbook_a, oid_a, path_workbook_b, oid_b, limits):
+    # yields the module digests and the changed modules of both workbooks, like changed_modules
+    if (path_workbook_a is None or path_workbook_b is None or (os.cpu_count() or 1) < 2 or
+            max(os.path.getsize(path_workbook_a), os.path.getsize(path_workbook_b)) < PARALLEL_SIZE):
+        cache = ExtractionCache.from_environment()
+        workbook_a = VBAModules(path_workbook_a, oid=oid_a, cache=cache, limits=limits)
+        workbook_b = VBAModules(path_workbook_b, oid=oid_b, cache=cache, limits=limits)
+        workbook_a_modules, workbook_b_modules = changed_modules(workbook_a, workbook_b)
+        limits.check_lines(workbook_a_modules)
+        limits.check_lines(workbook_b_modules)
+        yield workbook_a.digests, workbook_b.digests, workbook_a_modules, workbook_b_modules
+        return
+
+    # large workbooks: one child process per side, modules are diffed as soon as both of their sides arrived.
+    # Forked children inherit the memory limit of Limits.guard
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if 'fork' in methods else 'spawn')
+    children = []
+    try:
+        for workbook, oid in ((path_workbook_a, oid_a), (path_workbook_b, oid_b)):
+            connection, child_connection = context.Pipe()
+            process = context.Process(target=extract_side, args=(child_connection, workbook, oid, limits),
+                                      daemon=True)
+            process.start()
+            child_connection.close()
+            children.append((process, connection))
+        (process_a, connection_a), (process_b, connection_b) = children
+        digests_a, digests_b = receive(connection_a, process_a), receive(connection_b, process_b)
+        connection_a.send(digests_b)
+        connection_b.send(digests_a)
+        yield (digests_a, digests_b,
+               ReceivedModules(connection_a, process_a, [name for name, digest in digests_a.items()
+                                                         if digests_b.get(name) != digest]),
+               ReceivedModules(connection_b, process_b, [name for name, digest in digests_b.items()
+                                                         if digests_a.get(name) != digest]))
+    finally:
+        # children that are still extracting after a limit tripped are not waited for
+        for process, connection in children:
+            connection.close()
+            process.terminate()
+            process.join()
+
+
+class DeadlineWriter:
+    # hands the output on in chunks with the deadline of Limits.guard stopped, so that the time git's pager takes
+    # to read it does not count against GIT_XL_TIMEOUT; a chunk is at most CHUNK_SIZE characters plus one line,
+    # so that the diff of a huge sheet is still streamed
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, out, limits):
+        self.out = out
+        self.limits = limits
+        self.parts = []
+        self.size = 0
+
+    def write(self, text):
+        self.parts.append(text)
+        self.size += len(text)
+        if self.size >= self.CHUNK_SIZE:
+            with self.limits.paused():
+                self.write_parts()
+
+    def write_parts(self):
+        self.out.write(''.join(self.parts))
+        self.parts = []
+        self.size = 0
+
+    def flush(self):
+        with self.limits.paused():
+            self.write_parts()
+            self.out.flush()
+
+
+def get_path(workbook):
+    return os.path.abspath(workbook) if workbook != 'nul' and workbook != '/dev/null' else None
+
+
+def is_identical(path_workbook_a, oid_a, path_workbook_b, oid_b):
+    if path_workbook_a is None or path_workbook_b is None:
+        return False
+    if is_blob_oid(oid_a) and is_blob_oid(oid_b):
+        return oid_a == oid_b
+    return filecmp.cmp(path_workbook_a, path_workbook_b, shallow=False)
+
+
+def diff_modules(workbook_name, workbook_a_modules, workbook_b_modules, numlines, algorithm='myers', renames=None):
+    # yields one diff per changed module; its lines are only computed while the diff is written.
+    # renames: {new module: (old module, score, 'rename' or 'copy')} from renames.find_renames
+    renames = renames or {}
+    renamed = {old for old, _, kind in renames.values() if kind == 'rename'}
     for module_a, vba_a in workbook_a_modules.items():
-        if module_a not in workbook_b_modules:
-            diffs.append({
+        if module_a in renames:
+            module_b, score, kind = renames[module_a]
+            path_a = workbook_name + '/VBA/' + module_a
+            path_b = workbook_name + '/VBA/' + module_b
+            vba_b = workbook_b_modules[module_b]
+            yield {
+                'module': module_a,
+                'status': 'renamed' if kind == 'rename' else 'copied',
+                'old_module': module_b,
+                'similarity': score,
+                'header': [f'similarity index {int(score * 100)}%', f'{kind} from {path_b}', f'{kind} to {path_a}'],
+                # like git, identical modules only get the extended header
+                'a': '--- a/' + path_b if vba_a != vba_b else None,
+                'b': '+++ b/' + path_a if vba_a != vba_b else None,
+                'lines': unified_diff(vba_b.split('\n'), vba_a.split('\n'), n=numlines, algorithm=algorithm,
+                                      split=split_procedures) if vba_a != vba_b else (),
+                'hunks': module_hunks(vba_b, vba_a, numlines, algorithm) if vba_a != vba_b else ()
+            }
+        elif module_a not in workbook_b_modules:
+            yield {
+                'module': module_a,
+                'status': 'added',
                 'a': '--- /dev/null',
                 'b': '+++ b/' + workbook_name + '/VBA/' + module_a,
-                'diff': '\n'.join([Fore.GREEN + '+' + line for line in vba_a.split('\n')])
-            })
+                'lines': ('+' + line for line in vba_a.split('\n')),
+                'hunks': module_hunks(None, vba_a)
+            }
         elif vba_a != workbook_b_modules[module_a]:
-            diffs.append({
+            yield {
+                'module': module_a,
+                'status': 'modified',
                 'a': '--- a/' + workbook_name + '/VBA/' + module_a,
                 'b': '+++ b/' + workbook_name + '/VBA/' + module_a,
-                'diff': '\n'.join([(Fore.RED if line.startswith('-') else (Fore.GREEN if line.startswith('+') else (Fore.CYAN if line.startswith('@') else ''))) + line.strip('\n') for line in list(unified_diff(workbook_b_modules[module_a].split('\n'), vba_a.split('\n'), n=numlines))[2:]])
-            })
+                # unchanged procedures are skipped before the line diff, hunk headers name the procedure
+                'lines': unified_diff(workbook_b_modules[module_a].split('\n'), vba_a.split('\n'), n=numlines,
+                                      algorithm=algorithm, split=split_procedures),
+                'hunks': module_hunks(workbook_b_modules[module_a], vba_a, numlines, algorithm)
+            }
 
     for module_b, vba_b in workbook_b_modules.items():
-        if module_b not in workbook_a_modules:
-            diffs.append({
+        if module_b not in workbook_a_modules and module_b not in renamed:
+            yield {
+                'module': module_b,
+                'status': 'removed',
                 'a': '--- b/' + workbook_name + '/VBA/' + module_b,
                 'b': '+++ /dev/null',
-                'diff': '\n'.join([Fore.RED + '-' + line for line in vba_b.split('\n')])
-            })
+                'lines': ('-' + line for line in vba_b.split('\n')),
+                'hunks': module_hunks(vba_b, None)
+            }
+
+
+def module_hunks(old, new, numlines=3, algorithm='myers'):
+    # structured hunks for print_json; as a generator nothing is split or diffed when the text is printed instead
+    yield from structured_diff(old.split('\n') if old is not None else [], new.split('\n') if new is not None else [],
+                               n=numlines, algorithm=algorithm, split=split_procedures)
+
 
+def diff_worksheets(workbook_name, workbook_a, workbook_b):
+    # cell diffs of macro-free OOXML workbooks; the workbooks stay open while the diffs are consumed
+    from contextlib import ExitStack
+    import cells
+    with ExitStack() as stack:
+        data = [stack.enter_context(open_workbook(workbook)) if workbook is not None else None
+                for workbook in (workbook_a, workbook_b)]
+        if all(item is None or cells.Package.is_spreadsheet(item) for item in data):
+            yield from cells.diff_sheets(workbook_name, *data)
 
-    colorama.init(strip=False)
 
-    print(Style.BRIGHT + 'diff --xl ' + 'a/' + workbook_name + ' b/' + workbook_name)
+def get_colors(color):
+    if not color:
+        return {'header': '', '+': '', '-': '', '@': '', 'commit': '', 'reset': ''}
+    from colorama import Fore, Style
+    return {'header': Style.BRIGHT, '+': Fore.GREEN, '-': Fore.RED, '@': Fore.CYAN, 'commit': Fore.YELLOW,
+            'reset': Style.RESET_ALL}
+
+
+def print_diffs(workbook_name, diffs, out, color=True, header=True):
+    colors = get_colors(color)
+    if header:
+        out.write(colors['header'] + 'diff --xl ' + 'a/' + workbook_name + ' b/' + workbook_name + '\n')
+    header = colors['header']
     for diff in diffs:
-        print(Style.BRIGHT + diff['a'])
-        print(Style.BRIGHT + diff['b'])
-        print(diff['diff'])
-        print('')
+        # includes computing the diff, which happens while its lines are consumed
+        with tracing.region('render', module=diff['module']) as region:
+            for line in diff.get('header', ()):
+                out.write(header + line + '\n')
+            if diff['a'] is not None:
+                out.write(header + diff['a'] + '\n' + header + diff['b'] + '\n')
+            lines = 0
+            for line in diff['lines']:
+                if line[:1] == '@' and not line.endswith('@@'):
+                    # like git, the procedure name after the hunk range is not colored
+                    end = line.index(' @@', 2) + 3
+                    out.write(colors['@'] + line[:end] + colors['reset'] + line[end:] + '\n')
+                else:
+                    out.write(colors.get(line[:1], '') + line + '\n')
+                lines += 1
+            out.write('\n')
+            # hand every finished module to the pager right away
+            out.flush()
+            region.set(lines=lines)
+
+
+def diff_record(diff):
+    # the machine-readable form of a diff of diff_modules or cells.diff_sheets; computes the diff like print_diffs
+    if 'cells' in diff:
+        return {'sheet': diff['module'], 'status': diff['status'], 'cells': list(diff['cells'])}
+    record = {'module': diff['module'], 'status': diff['status']}
+    if 'old_module' in diff:
+        record.update(old_module=diff['old_module'], similarity=round(diff['similarity'], 2))
+    record['hunks'] = list(diff['hunks'])
+    return record
+
+
+def print_json(workbook_name, diffs, out, ndjson=False, skipped=None):
+    # json: one object per workbook; ndjson: one object per module or sheet, written as soon as it is diffed.
+    # Both are written on a single line without colors
+    import json
+    if ndjson:
+        for diff in diffs:
+            with tracing.region('render', module=diff['module'], format='ndjson'):
+                out.write(json.dumps(dict(workbook=workbook_name, **diff_record(diff))) + '\n')
+                out.flush()
+        if skipped is not None:
+            out.write(json.dumps({'workbook': workbook_name, 'skipped': skipped}) + '\n')
+        return
+    with tracing.region('render', format='json'):
+        record = {'workbook': workbook_name, 'modules': [diff_record(diff) for diff in diffs]}
+        if skipped is not None:
+            record['skipped'] = skipped
+        out.write(json.dumps(record) + '\n')
+
+
+def print_output(workbook_name, diffs, out, output_format='text', color=True, header=True):
+    if output_format == 'text':
+        print_diffs(workbook_name, diffs, out, color, header)
+    else:
+        print_json(workbook_name, diffs, out, output_format == 'ndjson')
+
+
+def count_changes(workbook_a_modules, workbook_b_modules, renames=None):
+    # insertions and deletions per module from line counts instead of an alignment of the two versions:
+    # a line counts as inserted when the new version has it more often than the old one, moved lines are unchanged.
+    # Returns (module, insertions, deletions, status, source) with source = (old module, score) of renamed and
+    # copied modules; renames: {new module: (old module, score, 'rename' or 'copy')} from renames.find_renames
+    from collections import Counter
+    renames = renames or {}
+    renamed = {old for old, _, kind in renames.values() if kind == 'rename'}
+    stats = []
+    for module_a, vba_a in workbook_a_modules.items():
+        lines_a = Counter(vba_a.split('\n'))
+        if module_a in renames:
+            module_b, score, kind = renames[module_a]
+            lines_b = Counter(workbook_b_modules[module_b].split('\n'))
+            stats.append((module_a, sum((lines_a - lines_b).values()), sum((lines_b - lines_a).values()),
+                          'renamed' if kind == 'rename' else 'copied', (module_b, score)))
+        elif module_a not in workbook_b_modules:
+            stats.append((module_a, sum(lines_a.values()), 0, 'new', None))
+        elif vba_a != workbook_b_modules[module_a]:
+            lines_b = Counter(workbook_b_modules[module_a].split('\n'))
+            stats.append((module_a, sum((lines_a - lines_b).values()), sum((lines_b - lines_a).values()), None, None))
+    for module_b, vba_b in workbook_b_modules.items():
+        if module_b not in workbook_a_modules and module_b not in renamed:
+            stats.append((module_b, 0, len(vba_b.split('\n')), 'deleted', None))
+    return stats
+
+
+def stat_path(workbook_name, module, source):
+    # like git, the path of a renamed or copied module names both modules: Book1.xlsb/VBA/{Module3 => Renamed}
+    if source is None:
+        return workbook_name + '/VBA/' + module
+    return f'{workbook_name}/VBA/{{{source[0]} => {module}}}'
+
+
+def print_stat(workbook_name, stats, out, color=True, width=50):
+    # same layout as `git diff --stat --summary`, the bars are scaled down to `width` characters
+    if not stats:
+        return
+    colors = get_colors(color)
+    reset = colors['reset']
+    paths = [stat_path(workbook_name, module, source) for module, _, _, _, source in stats]
+    path_width = max(len(path) for path in paths)
+    largest = max(insertions + deletions for _, insertions, deletions, _, _ in stats)
+    count_width = len(str(largest))
+    for path, (_, insertions, deletions, _, _) in zip(paths, stats):
+        if largest > width:
+            # like git, a module with changes keeps at least one character of its bar
+            plus = -(-insertions * width // largest)
+            minus = -(-deletions * width // largest)
+        else:
+            plus, minus = insertions, deletions
+        bar = ''
+        if plus:
+            bar += colors['+'] + '+' * plus + reset
+        if minus:
+            bar += colors['-'] + '-' * minus + reset
+        out.write(f' {path:<{path_width}} | {insertions + deletions:>{count_width}} {bar}'.rstrip(' ') + '\n')
+    insertions = sum(stat[1] for stat in stats)
+    deletions = sum(stat[2] for stat in stats)
+    summary = f' {len(stats)} module{"s" if len(stats) != 1 else ""} changed'
+    if insertions or not deletions:
+        summary += f', {insertions} insertion{"s" if insertions != 1 else ""}(+)'
+    if deletions or not insertions:
+        summary += f', {deletions} deletion{"s" if deletions != 1 else ""}(-)'
+    out.write(summary + '\n')
+    for path, (_, _, _, status, source) in zip(paths, stats):
+        if status == 'new':
+            out.write(f' create module {path}\n')
+        elif status == 'deleted':
+            out.write(f' delete module {path}\n')
+        elif status in ('renamed', 'copied'):
+            kind = 'rename' if status == 'renamed' else 'copy'
+            out.write(f' {kind} {path} ({int(source[1] * 100)}%)\n')
+
+
+def print_numstat(workbook_name, stats, out, z=False):
+    # same as `git diff --numstat`: with -z records end in NUL and paths are not quoted, the old and new path of a
+    # renamed or copied module follow an empty path
+    terminator = '\0' if z else '\n'
+    for module, insertions, deletions, _, source in stats:
+        if source is not None and z:
+            path = f'\0{workbook_name}/VBA/{source[0]}\0{workbook_name}/VBA/{module}'
+        else:
+            path = stat_path(workbook_name, module, source)
+        out.write(f'{insertions}\t{deletions}\t{path}{terminator}')
+
+
+def textconv(workbook, out):
+    # deterministic text rendering of a workbook's VBA project, for git's textconv and its cache
+    modules = get_vba(workbook)
+    for name in sorted(modules, key=lambda name: (name.lower(), name)):
+        out.write(f'Attribute VB_Name = "{name}"\n{modules[name]}\n\n')
+
+
+def get_git_config():
+    # diff settings git does not pass on to external diff drivers, read with a single git call
+    import subprocess
+    try:
+        output = subprocess.run(['git', 'config', '-z', '--get-regexp', r'^(diff\.algorithm|diff\.renames|color\.diff|color\.ui)$'],
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout
+    except OSError:
+        return {}
+    config = {}
+    for entry in output.decode('utf-8', 'replace').split('\0'):
+        if entry:
+            key, _, value = entry.partition('\n')
+            config[key.lower()] = value
+    return config
+
+
+def get_diff_algorithm(config=None):
+    config = get_git_config() if config is None else config
+    algorithm = config.get('diff.algorithm', 'myers').lower()
+    return algorithm if algorithm in ALGORITHMS else 'myers'
+
+
+def get_renames(config=None):
+    # (threshold, copies) from git's diff.renames, which defaults to true; a threshold of None turns detection off
+    config = get_git_config() if config is None else config
+    setting = config.get('diff.renames', 'true').lower()
+    if setting in ('false', 'no', 'off', '0'):
+        return None, False
+    return renames.DEFAULT_THRESHOLD, setting in ('copies', 'copy')
+
+
+def use_color(tty, config=None):
+    # same rules as git's color.diff: "auto" colors terminals and git's pager only
+    config = get_git_config() if config is None else config
+    setting = config.get('color.diff', config.get('color.ui', 'auto')).lower()
+    if setting == 'always':
+        return True
+    if setting in ('never', 'false', 'no', 'off', '0'):
+        return False
+    return bool(tty) or os.environ.get('GIT_PAGER_IN_USE', '').lower() in ('true', '1')
+
+
+def main(args, out=None, tty=None):
+    # args as passed by git to diff.xl.command, optionally preceded by --diff-algorithm=<algorithm>,
+    # --format=<text|json|ndjson>, rename options such as -M50% and the number of context lines
+    config = get_git_config()
+    algorithm = None
+    output_format = 'text'
+    threshold, copies = get_renames(config)
+    while args and args[0].startswith('-'):
+        if args[0].startswith('--diff-algorithm='):
+            algorithm = args[0][len('--diff-algorithm='):]
+        elif args[0].startswith('--format=') and args[0][len('--format='):] in FORMATS:
+            output_format = args[0][len('--format='):]
+        else:
+            try:
+                option = renames.parse_option(args[0], threshold, copies)
+            except ValueError:
+                option = None
+            if option is None:
+                break
+            threshold, copies = option
+        args = args[1:]
+    if algorithm not in ALGORITHMS:
+        algorithm = get_diff_algorithm(config)
+
+    if out is None:
+        out = sys.stdout
+        tty = out.isatty()
+        # print_diffs flushes once per module instead of once per line
+        out.reconfigure(line_buffering=False)
+    # machine-readable output is never colored
+    color = output_format == 'text' and use_color(tty, config)
+    if color and out is sys.stdout:
+        # colorama is only needed to translate colors for Windows consoles
+        import colorama
+        colorama.init(strip=False)
+        out = sys.stdout
+
+    if not 7 <= len(args) <= 8:
+        print('Unexpected number of arguments', file=out)
+        return
+
+    if len(args) == 7:
+        workbook_name, workbook_b, oid_b, _, workbook_a, oid_a, _ = args
+        numlines = 3
+    if len(args) == 8:
+        numlines, workbook_name, workbook_b, oid_b, _, workbook_a, oid_a, _ = args
+        numlines = int(numlines)
+
+    path_workbook_a = get_path(workbook_a)
+    path_workbook_b = get_path(workbook_b)
+
+    with tracing.region('diff', workbook=workbook_name, algorithm=algorithm) as region:
+        if is_identical(path_workbook_a, oid_a, path_workbook_b, oid_b):
+            region.set(identical=True)
+            print_output(workbook_name, [], out, output_format, color)
+            return
+
+        if output_format == 'text':
+            # the header goes out first: a limit that trips while the diffs are written only adds the placeholder
+            print_diffs(workbook_name, [], out, color)
+        limits = Limits.from_environment()
+        writer = DeadlineWriter(out, limits)
+        try:
+            with limits.guard():
+                with extract_changes(path_workbook_a, oid_a, path_workbook_b, oid_b, limits) as changes:
+                    digests_a, digests_b, workbook_a_modules, workbook_b_modules = changes
+                    region.set(modules=len(set(digests_a) | set(digests_b)),
+                               changed_modules=len(set(workbook_a_modules) | set(workbook_b_modules)))
+
+                    found = {}
+                    if threshold is not None:
+                        with tracing.region('renames') as renames_region:
+                            found = renames.find_renames(workbook_a_modules, workbook_b_modules, threshold, copies)
+                            renames_region.set(renames=len(found))
+                    diffs = diff_modules(workbook_name, workbook_a_modules, workbook_b_modules, numlines, algorithm,
+                                         found)
+                    if not digests_a and not digests_b:
+                        diffs = diff_worksheets(workbook_name, path_workbook_a, path_workbook_b)
+                    print_output(workbook_name, diffs, writer, output_format, color, header=False)
+                    writer.flush()
+        except LimitExceeded as exception:
+            region.set(skipped=str(exception))
+            if output_format == 'text':
+                out.write(f'diff skipped: {exception}\n')
+            else:
+                print_json(workbook_name, [], out, output_format == 'ndjson', skipped=str(exception))
+            out.flush()
+
+
+if __name__ == '__main__':
+    # the frozen Windows executable starts the extracting child processes with itself
+    multiprocessing.freeze_support()
+    tracing.start(sys.argv)
+    main(sys.argv[1:])
+    tracing.exit()
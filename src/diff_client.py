@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+import os
+import sys
+import json
+import stat
+import socket
+import struct
+
+import tracing
+
+
+# kept deliberately small: git spawns this once per changed workbook, so it must not import oletools or colorama
+FRAME_HEADER = struct.Struct('>cI')
+
+
+def get_socket_path():
+    if os.environ.get('GIT_XL_DAEMON_SOCKET'):
+        return os.environ['GIT_XL_DAEMON_SOCKET']
+    tmp = os.environ.get('TMPDIR') or os.environ.get('TEMP') or os.environ.get('TMP') or '/tmp'
+    return os.path.join(tmp, f'git-xl-{os.getuid()}', 'daemon.sock')
+
+
+def is_private_directory(path):
+    # the socket's directory must be the user's own and closed to everyone else: a directory another local user
+    # created could hold a fake daemon that sees the paths of every diff and controls its output
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return False
+    return stat.S_ISDIR(st.st_mode) and st.st_uid == os.getuid() and stat.S_IMODE(st.st_mode) == 0o700
+
+
+def connect(path=None):
+    # returns None when the daemon is not running (or AF_UNIX is not available on this platform), or when its
+    # directory is not private
+    if not hasattr(socket, 'AF_UNIX'):
+        return None
+    path = path or get_socket_path()
+    if not is_private_directory(os.path.dirname(os.path.abspath(path))):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+
+def read_frames(sock):
+    f = sock.makefile('rb')
+    while True:
+        header = f.read(FRAME_HEADER.size)
+        if len(header) < FRAME_HEADER.size:
+            return
+        kind, size = FRAME_HEADER.unpack(header)
+        yield kind, f.read(size)
+
+
+def forward(args):
+    # returns the exit status of the diff run by the daemon or None if no daemon is available
+    sock = connect()
+    if sock is None:
+        return None
+
+    with sock:
+        request = {
+            'args': args,
+            'cwd': os.getcwd(),
+            'env': {key: value for key, value in os.environ.items() if key.startswith('GIT_')},
+            'encoding': sys.stdout.encoding or 'utf-8',
+            # the daemon's output goes through a socket, it decides on colors from the client's terminal
+            'tty': sys.stdout.isatty(),
+        }
+        try:
+            sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        except OSError:
+            return None
+
+        received = False
+        for kind, data in read_frames(sock):
+            received = True
+            if kind == b'o':
+                sys.stdout.buffer.write(data)
+            elif kind == b'e':
+                sys.stderr.buffer.write(data)
+            elif kind == b'x':
+                sys.stdout.flush()
+                return int(data)
+
+    # the daemon went away: retry in-process unless it already produced output
+    if received:
+        sys.stderr.write('git-xl: lost connection to daemon\n')
+        return 1
+    return None
+
+
+def stop():
+    sock = connect()
+    if sock is None:
+        return False
+    with sock:
+        sock.sendall(json.dumps({'command': 'stop'}).encode('utf-8') + b'\n')
+        # wait for the daemon to close the connection
+        sock.recv(1)
+    return True
+
+
+if __name__ == '__main__':
+    tracing.start(sys.argv)
+    with tracing.region('forward') as region:
+        status = forward(sys.argv[1:])
+        region.set(daemon=status is not None)
+    if status is None:
+        # no daemon: diff in-process
+        import diff
+        diff.main(sys.argv[1:])
+        status = 0
+    tracing.exit(status)
+    sys.exit(status)
@@ -0,0 +1,323 @@
+import tracing
+
+
+ALGORITHMS = ('default', 'myers', 'minimal', 'patience', 'histogram')
+# git's histogram diff ignores lines that occur more often than this in a region
+MAX_CHAIN = 64
+
+
+def hunks(a, b, n=3, algorithm='myers', split=None):
+    # yields the opcode group and the function header of every hunk of a diff of a and b;
+    # split: optional function returning the (name, start, stop) blocks of a list of lines, such as the
+    # procedures of a VBA module: unchanged blocks are matched before any line is diffed and every hunk
+    # header names the block it starts in, like git's funcname patterns
+    with tracing.region('unified_diff', algorithm=algorithm, lines_a=len(a), lines_b=len(b)) as region:
+        if split is None:
+            codes = diff_opcodes(a, b, algorithm)
+            sections = []
+        else:
+            sections = split(a)
+            codes = diff_opcodes(a, b, algorithm, sections, split(b), region)
+    headers = [(start, a[start].strip()[:80]) for name, start, _ in sections if name is not None]
+    for group in grouped_opcodes(codes, n):
+        yield group, function_header(headers, group[0][1])
+
+
+def unified_diff(a, b, n=3, algorithm='myers', split=None):
+    # yields the hunks of difflib.unified_diff(a, b, n=n, lineterm=''), without the ---/+++ file header
+    for group, function in hunks(a, b, n, algorithm, split):
+        first, last = group[0], group[-1]
+        yield f'@@ -{format_range(first[1], last[2])} +{format_range(first[3], last[4])} @@' + function
+        for tag, i1, i2, j1, j2 in group:
+            if tag == 'equal':
+                for line in a[i1:i2]:
+                    yield ' ' + line
+                continue
+            if tag in ('replace', 'delete'):
+                for line in a[i1:i2]:
+                    yield '-' + line
+            if tag in ('replace', 'insert'):
+                for line in b[j1:j2]:
+                    yield '+' + line
+
+
+def structured_diff(a, b, n=3, algorithm='myers', split=None):
+    # the hunks of unified_diff as dicts with 1-based line numbers, for machine-readable output
+    for group, function in hunks(a, b, n, algorithm, split):
+        first, last = group[0], group[-1]
+        lines = []
+        for tag, i1, i2, j1, j2 in group:
+            if tag == 'equal':
+                lines.extend({'type': 'context', 'old': i + 1, 'new': j1 + i - i1 + 1, 'text': a[i]}
+                             for i in range(i1, i2))
+                continue
+            if tag in ('replace', 'delete'):
+                lines.extend({'type': 'removed', 'old': i + 1, 'text': a[i]} for i in range(i1, i2))
+            if tag in ('replace', 'insert'):
+                lines.extend({'type': 'added', 'new': j + 1, 'text': b[j]} for j in range(j1, j2))
+        old_start, old_lines = range_numbers(first[1], last[2])
+        new_start, new_lines = range_numbers(first[3], last[4])
+        yield {'old_start': old_start, 'old_lines': old_lines, 'new_start': new_start, 'new_lines': new_lines,
+               'function': function[1:] or None, 'lines': lines}
+
+
+def function_header(headers, start):
+    # like git, the header is the last block declaration before the first line of the hunk
+    from bisect import bisect_left
+    position = bisect_left(headers, (start,))
+    return ' ' + headers[position - 1][1] if position else ''
+
+
+def range_numbers(start, stop):
+    # first line and length of a hunk range as in its header: an empty range starts at the line before it
+    length = stop - start
+    return (start + 1 if length else start), length
+
+
+def format_range(start, stop):
+    # same as difflib's _format_range_unified
+    beginning, length = range_numbers(start, stop)
+    if length == 1:
+        return str(beginning)
+    return f'{beginning},{length}'
+
+
+def intern_lines(a, b):
+    # maps every distinct line to a small integer: the algorithms compare and hash ints instead of strings
+    ids = {}
+    return [ids.setdefault(line, len(ids)) for line in a], [ids.setdefault(line, len(ids)) for line in b]
+
+
+def diff_opcodes(a, b, algorithm='myers', sections_a=None, sections_b=None, region=tracing.NULL_REGION):
+    a, b = intern_lines(a, b)
+    if sections_a is None:
+        blocks = matching_blocks(a, b, 0, len(a), 0, len(b), algorithm)
+    else:
+        blocks = section_blocks(a, b, sections_a, sections_b, algorithm, region)
+    return opcodes(blocks, len(a), len(b))
+
+
+def matching_blocks(a, b, alo, ahi, blo, bhi, algorithm):
+    # common prefix and suffix never take part in a diff
+    prefix = 0
+    limit = min(ahi - alo, bhi - blo)
+    while prefix < limit and a[alo + prefix] == b[blo + prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and a[ahi - 1 - suffix] == b[bhi - 1 - suffix]:
+        suffix += 1
+
+    blocks = [(alo, blo, prefix)] if prefix else []
+    if algorithm == 'histogram':
+        blocks += histogram_blocks(a, b, alo + prefix, ahi - suffix, blo + prefix, bhi - suffix)
+    elif algorithm == 'patience':
+        blocks += patience_blocks(a, b, alo + prefix, ahi - suffix, blo + prefix, bhi - suffix)
+    else:
+        blocks += myers_blocks(a, b, alo + prefix, ahi - suffix, blo + prefix, bhi - suffix)
+    if suffix:
+        blocks.append((ahi - suffix, bhi - suffix, suffix))
+    return blocks
+
+
+def section_blocks(a, b, sections_a, sections_b, algorithm, region):
+    # diffs the sequences of section fingerprints first: sections that did not change are matched as a whole,
+    # only the lines between them are diffed line by line
+    fingerprints_a, fingerprints_b = intern_lines([tuple(a[start:stop]) for _, start, stop in sections_a],
+                                                  [tuple(b[start:stop]) for _, start, stop in sections_b])
+    blocks = []
+    previous_a = previous_b = 0
+    diffed_lines = 0
+    anchors = matching_blocks(fingerprints_a, fingerprints_b, 0, len(sections_a), 0, len(sections_b), algorithm)
+    for i, j, size in anchors + [(len(sections_a), len(sections_b), 0)]:
+        start_a = sections_a[i][1] if i < len(sections_a) else len(a)
+        start_b = sections_b[j][1] if j < len(sections_b) else len(b)
+        if start_a > previous_a or start_b > previous_b:
+            blocks += matching_blocks(a, b, previous_a, start_a, previous_b, start_b, algorithm)
+            diffed_lines += start_a - previous_a + start_b - previous_b
+        if size:
+            stop_a, stop_b = sections_a[i + size - 1][2], sections_b[j + size - 1][2]
+            blocks.append((start_a, start_b, stop_a - start_a))
+            previous_a, previous_b = stop_a, stop_b
+    region.set(sections_a=len(sections_a), sections_b=len(sections_b), diffed_lines=diffed_lines)
+    return blocks
+
+
+def myers_blocks(a, b, alo, ahi, blo, bhi):
+    # git's default algorithm is served by difflib's matcher, the engine git-xl has always used
+    from difflib import SequenceMatcher
+    matcher = SequenceMatcher(None, a[alo:ahi], b[blo:bhi])
+    return [(alo + i, blo + j, size) for i, j, size in matcher.get_matching_blocks() if size]
+
+
+def histogram_blocks(a, b, alo, ahi, blo, bhi):
+    # git's histogram diff: split the regions at the longest common run that contains the
+    # least frequent line, then diff both sides of it
+    blocks = []
+    regions = [(alo, ahi, blo, bhi)]
+    while regions:
+        alo, ahi, blo, bhi = regions.pop()
+        if alo >= ahi or blo >= bhi:
+            continue
+        occurrences = {}
+        for i in range(alo, ahi):
+            occurrences.setdefault(a[i], []).append(i)
+
+        best = None
+        best_count = MAX_CHAIN + 1
+        best_length = 0
+        j = blo
+        while j < bhi:
+            next_j = j + 1
+            positions = occurrences.get(b[j])
+            if positions is not None and len(positions) <= best_count:
+                for i in positions:
+                    start_a, start_b = i, j
+                    count = len(positions)
+                    while start_a > alo and start_b > blo and a[start_a - 1] == b[start_b - 1]:
+                        start_a -= 1
+                        start_b -= 1
+                        count = min(count, len(occurrences[a[start_a]]))
+                    end_a, end_b = i + 1, j + 1
+                    while end_a < ahi and end_b < bhi and a[end_a] == b[end_b]:
+                        count = min(count, len(occurrences[a[end_a]]))
+                        end_a += 1
+                        end_b += 1
+                    next_j = max(next_j, end_b)
+                    if count < best_count or (count == best_count and end_a - start_a > best_length):
+                        best = (start_a, start_b)
+                        best_count = count
+                        best_length = end_a - start_a
+            j = next_j
+
+        if best is None:
+            if any(b[j] in occurrences for j in range(blo, bhi)):
+                # only lines that are too frequent match: let the classic algorithm align them
+                blocks += myers_blocks(a, b, alo, ahi, blo, bhi)
+            continue
+        start_a, start_b = best
+        blocks.append((start_a, start_b, best_length))
+        regions.append((alo, start_a, blo, start_b))
+        regions.append((start_a + best_length, ahi, start_b + best_length, bhi))
+    return sorted(blocks)
+
+
+def patience_blocks(a, b, alo, ahi, blo, bhi):
+    # patience diff: anchor on lines that are unique on both sides, in their longest increasing order
+    blocks = []
+    regions = [(alo, ahi, blo, bhi)]
+    while regions:
+        alo, ahi, blo, bhi = regions.pop()
+        while alo < ahi and blo < bhi and a[alo] == b[blo]:
+            blocks.append((alo, blo, 1))
+            alo += 1
+            blo += 1
+        while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+            ahi -= 1
+            bhi -= 1
+            blocks.append((ahi, bhi, 1))
+        if alo >= ahi or blo >= bhi:
+            continue
+
+        anchors = unique_common_lines(a, b, alo, ahi, blo, bhi)
+        if not anchors:
+            blocks += myers_blocks(a, b, alo, ahi, blo, bhi)
+            continue
+        previous_a, previous_b = alo, blo
+        for i, j in anchors:
+            regions.append((previous_a, i, previous_b, j))
+            blocks.append((i, j, 1))
+            previous_a, previous_b = i + 1, j + 1
+        regions.append((previous_a, ahi, previous_b, bhi))
+    return merge_blocks(sorted(blocks))
+
+
+def unique_common_lines(a, b, alo, ahi, blo, bhi):
+    # pairs (i, j) of lines that occur exactly once in both regions, reduced to their longest
+    # increasing subsequence with patience sorting
+    counts = {}
+    for i in range(alo, ahi):
+        count, _ = counts.get(a[i], (0, None))
+        counts[a[i]] = (count + 1, i)
+    seen = {}
+    for j in range(blo, bhi):
+        if counts.get(b[j], (0, None))[0] == 1:
+            seen[b[j]] = None if b[j] in seen else j
+    pairs = sorted((counts[line][1], j) for line, j in seen.items() if j is not None)
+    if not pairs:
+        return []
+
+    from bisect import bisect_left
+    tops = []
+    top_indices = []
+    previous = [None] * len(pairs)
+    for index, (_, j) in enumerate(pairs):
+        position = bisect_left(tops, j)
+        if position == len(tops):
+            tops.append(j)
+            top_indices.append(index)
+        else:
+            tops[position] = j
+            top_indices[position] = index
+        previous[index] = top_indices[position - 1] if position else None
+
+    anchors = []
+    index = top_indices[-1]
+    while index is not None:
+        anchors.append(pairs[index])
+        index = previous[index]
+    return anchors[::-1]
+
+
+def merge_blocks(blocks):
+    merged = []
+    for i, j, size in blocks:
+        if merged and merged[-1][0] + merged[-1][2] == i and merged[-1][1] + merged[-1][2] == j:
+            merged[-1] = (merged[-1][0], merged[-1][1], merged[-1][2] + size)
+        else:
+            merged.append((i, j, size))
+    return merged
+
+
+def opcodes(blocks, len_a, len_b):
+    # same as SequenceMatcher.get_opcodes() for the given matching blocks
+    codes = []
+    i = j = 0
+    for ai, bj, size in merge_blocks(blocks) + [(len_a, len_b, 0)]:
+        tag = ''
+        if i < ai and j < bj:
+            tag = 'replace'
+        elif i < ai:
+            tag = 'delete'
+        elif j < bj:
+            tag = 'insert'
+        if tag:
+            codes.append((tag, i, ai, j, bj))
+        i, j = ai + size, bj + size
+        if size:
+            codes.append(('equal', ai, i, bj, j))
+    return codes
+
+
+def grouped_opcodes(codes, n=3):
+    # same as SequenceMatcher.get_grouped_opcodes()
+    if not codes:
+        codes = [('equal', 0, 1, 0, 1)]
+    if codes[0][0] == 'equal':
+        tag, i1, i2, j1, j2 = codes[0]
+        codes[0] = tag, max(i1, i2 - n), i2, max(j1, j2 - n), j2
+    if codes[-1][0] == 'equal':
+        tag, i1, i2, j1, j2 = codes[-1]
+        codes[-1] = tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)
+
+    nn = n + n
+    group = []
+    for tag, i1, i2, j1, j2 in codes:
+        # end the current group and start a new one whenever there is a large range with no changes
+        if tag == 'equal' and i2 - i1 > nn:
+            group.append((tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)))
+            yield group
+            group = []
+            i1, j1 = max(i1, i2 - n), max(j1, j2 - n)
+        group.append((tag, i1, i2, j1, j2))
+    if group and not (len(group) == 1 and group[0][0] == 'equal'):
+        yield group
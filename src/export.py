@@ -0,0 +1,329 @@
+import os
+import sys
+import json
+import time
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+
+import diff
+from batch import CatFile, is_workbook
+from scan import fingerprint, list_workbooks
+from cache import ExtractionCache
+
+
+# VBA modules exported as text next to their workbook, <workbook>.vba/<module>.bas, for code search and linters.
+# .git/xl/export.json keeps the stat info of every workbook and the digests of the modules that were written,
+# so that an export only opens the workbooks that changed and only decompresses the modules that changed
+MANIFEST_VERSION = 1
+SIDECAR_SUFFIX = '.vba'
+MODULE_SUFFIX = '.bas'
+# a saved workbook is exported once it did not change for this long: Excel writes a temporary file first
+DEFAULT_DELAY = 1.0
+POLL_INTERVAL = 1.0
+
+
+def sidecar_path(path, module):
+    return f'{path}{SIDECAR_SUFFIX}/{module}{MODULE_SUFFIX}'
+
+
+def is_safe_module_name(name):
+    # module names come from the workbook: a crafted one must not write or delete files outside <workbook>.vba/
+    return bool(name) and not any(part in name for part in ('/', '\\', '..', '\0', ':'))
+
+
+def load(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return manifest.get('workbooks', {}) if manifest.get('version') == MANIFEST_VERSION else {}
+
+
+def save(path, workbooks):
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': MANIFEST_VERSION, 'workbooks': workbooks}, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+    except OSError:
+        # without a manifest the next export compares the files instead
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def write_file(path, content):
+    # returns False and leaves the file alone when it already has the content
+    try:
+        with open(path, 'rb') as f:
+            if f.read() == content:
+                return False
+    except OSError:
+        pass
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+    return True
+
+
+def remove_files(root, paths):
+    for path in paths:
+        try:
+            os.remove(os.path.join(root, path))
+        except OSError:
+            pass
+        try:
+            # only succeeds once the sidecar directory is empty
+            os.rmdir(os.path.dirname(os.path.join(root, path)))
+        except OSError:
+            pass
+
+
+def export_workbook(root, path, previous, data=None, oid=None):
+    # runs in a worker process: writes the modules of one workbook whose digest is not in `previous`, the
+    # {module: digest} of the last export, and removes the files of deleted modules. data and oid are the
+    # staged blob of the workbook, the working tree file is read otherwise.
+    # Returns ({module: digest}, [(status, sidecar path)])
+    workbook = diff.VBAModules(data if data is not None else os.path.join(root, path), oid=oid,
+                               cache=ExtractionCache.from_environment(root))
+    digests = {name: digest for name, digest in workbook.digests.items() if is_safe_module_name(name)}
+    changes = []
+    for name, digest in digests.items():
+        file_path = sidecar_path(path, name)
+        if previous.get(name) == digest and os.path.exists(os.path.join(root, file_path)):
+            continue
+        existed = os.path.exists(os.path.join(root, file_path))
+        if write_file(os.path.join(root, file_path), (workbook.source(name) + '\n').encode('utf-8')):
+            changes.append(('M' if existed else 'A', file_path))
+    removed = [sidecar_path(path, name) for name in previous if name not in digests and is_safe_module_name(name)]
+    remove_files(root, removed)
+    changes.extend(('D', file_path) for file_path in removed)
+    return digests, changes
+
+
+def export(root, manifest_path=None, paths=None, jobs=None, staged=False):
+    # exports the workbooks of the working tree, or only `paths`, and returns [(status, sidecar path)].
+    # staged: `paths` are exported as they are in the index, like the pre-commit hook commits them
+    previous = load(manifest_path) if manifest_path else {}
+    workbooks = dict(previous)
+    blobs = index_blobs(root, paths) if staged else None
+    listed = sorted(blobs) if staged else list_workbooks(root)
+    if paths is not None:
+        paths = set(paths)
+        listed = [path for path in listed if path in paths]
+    stale = []
+    changes = []
+    for path in listed:
+        if staged:
+            # the working tree may differ, the next export compares the modules again
+            stale.append((path, None))
+            continue
+        try:
+            stat = fingerprint(os.path.join(root, path))
+        except OSError:
+            # deleted from the working tree but still in the index
+            continue
+        entry = previous.get(path)
+        if entry is not None and entry['stat'] == stat and \
+                all(os.path.exists(os.path.join(root, sidecar_path(path, name))) for name in entry['modules']):
+            continue
+        stale.append((path, stat))
+    for path in previous:
+        exists = path in blobs if staged else os.path.exists(os.path.join(root, path))
+        if (paths is None or path in paths) and not exists:
+            # the workbook is gone, so are its modules
+            removed = [sidecar_path(path, name) for name in previous[path]['modules'] if is_safe_module_name(name)]
+            remove_files(root, removed)
+            changes.extend(('D', file_path) for file_path in removed)
+            del workbooks[path]
+
+    if stale:
+        jobs = min(jobs or os.cpu_count() or 1, len(stale))
+        arguments = [(root, path, previous[path]['modules'] if path in previous else {}) for path, _ in stale]
+        if staged:
+            with CatFile(root) as cat_file:
+                arguments = [argument + (cat_file.read(blobs[argument[1]]), blobs[argument[1]])
+                             for argument in arguments]
+        if jobs == 1:
+            # a single saved workbook in watch mode is not worth a worker process
+            results = [export_workbook(*argument) for argument in arguments]
+        else:
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                results = list(pool.map(export_workbook, *zip(*arguments)))
+        for (path, stat), (modules, workbook_changes) in zip(stale, results):
+            workbooks[path] = {'stat': stat, 'modules': modules}
+            changes.extend(workbook_changes)
+    if manifest_path and (stale or workbooks != previous):
+        save(manifest_path, workbooks)
+    return changes
+
+
+def index_blobs(root, paths):
+    # {path: blob oid} of the workbooks among `paths` that are in the index
+    if not paths:
+        return {}
+    output = subprocess.run(['git', '--literal-pathspecs', 'ls-files', '-s', '-z', '--'] + sorted(paths), cwd=root,
+                            stdout=subprocess.PIPE, check=True).stdout
+    blobs = {}
+    for record in output.decode('utf-8').split('\0'):
+        if record:
+            info, _, path = record.partition('\t')
+            blobs[path] = info.split(' ')[1]
+    return blobs
+
+
+def staged_workbooks(root):
+    # workbooks that are added, modified or deleted in the index
+    output = subprocess.run(['git', 'diff', '--cached', '--name-only', '-z', '--no-renames'], cwd=root,
+                            stdout=subprocess.PIPE, check=True).stdout
+    return sorted({path for path in output.decode('utf-8').split('\0') if path and is_workbook(path)})
+
+
+def print_changes(changes, out):
+    for status, path in changes:
+        out.write(f'{status} {path}\n')
+    out.flush()
+
+
+class Inotify:
+    # the working tree's directories watched with inotify through ctypes, Linux only
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_ISDIR = 0x40000000
+    MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+    def __init__(self, libc, fd):
+        self.libc = libc
+        self.fd = fd
+        self.directories = {}
+
+    @classmethod
+    def create(cls):
+        # None where inotify is not available
+        if not sys.platform.startswith('linux'):
+            return None
+        import ctypes
+        import ctypes.util
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+            fd = libc.inotify_init1(os.O_CLOEXEC)
+        except (OSError, AttributeError):
+            return None
+        return cls(libc, fd) if fd >= 0 else None
+
+    def add_tree(self, top):
+        for directory, subdirectories, _ in os.walk(top):
+            subdirectories[:] = [name for name in subdirectories
+                                 if name != '.git' and not name.endswith(SIDECAR_SUFFIX)]
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), self.MASK)
+            if wd >= 0:
+                self.directories[wd] = directory
+
+    def read(self, timeout):
+        # the paths that changed within timeout seconds
+        import select
+        import struct
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        data = os.read(self.fd, 65536)
+        paths = []
+        offset = 0
+        while offset + 16 <= len(data):
+            wd, mask, _, length = struct.unpack_from('iIII', data, offset)
+            name = os.fsdecode(data[offset + 16:offset + 16 + length].rstrip(b'\0'))
+            offset += 16 + length
+            directory = self.directories.get(wd)
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, name)
+            if mask & self.IN_ISDIR:
+                if mask & self.IN_CREATE and not name.endswith(SIDECAR_SUFFIX):
+                    self.add_tree(path)
+            else:
+                paths.append(path)
+        return paths
+
+    def close(self):
+        os.close(self.fd)
+
+
+def poll(root):
+    stats = {}
+    for path in list_workbooks(root):
+        try:
+            stats[path] = fingerprint(os.path.join(root, path))
+        except OSError:
+            pass
+    return stats
+
+
+def watch(root, manifest_path=None, jobs=None, delay=DEFAULT_DELAY, out=None):
+    # exports the working tree, then every workbook `delay` seconds after it was last written; runs until
+    # interrupted. Without inotify the workbooks' stat info is polled instead
+    out = out or sys.stdout
+    print_changes(export(root, manifest_path, jobs=jobs), out)
+    watcher = Inotify.create()
+    if watcher is not None:
+        watcher.add_tree(root)
+    stats = poll(root) if watcher is None else None
+    pending = {}
+    try:
+        while True:
+            if watcher is not None:
+                for path in watcher.read(delay if pending else None):
+                    path = os.path.relpath(path, root).replace(os.sep, '/')
+                    if is_workbook(path):
+                        pending[path] = time.monotonic()
+            else:
+                time.sleep(POLL_INTERVAL)
+                current = poll(root)
+                for path in set(current) | set(stats):
+                    if current.get(path) != stats.get(path):
+                        pending[path] = time.monotonic()
+                stats = current
+            due = sorted(path for path, changed in pending.items() if time.monotonic() - changed >= delay)
+            if due:
+                for path in due:
+                    del pending[path]
+                try:
+                    print_changes(export(root, manifest_path, paths=due, jobs=jobs), out)
+                except Exception as exception:
+                    # a workbook that is still being written is exported with the next change
+                    out.write(f'Error: {exception}\n')
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if watcher is not None:
+            watcher.close()
+
+
+def run(paths=None, staged=False, watching=False, jobs=None, out=None, path=None):
+    out = out or sys.stdout
+    root, manifest_path = subprocess.run(['git', 'rev-parse', '--show-toplevel', '--git-path', 'xl/export.json'],
+                                         cwd=path, stdout=subprocess.PIPE, universal_newlines=True,
+                                         encoding='utf-8', check=True).stdout.strip().split('\n')
+    manifest_path = os.path.join(path or os.getcwd(), manifest_path)
+    if watching:
+        return watch(root, manifest_path, jobs=jobs, out=out)
+    if staged:
+        paths = staged_workbooks(root)
+        if not paths:
+            return
+    elif paths:
+        paths = [os.path.relpath(os.path.abspath(workbook), root).replace(os.sep, '/') for workbook in paths]
+    changes = export(root, manifest_path, paths=paths or None, jobs=jobs, staged=staged)
+    print_changes(changes, out)
+    if staged:
+        # the pre-commit hook commits the exported modules together with their workbooks; git add fails on
+        # directories that neither exist nor are tracked
+        removed = {file_path.rsplit('/', 1)[0] for status, file_path in changes if status == 'D'}
+        directories = [workbook + SIDECAR_SUFFIX for workbook in paths
+                       if os.path.isdir(os.path.join(root, workbook + SIDECAR_SUFFIX)) or
+                       workbook + SIDECAR_SUFFIX in removed]
+        if directories:
+            subprocess.run(['git', 'add', '-A', '--'] + directories, cwd=root, check=True)
@@ -0,0 +1,67 @@
+import os
+import sys
+import glob
+from concurrent.futures import ThreadPoolExecutor
+
+from cli import Installer
+
+
+# git xl installed into, or verified in, many repositories at once:
+#   git xl install --local --repos 'C:/build/*' -j 16
+#   git xl verify --repos repos.txt
+# every repository costs one `git config` call and a read of its .gitattributes and .gitignore; files that are
+# already up to date are not written again
+
+
+def list_repositories(spec):
+    # a file with one repository per line, or a glob pattern
+    if os.path.isfile(spec):
+        with open(spec, 'r', encoding='utf-8') as f:
+            lines = [line.strip() for line in f]
+        base = os.path.dirname(os.path.abspath(spec))
+        paths = [os.path.join(base, os.path.expanduser(line)) for line in lines
+                 if line and not line.startswith('#')]
+    else:
+        paths = [path for path in glob.glob(os.path.expanduser(spec), recursive=True) if os.path.isdir(path)]
+    return sorted({os.path.normpath(os.path.abspath(path)) for path in paths})
+
+
+def install_repository(path, textconv=False, hook=False):
+    # returns (status, detail): installed, unchanged or error
+    try:
+        installer = Installer(mode='local', path=path, textconv=textconv, hook=hook)
+        if not installer.verify():
+            return 'unchanged', None
+        installer.install()
+    except (ValueError, OSError) as e:
+        return 'error', str(e)
+    return 'installed', None
+
+
+def verify_repository(path, textconv=False, hook=False):
+    # returns (status, detail): ok, failed or error
+    try:
+        problems = Installer(mode='local', path=path, textconv=textconv, hook=hook).verify()
+    except (ValueError, OSError) as e:
+        return 'error', str(e)
+    return ('failed', '; '.join(problems)) if problems else ('ok', None)
+
+
+def run(spec, verifying=False, textconv=False, hook=False, jobs=None, out=None):
+    # prints one line per repository and a summary, returns 1 if any repository failed
+    out = out or sys.stdout
+    repositories = list_repositories(spec)
+    if not repositories:
+        out.write(f'No repositories match "{spec}"\n')
+        return 1
+    function = verify_repository if verifying else install_repository
+    # the work is waiting for git and the file system, so threads are enough
+    with ThreadPoolExecutor(max_workers=jobs or min(32, (os.cpu_count() or 1) * 4)) as pool:
+        results = pool.map(lambda path: function(path, textconv, hook), repositories)
+        counts = {}
+        for path, (status, detail) in zip(repositories, results):
+            counts[status] = counts.get(status, 0) + 1
+            out.write(f'{status:<9} {path}{": " + detail if detail else ""}\n')
+            out.flush()
+    out.write(', '.join(f'{count} {status}' for status, count in sorted(counts.items())) + '\n')
+    return 1 if counts.get('error') or counts.get('failed') else 0
@@ -0,0 +1,244 @@
+import os
+import re
+import stat
+import subprocess
+
+from cache import find_git_dir
+
+
+SECTION_HEADER = re.compile(r'^\s*\[\s*([A-Za-z0-9.-]+)(?:\s+"((?:[^"\\]|\\.)*)")?\s*\]\s*([#;].*)?$')
+VARIABLE = re.compile(r'^\s*([A-Za-z][A-Za-z0-9-]*)\s*(=|$)')
+
+
+class UnsupportedConfigFile(Exception):
+    pass
+
+
+def split_key(key):
+    # 'diff.xl.command' -> ('diff', 'xl', 'command'), section and variable names are case-insensitive
+    section, _, name = key.rpartition('.')
+    section, _, subsection = section.partition('.')
+    return section.lower(), subsection or None, name.lower()
+
+
+def normalize_key(key):
+    # the spelling `git config --list` uses: only the subsection keeps its case
+    section, subsection, name = split_key(key)
+    return f'{section}.{subsection}.{name}' if subsection is not None else f'{section}.{name}'
+
+
+def quote_value(value):
+    value = value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n').replace('\t', '\\t')
+    if value != value.strip() or '#' in value or ';' in value:
+        return f'"{value}"'
+    return value
+
+
+def format_section(section, subsection):
+    if subsection is None:
+        return f'[{section}]'
+    subsection = subsection.replace('\\', '\\\\').replace('"', '\\"')
+    return f'[{section} "{subsection}"]'
+
+
+class GitConfig:
+    # snapshot of the whole git configuration read with a single `git config` call; lookups are answered
+    # from memory and changes are queued and written to the config file in one go
+
+    def __init__(self, entries, path=None, is_repository=False):
+        # entries: (scope, origin, key, value) in the order git reads them
+        self.entries = entries
+        self.path = path
+        self.is_repository = is_repository
+        self.changes = []
+
+    @classmethod
+    def read(cls, path=None):
+        command = ['git', 'config', '--list', '--show-origin', '--show-scope', '-z']
+        cmd = subprocess.run(command, cwd=path, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if cmd.returncode == 0:
+            fields = cmd.stdout.decode('utf-8', 'replace').split('\0')
+            entries = []
+            for i in range(0, len(fields) - 2, 3):
+                key, _, value = fields[i + 2].partition('\n')
+                entries.append((fields[i], fields[i + 1], key, value))
+            # every repository has a local config file, so this doubles as `git rev-parse`
+            is_repository = any(scope == 'local' for scope, _, _, _ in entries)
+            return cls(entries, path=path, is_repository=is_repository)
+        return cls.read_without_scopes(path)
+
+    @classmethod
+    def read_without_scopes(cls, path=None):
+        # git before 2.26 has no --show-scope: tell the scopes apart by the files the values come from
+        cmd = subprocess.run(['git', 'config', '--list', '--show-origin', '-z'], cwd=path,
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        config = cls([], path=path)
+        git_dir = find_git_dir(path or os.getcwd())
+        local_path = os.path.normcase(os.path.join(git_dir, 'config')) if git_dir else None
+        global_path = os.path.normcase(os.path.abspath(config.file_path('global')))
+        fields = cmd.stdout.decode('utf-8', 'replace').split('\0')
+        for i in range(0, len(fields) - 1, 2):
+            key, _, value = fields[i + 1].partition('\n')
+            origin = fields[i]
+            file = os.path.normcase(os.path.abspath(os.path.join(path or '', origin[len('file:'):])))
+            scope = 'local' if file == local_path else 'global' if file == global_path else 'system'
+            config.entries.append((scope, origin, key, value))
+        config.is_repository = git_dir is not None
+        return config
+
+    def get_all(self, key, scope=None):
+        key = normalize_key(key)
+        return [value for entry_scope, _, entry_key, value in self.entries
+                if entry_key == key and (scope is None or entry_scope == scope)]
+
+    def get(self, key, scope=None, default=None):
+        values = self.get_all(key, scope)
+        return values[-1] if values else default
+
+    def has_section(self, section, scope=None):
+        prefix = section.lower() + '.'
+        return any(key.startswith(prefix) for entry_scope, _, key, _ in self.entries
+                   if scope is None or entry_scope == scope)
+
+    def file_path(self, scope):
+        # the file git itself would write to for `git config --<scope>`
+        if scope == 'local':
+            git_dir = find_git_dir(self.path or os.getcwd())
+            return os.path.join(git_dir, 'config') if git_dir else None
+        if os.environ.get('GIT_CONFIG_GLOBAL'):
+            return os.environ['GIT_CONFIG_GLOBAL']
+        # like git: ~/.gitconfig whenever it exists, the XDG file only when it exists and ~/.gitconfig does not
+        home = os.environ.get('HOME') or os.path.expanduser('~')
+        path = os.path.join(home, '.gitconfig')
+        xdg_path = os.path.join(os.environ.get('XDG_CONFIG_HOME') or os.path.join(home, '.config'), 'git', 'config')
+        if not os.path.exists(path) and os.path.exists(xdg_path):
+            return xdg_path
+        return path
+
+    def set(self, key, value, scope):
+        if self.get(key, scope) == value:
+            return
+        self.changes.append(('set', scope, key, value))
+        self.entries.append((scope, None, normalize_key(key), value))
+
+    def unset(self, key, scope):
+        if not self.get_all(key, scope):
+            return
+        self.changes.append(('unset', scope, key, None))
+        self.entries = [entry for entry in self.entries if not (entry[0] == scope and entry[2] == normalize_key(key))]
+
+    def remove_section(self, section, scope):
+        if not self.has_section(section, scope):
+            return
+        self.changes.append(('remove-section', scope, section, None))
+        prefix = section.lower() + '.'
+        self.entries = [entry for entry in self.entries if not (entry[0] == scope and entry[2].startswith(prefix))]
+
+    def write(self):
+        # one locked rewrite per config file, falling back to one `git config` call per change
+        # for files this editor does not understand
+        changes, self.changes = self.changes, []
+        for scope in sorted({change[1] for change in changes}):
+            scope_changes = [change for change in changes if change[1] == scope]
+            path = self.file_path(scope)
+            try:
+                if path is None:
+                    raise UnsupportedConfigFile('no config file')
+                write_config_file(path, scope_changes)
+            except (UnsupportedConfigFile, OSError):
+                for change in scope_changes:
+                    self.execute(change)
+
+    def execute(self, change):
+        operation, scope, key, value = change
+        command = ['git', 'config', f'--{scope}']
+        if operation == 'set':
+            command += [key, value]
+        else:
+            command += [f'--{operation}', key]
+        subprocess.run(command, cwd=self.path, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+def write_config_file(path, changes):
+    # same locking protocol as git: the new content is written to <path>.lock and renamed over the file.
+    # Like git, a symlinked config (dotfiles) is written through the link and keeps its permissions
+    path = os.path.realpath(path)
+    lock_path = path + '.lock'
+    fd = os.open(lock_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    try:
+        try:
+            with open(path, 'r', encoding='utf-8', newline='') as f:
+                lines = f.read().splitlines(keepends=True)
+                mode = stat.S_IMODE(os.fstat(f.fileno()).st_mode)
+        except FileNotFoundError:
+            lines = []
+            mode = None
+        for operation, _, key, value in changes:
+            lines = apply_change(lines, operation, key, value)
+        with os.fdopen(fd, 'w', encoding='utf-8', newline='') as f:
+            fd = None
+            f.writelines(lines)
+        if mode is not None:
+            os.chmod(lock_path, mode)
+        os.replace(lock_path, path)
+    except BaseException:
+        if fd is not None:
+            os.close(fd)
+        os.remove(lock_path)
+        raise
+
+
+def parse_lines(lines):
+    # yields (section, subsection, variable name or None) for every line
+    section = subsection = None
+    for line in lines:
+        if line.rstrip('\r\n').endswith('\\'):
+            raise UnsupportedConfigFile('continuation line')
+        stripped = line.strip()
+        if stripped.startswith('['):
+            match = SECTION_HEADER.match(line.rstrip('\r\n'))
+            if not match:
+                raise UnsupportedConfigFile(f'unsupported section header: {stripped}')
+            section, subsection = match.group(1).lower(), match.group(2)
+            if subsection is None and '.' in section:
+                # deprecated [section.subsection] syntax
+                section, _, subsection = section.partition('.')
+            elif subsection is not None:
+                subsection = re.sub(r'\\(.)', r'\1', subsection)
+            yield section, subsection, None
+        elif not stripped or stripped[0] in '#;':
+            yield section, subsection, None
+        else:
+            match = VARIABLE.match(line)
+            if not match:
+                raise UnsupportedConfigFile(f'unsupported line: {stripped}')
+            yield section, subsection, match.group(1).lower()
+
+
+def apply_change(lines, operation, key, value):
+    parsed = list(parse_lines(lines))
+    newline = '\r\n' if lines and lines[0].endswith('\r\n') else '\n'
+    if operation == 'remove-section':
+        section, _, subsection = key.partition('.')
+        section, subsection = section.lower(), subsection or None
+        return [line for line, (line_section, line_subsection, _) in zip(lines, parsed)
+                if (line_section, line_subsection) != (section, subsection)]
+
+    section, subsection, name = split_key(key)
+    matches = [i for i, parsed_line in enumerate(parsed) if parsed_line == (section, subsection, name)]
+    if len(matches) > 1:
+        raise UnsupportedConfigFile(f'{key} has multiple values')
+    if operation == 'unset':
+        return [line for i, line in enumerate(lines) if i not in matches]
+
+    variable = f'\t{name} = {quote_value(value)}{newline}'
+    if matches:
+        return lines[:matches[0]] + [variable] + lines[matches[0] + 1:]
+    in_section = [i for i, (line_section, line_subsection, line_name) in enumerate(parsed)
+                  if (line_section, line_subsection) == (section, subsection)
+                  and (line_name is not None or lines[i].strip().startswith('['))]
+    if in_section:
+        return lines[:in_section[-1] + 1] + [variable] + lines[in_section[-1] + 1:]
+    if lines and not lines[-1].endswith('\n'):
+        lines = lines[:-1] + [lines[-1] + newline]
+    return lines + [format_section(section, subsection) + newline, variable]
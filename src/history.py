@@ -0,0 +1,267 @@
+import os
+import sys
+import hashlib
+import sqlite3
+import subprocess
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import diff
+from batch import CatFile, is_workbook
+from cache import ExtractionCache, find_git_dir
+from cli import FILE_EXTENSIONS
+
+
+# history of the VBA modules of every workbook, one row per commit that changed a module:
+#   git xl index
+#   git xl log Model.xlsm/Pricing
+# 2: modules are identified by a hash of their text, the same whichever parser decoded them
+INDEX_VERSION = 2
+COMMIT_INTERVAL = 100
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS commits (
+    id INTEGER PRIMARY KEY,
+    oid TEXT NOT NULL UNIQUE,
+    time INTEGER NOT NULL,
+    author TEXT NOT NULL,
+    subject TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tips (
+    oid TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS sources (
+    hash TEXT PRIMARY KEY,
+    lines INTEGER NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS changes (
+    commit_id INTEGER NOT NULL REFERENCES commits (id),
+    path TEXT NOT NULL,
+    module TEXT NOT NULL,
+    hash TEXT REFERENCES sources (hash),
+    old_hash TEXT REFERENCES sources (hash)
+);
+CREATE INDEX IF NOT EXISTS changes_module ON changes (path, module);
+"""
+
+
+class HistoryIndex:
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        version = self.connection.execute('PRAGMA user_version').fetchone()[0]
+        if version not in (0, INDEX_VERSION):
+            # written by another version of git xl: start over
+            self.connection.close()
+            os.remove(path)
+            self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+        self.connection.execute(f'PRAGMA user_version = {INDEX_VERSION}')
+
+    @classmethod
+    def from_repository(cls, cwd=None, create=True):
+        git_dir = find_git_dir(cwd or os.getcwd())
+        if git_dir is None:
+            return None
+        path = os.path.join(git_dir, 'xl', 'history.sqlite')
+        if not create and not os.path.exists(path):
+            return None
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return cls(path)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def tips(self):
+        return [oid for oid, in self.connection.execute('SELECT oid FROM tips')]
+
+    def is_indexed(self, oid):
+        return self.connection.execute('SELECT 1 FROM commits WHERE oid = ?', (oid,)).fetchone() is not None
+
+    def add_commit(self, commit, results):
+        # results: (path, [(module, hash, old hash)], {hash: source}) per workbook
+        cursor = self.connection.execute('INSERT INTO commits (oid, time, author, subject) VALUES (?, ?, ?, ?)',
+                                         (commit['oid'], commit['time'], commit['author'], commit['subject']))
+        for path, changes, sources in results:
+            for hash, source in sources.items():
+                self.connection.execute('INSERT OR IGNORE INTO sources (hash, lines, text) VALUES (?, ?, ?)',
+                                        (hash, len(source.split('\n')), source))
+            for name, hash, old_hash in changes:
+                self.connection.execute(
+                    'INSERT INTO changes (commit_id, path, module, hash, old_hash) VALUES (?, ?, ?, ?, ?)',
+                    (cursor.lastrowid, path, name, hash, old_hash))
+
+    def update(self, root, jobs=None):
+        # indexes the commits that are reachable from the branches, tags and remote branches but not from the
+        # tips of the previous run, parents before children. The tips are only stored once the walk succeeded
+        jobs = jobs or os.cpu_count() or 1
+        tips = current_tips(root)
+        indexed = 0
+        with CatFile(root) as cat_file, ProcessPoolExecutor(max_workers=jobs) as pool:
+            pending = deque()
+            for commit in walk(root, self.tips()):
+                if self.is_indexed(commit['oid']):
+                    # left over from an interrupted run
+                    continue
+                pending.append((commit, [(change['path'], submit(pool, cat_file, change))
+                                         for change in commit['changes']]))
+                if len(pending) >= 2 * jobs:
+                    self.add_commit(*collect(*pending.popleft()))
+                    indexed += 1
+                    if indexed % COMMIT_INTERVAL == 0:
+                        self.connection.commit()
+            while pending:
+                self.add_commit(*collect(*pending.popleft()))
+                indexed += 1
+        self.connection.execute('DELETE FROM tips')
+        self.connection.executemany('INSERT INTO tips (oid) VALUES (?)', [(oid,) for oid in tips])
+        self.connection.commit()
+        return indexed
+
+    def log(self, path, module):
+        # newest first
+        return self.connection.execute(
+            'SELECT commits.oid, commits.time, commits.author, commits.subject, changes.hash, changes.old_hash '
+            'FROM changes JOIN commits ON commits.id = changes.commit_id '
+            'WHERE changes.path = ? AND changes.module = ? ORDER BY commits.id DESC', (path, module)).fetchall()
+
+    def modules(self, path):
+        return [module for module, in self.connection.execute(
+            'SELECT DISTINCT module FROM changes WHERE path = ? ORDER BY module', (path,))]
+
+    def source(self, hash):
+        if hash is None:
+            return None
+        row = self.connection.execute('SELECT text FROM sources WHERE hash = ?', (hash,)).fetchone()
+        return row[0] if row else None
+
+
+def revisions(root):
+    # the refs that are indexed; HEAD is left out while the current branch has no commits yet
+    has_head = subprocess.run(['git', 'rev-parse', '--verify', '-q', 'HEAD'], cwd=root, stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL).returncode == 0
+    return ['--branches', '--tags', '--remotes'] + (['HEAD'] if has_head else [])
+
+
+def current_tips(root):
+    output = subprocess.run(['git', 'rev-parse'] + revisions(root), cwd=root, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, universal_newlines=True, check=True).stdout
+    return sorted(set(output.split()))
+
+
+def walk(root, exclude):
+    # one `git log` lists every new commit with the raw changes of its workbooks, merges are compared to their
+    # first parent; previous tips are passed on stdin, there may be thousands of them
+    command = ['git', 'log', '--stdin', '--ignore-missing', '--topo-order', '--reverse', '--full-history',
+               '--diff-merges=first-parent', '--raw', '-z', '--no-abbrev', '--no-renames',
+               '--format=%x01%H%x00%at%x00%an%x00%s'] + revisions(root) + ['--']
+    command += [f':(icase)*.{extension}' for extension in FILE_EXTENSIONS]
+    # raises CalledProcessError with git's message, for example a corrupt object or a git without
+    # --diff-merges (before 2.31), so that update() does not record the history as indexed
+    process = subprocess.run(command, cwd=root, input=''.join(f'^{oid}\n' for oid in exclude).encode('utf-8'),
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    for record in process.stdout.decode('utf-8', 'replace').split('\x01')[1:]:
+        fields = record.split('\0')
+        oid, time, author, subject = fields[:4]
+        changes = []
+        for i in range(4, len(fields) - 1, 2):
+            raw = fields[i].lstrip('\n')
+            if not raw.startswith(':'):
+                continue
+            _, _, oid_a, oid_b, status = raw[1:].split(' ')
+            path = fields[i + 1]
+            if is_workbook(path):
+                changes.append({'path': path, 'status': status, 'oid_a': oid_a, 'oid_b': oid_b})
+        yield {'oid': oid, 'time': int(time), 'author': author, 'subject': subject, 'changes': changes}
+
+
+def source_hash(source):
+    return hashlib.sha1(source.encode('utf-8')).hexdigest()
+
+
+def extract(workbook_a, oid_a, workbook_b, oid_b):
+    # runs in a worker process: only the modules whose stream digests differ are decoded, the old versions
+    # usually from the extraction cache. The index identifies them by a hash of their text, which unlike the
+    # digests does not depend on the parser. Returns ([(module, hash, old hash)], {hash: source})
+    cache = ExtractionCache.from_environment()
+    modules_a = diff.VBAModules(workbook_a, oid=oid_a, cache=cache)
+    modules_b = diff.VBAModules(workbook_b, oid=oid_b, cache=cache)
+    changes = []
+    sources = {}
+    names = list(modules_a.digests) + [name for name in modules_b.digests if name not in modules_a.digests]
+    for name in names:
+        if modules_a.digests.get(name) == modules_b.digests.get(name):
+            continue
+        hashes = []
+        for modules in (modules_a, modules_b):
+            if name in modules.digests:
+                source = modules.source(name)
+                sources[source_hash(source)] = source
+                hashes.append(source_hash(source))
+            else:
+                hashes.append(None)
+        if hashes[0] != hashes[1]:
+            changes.append((name,) + tuple(hashes))
+    return changes, sources
+
+
+def submit(pool, cat_file, change):
+    # diff.py calls the new version workbook_a
+    new = cat_file.read(change['oid_b']) if change['status'] != 'D' else None
+    old = cat_file.read(change['oid_a']) if change['status'] != 'A' else None
+    return pool.submit(extract, new, change['oid_b'], old, change['oid_a'])
+
+
+def collect(commit, futures):
+    return commit, [(path,) + future.result() for path, future in futures]
+
+
+def split_module_path(module_path):
+    # "Model.xlsm/Pricing" or "Model.xlsm/VBA/Pricing", as printed by git xl diff
+    workbook, _, module = module_path.rpartition('/')
+    if workbook.endswith('/VBA'):
+        workbook = workbook[:-len('/VBA')]
+    return workbook, module
+
+
+def print_log(index, workbook, module, out, patch=False, numlines=3, color=True):
+    import time
+    colors = diff.get_colors(color)
+    for oid, commit_time, author, subject, hash, old_hash in index.log(workbook, module):
+        status = ' (new module)' if old_hash is None else ' (deleted module)' if hash is None else ''
+        date = time.strftime('%Y-%m-%d', time.localtime(commit_time))
+        out.write(f'{colors["commit"]}{oid[:7]}{colors["reset"]} {date} {author} {subject}{status}\n')
+        if patch:
+            new = {module: index.source(hash)} if hash is not None else {}
+            old = {module: index.source(old_hash)} if old_hash is not None else {}
+            if None in new.values() or None in old.values():
+                out.write(f'(the source of {module} in this commit is missing from the index)\n')
+                continue
+            diff.print_diffs(workbook, diff.diff_modules(workbook, new, old, numlines), out, color)
+
+
+def run(module_path, out=None, patch=False, numlines=3, color=True):
+    out = out or sys.stdout
+    workbook, module = split_module_path(module_path)
+    index = HistoryIndex.from_repository(create=False)
+    if index is None:
+        print('Error: no history index, run "git xl index" first', file=sys.stderr)
+        return 1
+    with index:
+        if not index.log(workbook, module):
+            modules = index.modules(workbook)
+            if modules:
+                print(f'No commits found for module "{module}", the index knows: {", ".join(modules)}', file=sys.stderr)
+            else:
+                print(f'No commits found for "{module_path}"', file=sys.stderr)
+            return 1
+        print_log(index, workbook, module, out, patch=patch, numlines=numlines, color=color)
+    return 0
@@ -0,0 +1,162 @@
+import time
+import signal
+import threading
+from contextlib import contextmanager
+
+from cache import get_int_env
+
+
+# git runs the diff driver synchronously: a corrupt or hostile workbook must not stall `git log -p`. Every limit
+# can be changed with its environment variable, 0 turns it off
+DEFAULT_MAX_SIZE = 512 * 1024 * 1024
+DEFAULT_MAX_VBA_SIZE = 64 * 1024 * 1024
+DEFAULT_MAX_LINES = 200000
+DEFAULT_TIMEOUT = 60
+# an address space limit also counts mapped workbooks and the interpreter itself, it is off unless configured
+DEFAULT_MAX_MEMORY = 0
+
+
+class LimitExceeded(BaseException):
+    # like KeyboardInterrupt, not an Exception: the timeout is raised inside whatever code runs, and oletools
+    # swallows `except Exception` around its parsing
+    pass
+
+
+def format_size(size):
+    return f'{size // (1024 * 1024)} MB' if size >= 1024 * 1024 else f'{size} bytes'
+
+
+class Limits:
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, max_vba_size=DEFAULT_MAX_VBA_SIZE, max_lines=DEFAULT_MAX_LINES,
+                 timeout=DEFAULT_TIMEOUT, max_memory=DEFAULT_MAX_MEMORY):
+        self.max_size = max_size
+        self.max_vba_size = max_vba_size
+        self.max_lines = max_lines
+        self.timeout = timeout
+        self.max_memory = max_memory
+        # (stop, start) of the running deadline, see paused()
+        self.timer = None
+
+    @classmethod
+    def from_environment(cls):
+        return cls(max_size=get_int_env('GIT_XL_MAX_SIZE', DEFAULT_MAX_SIZE),
+                   max_vba_size=get_int_env('GIT_XL_MAX_VBA_SIZE', DEFAULT_MAX_VBA_SIZE),
+                   max_lines=get_int_env('GIT_XL_MAX_LINES', DEFAULT_MAX_LINES),
+                   timeout=get_int_env('GIT_XL_TIMEOUT', DEFAULT_TIMEOUT),
+                   max_memory=get_int_env('GIT_XL_MAX_MEMORY', DEFAULT_MAX_MEMORY))
+
+    def check_size(self, size):
+        if self.max_size and size > self.max_size:
+            raise LimitExceeded(f'workbook is {format_size(size)}, '
+                                f'more than GIT_XL_MAX_SIZE ({format_size(self.max_size)})')
+
+    def check_vba_size(self, size):
+        if self.max_vba_size and size > self.max_vba_size:
+            raise LimitExceeded(f'VBA project is more than GIT_XL_MAX_VBA_SIZE ({format_size(self.max_vba_size)}) '
+                                f'decompressed')
+
+    def check_lines(self, modules):
+        if not self.max_lines:
+            return
+        for name, source in modules.items():
+            lines = source.count('\n') + 1
+            if lines > self.max_lines:
+                raise LimitExceeded(f'module {name} has {lines} lines, more than GIT_XL_MAX_LINES ({self.max_lines})')
+
+    @contextmanager
+    def guard(self):
+        # wall-clock timeout and address space limit for one workbook; both cost a system call when they are set
+        with self.memory_limit(), self.deadline():
+            try:
+                yield
+            except MemoryError:
+                raise LimitExceeded(f'out of memory (GIT_XL_MAX_MEMORY is {format_size(self.max_memory)})')
+
+    @contextmanager
+    def deadline(self):
+        if not self.timeout or threading.current_thread() is not threading.main_thread():
+            # signals and interrupts only reach the main thread
+            yield
+            return
+        message = f'took more than GIT_XL_TIMEOUT ({self.timeout}s)'
+        if hasattr(signal, 'setitimer'):
+            def expire(signum, frame):
+                raise LimitExceeded(message)
+
+            previous = signal.signal(signal.SIGALRM, expire)
+            signal.setitimer(signal.ITIMER_REAL, self.timeout)
+            self.timer = (lambda: signal.setitimer(signal.ITIMER_REAL, 0)[0],
+                          lambda remaining: signal.setitimer(signal.ITIMER_REAL, max(remaining, 0.001)))
+            try:
+                yield
+            finally:
+                self.timer = None
+                signal.setitimer(signal.ITIMER_REAL, 0)
+                signal.signal(signal.SIGALRM, previous)
+            return
+
+        # Windows has no SIGALRM: a watchdog thread interrupts the main thread instead
+        import _thread
+        expired = threading.Event()
+
+        def interrupt():
+            expired.set()
+            _thread.interrupt_main()
+
+        watchdog = None
+        end = 0
+
+        def start(remaining):
+            nonlocal watchdog, end
+            end = time.monotonic() + remaining
+            watchdog = threading.Timer(remaining, interrupt)
+            watchdog.daemon = True
+            watchdog.start()
+
+        def stop():
+            watchdog.cancel()
+            return end - time.monotonic()
+
+        start(self.timeout)
+        self.timer = (stop, start)
+        try:
+            yield
+        except KeyboardInterrupt:
+            if expired.is_set():
+                raise LimitExceeded(message)
+            raise
+        finally:
+            self.timer = None
+            watchdog.cancel()
+
+    @contextmanager
+    def paused(self):
+        # stops the clock of the running deadline, for time spent waiting on the reader of the output
+        timer = self.timer
+        if timer is None:
+            yield
+            return
+        stop, start = timer
+        remaining = stop()
+        try:
+            yield
+        finally:
+            start(remaining)
+
+    @contextmanager
+    def memory_limit(self):
+        try:
+            import resource
+        except ImportError:
+            resource = None
+        if not self.max_memory or resource is None:
+            yield
+            return
+        soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+        limit = self.max_memory if hard == resource.RLIM_INFINITY else min(self.max_memory, hard)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+        try:
+            yield
+        finally:
+            resource.setrlimit(resource.RLIMIT_AS, (soft, hard))
@@ -0,0 +1,28 @@
+import re
+
+
+# the structure of a VBA module: its procedures and the code between them
+PROCEDURE_START = re.compile(r'^\s*(?:(?:Public|Private|Friend)\s+)?(?:Static\s+)?'
+                             r'(?:Sub|Function|Property\s+(?:Get|Let|Set))\s+([A-Za-z_]\w*)', re.IGNORECASE)
+PROCEDURE_END = re.compile(r'^\s*End\s+(?:Sub|Function|Property)\b', re.IGNORECASE)
+
+
+def split_procedures(lines):
+    # (name, start, stop) for every Sub, Function and Property from its declaration to its End line, the lines
+    # between procedures (declarations, comments, blank lines) form blocks named None
+    blocks = []
+    name = None
+    start = 0
+    for i, line in enumerate(lines):
+        match = PROCEDURE_START.match(line)
+        if match:
+            # a procedure without End line ends where the next one starts
+            if i > start:
+                blocks.append((name, start, i))
+            name, start = match.group(1), i
+        elif name is not None and PROCEDURE_END.match(line):
+            blocks.append((name, start, i + 1))
+            name, start = None, i + 1
+    if len(lines) > start:
+        blocks.append((name, start, len(lines)))
+    return blocks
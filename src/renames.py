@@ -0,0 +1,180 @@
+import re
+import zlib
+import hashlib
+from collections import Counter
+
+
+# rename and copy detection between the added and the removed modules of a workbook, like git's -M and -C:
+# identical sources are paired by hash, similar ones by MinHash signatures so that only modules whose
+# signatures collide are compared, instead of every added module with every removed one
+DEFAULT_THRESHOLD = 0.5
+NUM_HASHES = 64
+MASK = (1 << 64) - 1
+SCORE = re.compile(r'^(\d+)(%?)$')
+
+
+def parse_score(text):
+    # same as git's -M<n>: "50%" is 50 percent, digits without % are a fraction, so "5" is 50% and "05" is 5%
+    if not text:
+        return DEFAULT_THRESHOLD
+    match = SCORE.match(text)
+    if not match:
+        raise ValueError(text)
+    if match.group(2):
+        return min(int(match.group(1)), 100) / 100
+    return float('0.' + match.group(1))
+
+
+def parse_option(arg, threshold=None, copies=False):
+    # -M[<n>], --find-renames[=<n>], -C[<n>], --find-copies[=<n>] and --no-renames, like git diff;
+    # returns None for other arguments and raises ValueError for an invalid score
+    for short, long, find_copies in (('-M', '--find-renames', False), ('-C', '--find-copies', True)):
+        if arg == long or arg.startswith(long + '='):
+            return parse_score(arg[len(long) + 1:]), copies or find_copies
+        if arg.startswith(short):
+            return parse_score(arg[len(short):]), copies or find_copies
+    if arg == '--no-renames':
+        return None, False
+    return None
+
+
+def features(source):
+    # the distinct non-blank lines of a module, indentation does not matter; the hash is stable across processes
+    # so that signatures can be stored, see scan.py
+    return {zlib.crc32(line.strip().encode('utf-8')) for line in source.split('\n') if line.strip()}
+
+
+def signature(lines):
+    # one permutation MinHash: a single pass spreads the line hashes over NUM_HASHES bins and keeps the smallest
+    # hash of every bin, instead of hashing every line NUM_HASHES times
+    if not lines:
+        return None
+    bins = [None] * NUM_HASHES
+    for line in lines:
+        index = line % NUM_HASHES
+        value = line // NUM_HASHES
+        if bins[index] is None or value < bins[index]:
+            bins[index] = value
+    # empty bins of short modules borrow the value of the next filled bin, offset by the distance to it
+    filled = [index for index, value in enumerate(bins) if value is not None]
+    for index in range(NUM_HASHES):
+        if bins[index] is None:
+            source = next((i for i in filled if i > index), filled[0])
+            bins[index] = bins[source] + ((source - index) % NUM_HASHES << 32)
+    return tuple(bins)
+
+
+def estimate(signature_a, signature_b):
+    # the share of equal bins estimates the Jaccard similarity of the line sets, reported like git's score
+    jaccard = sum(a == b for a, b in zip(signature_a, signature_b)) / NUM_HASHES
+    return 2 * jaccard / (1 + jaccard)
+
+
+def bands(key, rows):
+    return [(band, key[band:band + rows]) for band in range(0, NUM_HASHES, rows)]
+
+
+def band_rows(threshold):
+    # the score is the share of the larger module that both have in common: two modules of the same size with
+    # score s have a Jaccard similarity of s / (2 - s). Bands are made as long as possible while still catching
+    # 95% of those pairs
+    jaccard = threshold / (2 - threshold)
+    rows = 1
+    for candidate in (2, 4, 8):
+        if 1 - (1 - jaccard ** candidate) ** (NUM_HASHES // candidate) >= 0.95:
+            rows = candidate
+    return rows
+
+
+def candidates(sources, targets, threshold):
+    # pairs of (target, source) whose signatures share at least one band
+    rows = band_rows(threshold)
+    buckets = {}
+    for name, source in sources.items():
+        key = signature(features(source))
+        if key is not None:
+            for band in bands(key, rows):
+                buckets.setdefault(band, []).append(name)
+    pairs = set()
+    for name, target in targets.items():
+        key = signature(features(target))
+        if key is not None:
+            for band in bands(key, rows):
+                pairs.update((name, source) for source in buckets.get(band, ()))
+    return pairs
+
+
+def similar_pairs(signatures, threshold):
+    # pairs of keys of {key: signature} whose estimated similarity is at least threshold
+    rows = band_rows(threshold)
+    buckets = {}
+    for key, value in signatures.items():
+        for band in bands(value, rows):
+            buckets.setdefault(band, []).append(key)
+    pairs = set()
+    for keys in buckets.values():
+        for i, key_a in enumerate(keys):
+            for key_b in keys[i + 1:]:
+                if (key_a, key_b) not in pairs and estimate(signatures[key_a], signatures[key_b]) >= threshold:
+                    pairs.add((key_a, key_b))
+    return pairs
+
+
+def similarity(source, target):
+    # like git's similarity index: the characters of lines both versions have, relative to the larger one
+    lines_a, lines_b = Counter(source.split('\n')), Counter(target.split('\n'))
+    size_a = sum((len(line) + 1) * count for line, count in lines_a.items())
+    size_b = sum((len(line) + 1) * count for line, count in lines_b.items())
+    common = sum((len(line) + 1) * count for line, count in (lines_a & lines_b).items())
+    return common / max(size_a, size_b, 1)
+
+
+def find_renames(workbook_a_modules, workbook_b_modules, threshold=DEFAULT_THRESHOLD, copies=False):
+    # returns {new module: (old module, score, 'rename' or 'copy')}; workbook_a is the new version as in diff.py.
+    # Removed modules are renamed, with copies also modified modules are copied. Like git without
+    # --find-copies-harder, modules that did not change are not considered as sources
+    # only the sources that are needed are asked for, see diff.ReceivedModules
+    added = {name: workbook_a_modules[name] for name in workbook_a_modules if name not in workbook_b_modules}
+    removed = {name: workbook_b_modules[name] for name in workbook_b_modules if name not in workbook_a_modules}
+    sources = dict(removed)
+    if copies:
+        sources.update((name, workbook_b_modules[name]) for name in workbook_b_modules if name in workbook_a_modules)
+    if not added or not sources:
+        return {}
+
+    found = {}
+    renamed = set()
+
+    def pair(name, source, score):
+        if source in removed and source not in renamed:
+            renamed.add(source)
+            found[name] = (source, score, 'rename')
+        elif copies:
+            found[name] = (source, score, 'copy')
+
+    exact = {}
+    for source, text in sources.items():
+        # removed modules first: an exact match is a rename rather than a copy
+        key = hashlib.sha1(text.encode('utf-8')).digest()
+        if key not in exact or (source in removed and exact[key] not in removed):
+            exact[key] = source
+    for name, text in added.items():
+        source = exact.get(hashlib.sha1(text.encode('utf-8')).digest())
+        if source is not None:
+            pair(name, source, 1.0)
+
+    targets = {name: text for name, text in added.items() if name not in found}
+    if targets:
+        scored = []
+        for name, source in candidates(sources, targets, threshold):
+            size_a, size_b = len(sources[source]), len(targets[name])
+            if min(size_a, size_b) < threshold * max(size_a, size_b):
+                # the score can not be higher than the ratio of the sizes
+                continue
+            score = similarity(sources[source], targets[name])
+            if score >= threshold:
+                scored.append((-score, name, source))
+        for score, name, source in sorted(scored):
+            if name not in found:
+                pair(name, source, -score)
+    return found
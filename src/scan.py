@@ -0,0 +1,166 @@
+import os
+import sys
+import json
+import hashlib
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+
+import diff
+import renames
+from batch import is_workbook
+from cache import ExtractionCache, find_git_dir
+
+
+# inventory of identical and near-identical VBA modules across the workbooks of a working tree. The modules of
+# every workbook are kept in .git/xl/scan.json keyed on the workbook's stat info, so a rescan only extracts the
+# workbooks that changed since the last one
+SCAN_VERSION = 1
+DEFAULT_SIMILARITY = 0.8
+
+
+def list_workbooks(root):
+    # tracked and untracked workbooks, without ignored files
+    output = subprocess.run(['git', 'ls-files', '-z', '--cached', '--others', '--exclude-standard'], cwd=root,
+                            stdout=subprocess.PIPE, check=True).stdout
+    return sorted({path for path in output.decode('utf-8').split('\0') if path and is_workbook(path)})
+
+
+def fingerprint(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns, st.st_ino]
+
+
+def scan_workbook(path):
+    # runs in a worker process: {module: [content hash, lines, MinHash signature]}
+    workbook = diff.VBAModules(path, cache=ExtractionCache.from_environment(os.path.dirname(path)))
+    modules = {}
+    for name, source in workbook.items():
+        if not any(line.strip() and not line.strip().lower().startswith('option ') for line in source.split('\n')):
+            # empty sheet and workbook modules are the same everywhere
+            continue
+        modules[name] = [hashlib.sha1(source.encode('utf-8')).hexdigest(), source.count('\n') + 1,
+                         list(renames.signature(renames.features(source)))]
+    return modules
+
+
+def load(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return state.get('workbooks', {}) if state.get('version') == SCAN_VERSION else {}
+
+
+def save(path, workbooks):
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': SCAN_VERSION, 'workbooks': workbooks}, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+    except OSError:
+        # like the extraction cache, the scan state is an optimisation only
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def scan(root, jobs=None, state_path=None):
+    # returns {workbook path: {module: [hash, lines, signature]}} for every workbook of the working tree
+    previous = load(state_path) if state_path else {}
+    workbooks = {}
+    stale = []
+    for path in list_workbooks(root):
+        try:
+            stat = fingerprint(os.path.join(root, path))
+        except OSError:
+            # deleted from the working tree but still in the index
+            continue
+        entry = previous.get(path)
+        if entry is not None and entry['stat'] == stat:
+            workbooks[path] = entry
+        else:
+            stale.append((path, stat))
+
+    if stale:
+        jobs = jobs or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=min(jobs, len(stale))) as pool:
+            results = pool.map(scan_workbook, [os.path.join(root, path) for path, _ in stale])
+            for (path, stat), modules in zip(stale, results):
+                workbooks[path] = {'stat': stat, 'modules': modules}
+    if state_path and (stale or len(workbooks) != len(previous)):
+        save(state_path, workbooks)
+    return {path: entry['modules'] for path, entry in workbooks.items()}
+
+
+def find_duplicates(workbooks, similarity=DEFAULT_SIMILARITY):
+    # groups modules by content hash, then joins the hashes whose signatures are at least `similarity` alike;
+    # only groups of two or more modules are returned, largest first
+    variants = {}
+    signatures = {}
+    for path, modules in workbooks.items():
+        for name, (content_hash, lines, signature) in modules.items():
+            variant = variants.setdefault(content_hash, {'hash': content_hash, 'lines': lines, 'modules': []})
+            variant['modules'].append({'workbook': path, 'module': name})
+            signatures[content_hash] = tuple(signature)
+
+    # union-find over similar variants
+    parents = {content_hash: content_hash for content_hash in variants}
+
+    def find(content_hash):
+        while parents[content_hash] != content_hash:
+            parents[content_hash] = parents[parents[content_hash]]
+            content_hash = parents[content_hash]
+        return content_hash
+
+    for hash_a, hash_b in renames.similar_pairs(signatures, similarity):
+        parents[find(hash_a)] = find(hash_b)
+
+    clusters = {}
+    for content_hash, variant in variants.items():
+        clusters.setdefault(find(content_hash), []).append(variant)
+    groups = []
+    for members in clusters.values():
+        if sum(len(variant['modules']) for variant in members) < 2:
+            continue
+        # the most widespread version comes first, the others are compared with it
+        members.sort(key=lambda variant: (-len(variant['modules']), variant['hash']))
+        first = members[0]
+        for variant in members[1:]:
+            variant['similarity'] = round(renames.estimate(signatures[first['hash']], signatures[variant['hash']]), 2)
+        groups.append({'modules': sum(len(variant['modules']) for variant in members), 'variants': members})
+    groups.sort(key=lambda group: (-group['modules'], group['variants'][0]['hash']))
+    return groups
+
+
+def print_groups(groups, out, color=True):
+    colors = diff.get_colors(color)
+    for group in groups:
+        variants = group['variants']
+        if len(variants) == 1:
+            title = f'{group["modules"]} identical modules'
+        else:
+            title = f'{group["modules"]} modules in {len(variants)} versions'
+        out.write(colors['header'] + title + colors['reset'] + '\n')
+        for variant in variants:
+            similarity = f' ({int(variant["similarity"] * 100)}% similar)' if 'similarity' in variant else ''
+            for module in variant['modules']:
+                out.write(f'  {colors["commit"]}{variant["hash"][:7]}{colors["reset"]} {variant["lines"]:>5} lines  '
+                          f'{module["workbook"]}/{module["module"]}{similarity}\n')
+        out.write('\n')
+
+
+def run(jobs=None, similarity=DEFAULT_SIMILARITY, output_format='text', color=True, out=None, path=None):
+    out = out or sys.stdout
+    root = subprocess.run(['git', 'rev-parse', '--show-toplevel'], cwd=path, stdout=subprocess.PIPE,
+                          universal_newlines=True, encoding='utf-8', check=True).stdout.strip()
+    git_dir = find_git_dir(root)
+    state_path = os.path.join(git_dir, 'xl', 'scan.json') if git_dir is not None else None
+    workbooks = scan(root, jobs=jobs, state_path=state_path)
+    groups = find_duplicates(workbooks, similarity)
+    if output_format == 'json':
+        json.dump({'workbooks': len(workbooks), 'modules': sum(len(modules) for modules in workbooks.values()),
+                   'groups': groups}, out, indent=2)
+        out.write('\n')
+    else:
+        print_groups(groups, out, color)
@@ -0,0 +1,94 @@
+import io
+import os
+import tempfile
+import subprocess
+import batch
+from unittest import TestCase, mock
+from tests.test_cells import make_xlsx
+
+OID_A = 'a' * 40
+OID_B = 'b' * 40
+NULL_OID = '0' * 40
+
+
+class TestChangedWorkbooks(TestCase):
+
+    @mock.patch('batch.subprocess.run')
+    def test_parses_raw_output(self, mock_run):
+        mock_run.return_value.stdout = (
+            f':100644 100644 {OID_A} {OID_B} M\0Book1.xlsb\0'
+            f':100644 100644 {OID_A} {OID_B} M\0README.md\0'
+            f':000000 100644 {NULL_OID} {OID_B} A\0dir/Book2.XLSM\0'
+            f':100644 000000 {OID_A} {NULL_OID} D\0~$Book1.xlsb\0'
+            f':100644 100644 {OID_A} {OID_B} R087\0old.xls\0new.xls\0'
+        ).encode('utf-8')
+        changes = list(batch.changed_workbooks(['HEAD~1', 'HEAD']))
+        mock_run.assert_called_once_with(['git', 'diff', '--raw', '-z', '--no-abbrev', 'HEAD~1', 'HEAD'], cwd=None,
+                                         stdout=-1, stderr=-1, check=True)
+        self.assertEqual(changes, [
+            {'status': 'M', 'path_a': 'Book1.xlsb', 'path_b': 'Book1.xlsb', 'oid_a': OID_A, 'oid_b': OID_B},
+            {'status': 'A', 'path_a': None, 'path_b': 'dir/Book2.XLSM', 'oid_a': NULL_OID, 'oid_b': OID_B},
+            {'status': 'R', 'path_a': 'old.xls', 'path_b': 'new.xls', 'oid_a': OID_A, 'oid_b': OID_B},
+        ])
+
+    @mock.patch('batch.subprocess.run')
+    def test_path_that_is_not_utf8(self, mock_run):
+        mock_run.return_value.stdout = f':100644 100644 {OID_A} {OID_B} M\0'.encode('utf-8') + b'Pr\xe9vision.xlsb\0'
+        changes = list(batch.changed_workbooks(['HEAD']))
+        self.assertEqual(os.fsencode(changes[0]['path_a']), b'Pr\xe9vision.xlsb')
+
+
+class TestCatFile(TestCase):
+
+    def test_read(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            subprocess.run(['git', 'init', '-q', tmp], check=True)
+            oid = subprocess.run(['git', 'hash-object', '-w', '--stdin'], cwd=tmp, input=b'\x00binary\nblob',
+                                 stdout=subprocess.PIPE, check=True).stdout.decode('utf-8').strip()
+            with batch.CatFile(tmp) as cat_file:
+                self.assertEqual(cat_file.read(oid), b'\x00binary\nblob')
+                self.assertIsNone(cat_file.read('c' * 40))
+                self.assertEqual(cat_file.read(oid), b'\x00binary\nblob')
+
+    def test_read_path_that_is_not_utf8(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            subprocess.run(['git', 'init', '-q', tmp], check=True)
+            with open(os.path.join(os.fsencode(tmp), b'Pr\xe9vision.xlsb'), 'wb') as f:
+                f.write(b'blob')
+            subprocess.run(['git', 'add', '.'], cwd=tmp, check=True)
+            with batch.CatFile(tmp) as cat_file:
+                self.assertEqual(cat_file.read(':' + os.fsdecode(b'Pr\xe9vision.xlsb')), b'blob')
+
+
+@mock.patch.dict(os.environ, {'GIT_XL_CACHE': '0'})
+class TestExtract(TestCase):
+
+    def test_sheets(self):
+        old = make_xlsx({'Data': {'B2': 1}})
+        new = make_xlsx({'Data': {'B2': 2}})
+        # git xl stat does not diff cells
+        self.assertEqual(batch.extract(new, None, old, None, 'Book.xlsx'), ({}, {}, []))
+        _, _, sheets = batch.extract(new, None, old, None, 'Book.xlsx', sheets=True)
+        # only the changes are sent back from the worker, they are rendered in the parent
+        self.assertEqual(sheets, [('Data', '--- a/Book.xlsx/Data', '+++ b/Book.xlsx/Data', 'modified',
+                                   [(2, 2, '1', '2')])])
+        sheet = batch.render(sheets[0])
+        self.assertEqual(list(sheet['lines']), ['@@ Data!B2 @@', '-1', '+2'])
+        self.assertEqual(list(sheet['cells']), [{'cell': 'B2', 'old': '1', 'new': '2'}])
+
+
+class TestStat(TestCase):
+
+    @mock.patch('batch.extract_changes')
+    def test_renamed_module(self, mock_extract_changes):
+        change = {'status': 'M', 'path_a': 'Book1.xlsb', 'path_b': 'Book1.xlsb', 'oid_a': OID_A, 'oid_b': OID_B}
+        mock_extract_changes.return_value = [(change, ({'Renamed': 'a\nb\nc'}, {'Module3': 'a\nb\nc'}, []))]
+        out = io.StringIO()
+        batch.stat(['HEAD'], color=False, out=out)
+        self.assertEqual(out.getvalue(), ' Book1.xlsb/VBA/{Module3 => Renamed} | 0\n'
+                                         ' 1 module changed, 0 insertions(+), 0 deletions(-)\n'
+                                         ' rename Book1.xlsb/VBA/{Module3 => Renamed} (100%)\n')
+        out = io.StringIO()
+        batch.stat(['HEAD'], color=False, out=out, threshold=None)
+        self.assertIn(' create module Book1.xlsb/VBA/Renamed\n delete module Book1.xlsb/VBA/Module3\n',
+                      out.getvalue())
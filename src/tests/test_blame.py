@@ -0,0 +1,75 @@
+import io
+import os
+import time
+import shutil
+import tempfile
+import subprocess
+import blame
+import cache
+import diff
+from batch import CatFile
+from unittest import TestCase, mock
+
+BOOK1 = os.path.join(os.path.dirname(__file__), 'Book1.xlsb')
+
+
+def git(cwd, *args, **kwargs):
+    return subprocess.run(['git', '-c', 'user.email=xl@example.com'] + list(args), cwd=cwd, stdout=subprocess.PIPE,
+                          universal_newlines=True, check=True, **kwargs).stdout.strip()
+
+
+class TestBlame(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        git(self.tmp, 'init', '-q', '.')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def commit(self, content, author):
+        with open(os.path.join(self.tmp, 'Model.xlsm'), 'w') as f:
+            f.write(content)
+        git(self.tmp, 'add', 'Model.xlsm')
+        git(self.tmp, '-c', f'user.name={author}', 'commit', '-q', '-m', content)
+        return git(self.tmp, 'rev-parse', 'HEAD:Model.xlsm')
+
+    def test_lines_are_attributed_to_the_commit_that_introduced_them(self):
+        # the workbooks are stand-ins: their module is looked up by blob
+        sources = {}
+        sources[self.commit('v1', 'Ann')] = 'Option Explicit\nSub a()\nEnd Sub'
+        sources[self.commit('v2', 'Bob')] = 'Option Explicit\nSub b()\nEnd Sub'
+        # v3 only changed another module
+        sources[self.commit('v3', 'Cid')] = 'Option Explicit\nSub b()\nEnd Sub'
+        sources[self.commit('v4', 'Dan')] = 'Option Explicit\nSub b()\nEnd Sub\nSub c()\nEnd Sub'
+        with mock.patch.object(blame.ModuleVersions, 'digest', side_effect=lambda blob: sources[blob]), \
+                mock.patch.object(blame.ModuleVersions, 'source', side_effect=lambda blob, digest: digest):
+            lines, owners = blame.blame('Model.xlsm', 'Module1', cwd=self.tmp)
+        self.assertEqual(lines, ['Option Explicit', 'Sub b()', 'End Sub', 'Sub c()', 'End Sub'])
+        self.assertEqual([commit['author'] for commit in owners], ['Ann', 'Bob', 'Ann', 'Dan', 'Dan'])
+
+        out = io.StringIO()
+        blame.print_blame(lines, owners, out, color=False)
+        date = time.strftime('%Y-%m-%d', time.localtime(owners[1]['time']))
+        self.assertEqual(out.getvalue().split('\n')[1], f'{owners[1]["oid"][:8]} (Bob {date} 2) Sub b()')
+
+    def test_versions_are_read_from_the_cache(self):
+        shutil.copy(BOOK1, os.path.join(self.tmp, 'Book1.xlsb'))
+        git(self.tmp, 'add', 'Book1.xlsb')
+        blob = git(self.tmp, 'rev-parse', ':Book1.xlsb')
+        extraction_cache = cache.ExtractionCache(path=os.path.join(self.tmp, 'cache'))
+        with CatFile(self.tmp) as cat_file:
+            versions = blame.ModuleVersions(cat_file, extraction_cache, 'Module1')
+            digest = versions.digest(blob)
+            self.assertEqual(versions.source(blob, digest), diff.get_vba(BOOK1)['Module1'])
+        # blaming again does not read the workbook
+        cat_file = mock.Mock()
+        versions = blame.ModuleVersions(cat_file, extraction_cache, 'Module1')
+        self.assertEqual(versions.digest(blob), digest)
+        self.assertEqual(versions.source(blob, digest), diff.get_vba(BOOK1)['Module1'])
+        self.assertEqual(cat_file.read.call_count, 0)
+
+    def test_unknown_revision(self):
+        self.commit('v1', 'Ann')
+        self.assertRaises(subprocess.CalledProcessError, blame.blame, 'Model.xlsm', 'Module1', 'no-such-revision',
+                          cwd=self.tmp)
@@ -0,0 +1,75 @@
+import os
+import time
+import tempfile
+import cache
+from unittest import TestCase, mock
+
+
+class TestExtractionCache(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = cache.ExtractionCache(path=os.path.join(self.tmp.name, 'cache'))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_key_uses_blob_oid(self):
+        oid = 'a' * 40
+        self.assertEqual(self.cache.key('does-not-exist.xlsb', oid), oid)
+
+    def test_key_falls_back_to_stat_for_null_oid(self):
+        path = os.path.join(self.tmp.name, 'Book1.xlsb')
+        with open(path, 'wb') as f:
+            f.write(b'content')
+        key = self.cache.key(path, '0' * 40)
+        self.assertTrue(key.startswith('stat-'))
+        self.assertEqual(key, self.cache.key(path, '.'))
+
+        # any change to the file's stat info changes the key
+        os.utime(path, ns=(0, 0))
+        self.assertNotEqual(key, self.cache.key(path, '0' * 40))
+
+    def test_roundtrip(self):
+        self.assertIsNone(self.cache.get('b' * 40))
+        self.cache.set('b' * 40, {'Module1': 'Option Explicit', 'Module2': ''})
+        self.assertEqual(self.cache.get('b' * 40), {'Module1': 'Option Explicit', 'Module2': ''})
+        self.assertEqual(list(self.cache.get('b' * 40)), ['Module1', 'Module2'])
+
+    def test_prune_evicts_old_entries(self):
+        self.cache.set('c' * 40, {'Module1': ''})
+        old = time.time() - self.cache.max_age - 1
+        os.utime(self.cache.entry_path('c' * 40), (old, old))
+        self.cache.prune()
+        self.assertIsNone(self.cache.get('c' * 40))
+
+    def test_prune_evicts_least_recently_used_entries(self):
+        for i, key in enumerate(['d' * 40, 'e' * 40, 'f' * 40]):
+            self.cache.set(key, {'Module1': 'x' * 100})
+            os.utime(self.cache.entry_path(key), (time.time() - 10 + i, time.time() - 10 + i))
+        self.cache.max_size = 2 * os.path.getsize(self.cache.entry_path('d' * 40))
+        self.cache.prune()
+        self.assertIsNone(self.cache.get('d' * 40))
+        self.assertIsNotNone(self.cache.get('e' * 40))
+        self.assertIsNotNone(self.cache.get('f' * 40))
+
+
+class TestFindGitDir(TestCase):
+
+    @mock.patch.dict('os.environ', {}, clear=True)
+    def test_walks_up_to_git_dir(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            os.makedirs(os.path.join(tmp, '.git'))
+            os.makedirs(os.path.join(tmp, 'sub', 'dir'))
+            self.assertEqual(cache.find_git_dir(os.path.join(tmp, 'sub', 'dir')),
+                             os.path.normpath(os.path.join(tmp, '.git')))
+
+    @mock.patch.dict('os.environ', {}, clear=True)
+    def test_follows_gitdir_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            os.makedirs(os.path.join(tmp, 'repo.git'))
+            os.makedirs(os.path.join(tmp, 'worktree'))
+            with open(os.path.join(tmp, 'worktree', '.git'), 'w') as f:
+                f.write('gitdir: ../repo.git\n')
+            self.assertEqual(cache.find_git_dir(os.path.join(tmp, 'worktree')),
+                             os.path.normpath(os.path.join(tmp, 'repo.git')))
@@ -0,0 +1,87 @@
+import io
+import cells
+import zipfile
+from unittest import TestCase, mock
+from xml.sax.saxutils import escape
+
+NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+
+
+def make_xlsx(sheets, strings=None):
+    # sheets: {name: {reference: value}}, strings are stored in the shared strings table in the given order
+    strings = list(strings or [])
+    f = io.BytesIO()
+    with zipfile.ZipFile(f, 'w', zipfile.ZIP_DEFLATED) as z:
+        workbook = ''.join(f'<sheet name="{name}" sheetId="{i}" r:id="rId{i}"/>' for i, name in enumerate(sheets, 1))
+        z.writestr('xl/workbook.xml', f'<workbook xmlns="{NS}" xmlns:r="{REL}"><sheets>{workbook}</sheets></workbook>')
+        relationships = ''.join(f'<Relationship Id="rId{i}" Type="{REL}/worksheet" Target="worksheets/sheet{i}.xml"/>'
+                                for i in range(1, len(sheets) + 1))
+        z.writestr('xl/_rels/workbook.xml.rels', f'<Relationships>{relationships}</Relationships>')
+        for i, values in enumerate(sheets.values(), 1):
+            rows = {}
+            for reference, value in values.items():
+                rows.setdefault(int(reference.lstrip('ABCDEFGHIJKLMNOPQRSTUVWXYZ')), []).append((reference, value))
+            xml = ''
+            for row in sorted(rows):
+                xml += f'<row r="{row}">'
+                for reference, value in rows[row]:
+                    if isinstance(value, bool):
+                        xml += f'<c r="{reference}" t="b"><v>{int(value)}</v></c>'
+                    elif isinstance(value, str) and value.startswith('='):
+                        xml += f'<c r="{reference}"><f>{escape(value[1:])}</f><v>0</v></c>'
+                    elif isinstance(value, str):
+                        if value not in strings:
+                            strings.append(value)
+                        xml += f'<c r="{reference}" t="s"><v>{strings.index(value)}</v></c>'
+                    else:
+                        xml += f'<c r="{reference}"><v>{value}</v></c>'
+                xml += '</row>'
+            z.writestr(f'xl/worksheets/sheet{i}.xml',
+                       f'<worksheet xmlns="{NS}"><sheetData><row r="1" ht="20"/>{xml}</sheetData></worksheet>')
+        shared_strings = ''.join(f'<si><t>{escape(string)}</t></si>' for string in strings)
+        z.writestr('xl/sharedStrings.xml', f'<sst xmlns="{NS}">{shared_strings}</sst>')
+    return f.getvalue()
+
+
+def render(workbook_a, workbook_b):
+    return [(diff['a'], diff['b'], list(diff['lines'])) for diff in cells.diff_sheets('Book.xlsx', workbook_a, workbook_b)]
+
+
+class TestDiffSheets(TestCase):
+
+    def test_changed_cells(self):
+        old = make_xlsx({'Data': {'A2': 'x', 'B2': 1, 'C3': '=SUM(B2:B3)'}, 'Old': {'A2': 1}})
+        new = make_xlsx({'Data': {'A2': 'x', 'B2': 2, 'C3': '=SUM(B2:B4)', 'AA3': True}, 'New': {'B2': 'a\nb'}})
+        self.assertEqual(render(new, old), [
+            ('--- a/Book.xlsx/Data', '+++ b/Book.xlsx/Data',
+             ['@@ Data!B2 @@', '-1', '+2', '@@ Data!C3 @@', '-=SUM(B2:B3)', '+=SUM(B2:B4)', '@@ Data!AA3 @@', '+TRUE']),
+            ('--- /dev/null', '+++ b/Book.xlsx/New', ['@@ New!B2 @@', '+a\\nb']),
+            ('--- a/Book.xlsx/Old', '+++ /dev/null', ['@@ Old!A2 @@', '-1']),
+        ])
+
+    def test_unchanged_sheets_are_not_parsed(self):
+        old = make_xlsx({'Data': {'A2': 'x'}, 'Other': {'A2': 1}})
+        new = make_xlsx({'Data': {'A2': 'x'}, 'Other': {'A2': 2}}, strings=['x', 'appended'])
+        with mock.patch.object(cells.Package, 'rows', autospec=True, side_effect=cells.Package.rows) as mock_rows:
+            self.assertEqual(render(new, old), [
+                ('--- a/Book.xlsx/Other', '+++ b/Book.xlsx/Other', ['@@ Other!A2 @@', '-1', '+2'])])
+        self.assertEqual({call.args[1] for call in mock_rows.call_args_list}, {'xl/worksheets/sheet2.xml'})
+
+    def test_same_sheet_with_other_shared_strings(self):
+        old = make_xlsx({'Data': {'A2': 'x'}}, strings=['x', 'y'])
+        new = make_xlsx({'Data': {'A2': 'y'}}, strings=['y', 'x'])
+        self.assertEqual(render(new, old), [('--- a/Book.xlsx/Data', '+++ b/Book.xlsx/Data',
+                                             ['@@ Data!A2 @@', '-x', '+y'])])
+
+    def test_cell_records(self):
+        old = make_xlsx({'Data': {'A2': 'x', 'B2': 1}})
+        new = make_xlsx({'Data': {'A2': 'y', 'C2': 2}}, strings=['y'])
+        records = [(diff['status'], list(diff['cells'])) for diff in cells.diff_sheets('Book.xlsx', new, old)]
+        self.assertEqual(records, [('modified', [{'cell': 'A2', 'old': 'x', 'new': 'y'},
+                                                 {'cell': 'B2', 'old': '1', 'new': None},
+                                                 {'cell': 'C2', 'old': None, 'new': '2'}])])
+
+    def test_column_letters(self):
+        self.assertEqual([cells.column_letters(number) for number in (1, 26, 27, 16384)], ['A', 'Z', 'AA', 'XFD'])
+        self.assertEqual(cells.column_number('xfd'), 16384)
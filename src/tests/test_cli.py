@@ -1,28 +1,42 @@
+import os
+import shutil
+import tempfile
+import subprocess
 import cli
+import gitconfig
 from io import StringIO
 from unittest import TestCase, mock
 
 
+def local_config(path, entries=()):
+    return gitconfig.GitConfig([('local', 'file:.git/config', 'core.bare', 'false')] + list(entries), path=path,
+                               is_repository=True)
+
+
+def global_config(path, entries=()):
+    return gitconfig.GitConfig([('global', 'file:/home/user/.gitconfig', 'user.name', 'user')] + list(entries),
+                               path=path)
+
+
 class TestLocalInstaller(TestCase):
 
-    @mock.patch('cli.is_git_repository', return_value=True)
-    def test_paths(self, mock_is_git_repository):
+    @mock.patch('cli.GitConfig.read', side_effect=local_config)
+    def test_paths(self, mock_read_config):
         installer = cli.Installer(mode='local', path='\\path\\to\\repository')
         self.assertEqual(installer.get_git_attributes_path(), '\\path\\to\\repository\\.gitattributes')
         self.assertEqual(installer.get_git_attributes_path(), '\\path\\to\\repository\\.gitattributes')
 
-    @mock.patch('cli.subprocess.run')
+    @mock.patch('cli.GitConfig.write')
     @mock.patch('cli.is_frozen', return_value=True)
-    @mock.patch('cli.is_git_repository', return_value=True)
+    @mock.patch('cli.GitConfig.read', side_effect=local_config)
     @mock.patch('cli.os.path.exists', return_value=False)
     @mock.patch('builtins.open', new_callable=mock.mock_open)
     def test_can_install_when_files_do_not_exist(self, mock_file_open, mock_path_exists,
-                                                 mock_is_git_repository, mock_is_frozen, mock_run):
+                                                 mock_read_config, mock_is_frozen, mock_write):
         installer = cli.Installer(mode='local', path='\\path\\to\\repository')
         installer.install()
-        mock_run.assert_has_calls([
-            mock.call(['git', 'config', 'diff.xl.command', 'git-xl-diff.exe'], cwd='\\path\\to\\repository', stderr=-1, stdout=-1, universal_newlines=True, encoding='utf-8'),
-        ])
+        self.assertEqual(installer.config.changes, [('set', 'local', 'diff.xl.command', 'git-xl-diff.exe')])
+        mock_write.assert_called_once_with()
         mock_file_open.assert_has_calls([
             mock.call('\\path\\to\\repository\\.gitattributes', 'w'),
             mock.call().__enter__(),
@@ -34,19 +48,37 @@ class TestLocalInstaller(TestCase):
             mock.call().__exit__(None, None, None)
         ])
 
-    @mock.patch('cli.subprocess.run')
+    @mock.patch('cli.GitConfig.write')
+    @mock.patch('cli.is_frozen', return_value=True)
+    @mock.patch('cli.GitConfig.read', side_effect=local_config)
+    @mock.patch('cli.os.path.exists', return_value=False)
+    @mock.patch('builtins.open', new_callable=mock.mock_open)
+    def test_can_install_textconv(self, mock_file_open, mock_path_exists, mock_read_config, mock_is_frozen,
+                                  mock_write):
+        installer = cli.Installer(mode='local', path='\\path\\to\\repository', textconv=True)
+        installer.install()
+        self.assertEqual(installer.config.changes, [
+            ('set', 'local', 'diff.xl.command', 'git-xl-diff.exe'),
+            ('set', 'local', 'diff.xl.textconv', 'git-xl.exe textconv'),
+            ('set', 'local', 'diff.xl.cachetextconv', 'true'),
+        ])
+
+    @mock.patch('cli.is_frozen', return_value=False)
+    @mock.patch('cli.GitConfig.read', side_effect=local_config)
+    def test_diff_command_uses_client(self, mock_read_config, mock_is_frozen):
+        installer = cli.Installer(mode='local', path='\\path\\to\\repository')
+        self.assertTrue(installer.GIT_XL_DIFF.endswith('/diff_client.py'))
+
+    @mock.patch('cli.GitConfig.write')
     @mock.patch('cli.is_frozen', return_value=True)
-    @mock.patch('cli.is_git_repository', return_value=True)
+    @mock.patch('cli.GitConfig.read', side_effect=local_config)
     @mock.patch('cli.os.path.exists', return_value=True)
     @mock.patch('builtins.open', new_callable=mock.mock_open, read_data='something\n')
     def test_can_install_when_files_exist(self, mock_file_open, mock_path_exists,
-                                          mock_is_git_repository, mock_is_frozen, mock_run):
+                                          mock_read_config, mock_is_frozen, mock_write):
         installer = cli.Installer(mode='local', path='\\path\\to\\repository')
         installer.install()
-        mock_run.assert_has_calls([
-            mock.call(['git', 'config', 'diff.xl.command', 'git-xl-diff.exe'], cwd='\\path\\to\\repository', stderr=-1,
-                      stdout=-1, universal_newlines=True, encoding='utf-8')
-        ])
+        self.assertEqual(installer.config.changes, [('set', 'local', 'diff.xl.command', 'git-xl-diff.exe')])
         mock_file_open.assert_has_calls([
             mock.call('\\path\\to\\repository\\.gitattributes', 'r'),
             mock.call().__enter__(),
@@ -69,71 +101,121 @@ class TestLocalInstaller(TestCase):
             mock.call().__exit__(None, None, None)
         ])
 
-    @mock.patch('cli.subprocess.run')
-    @mock.patch('cli.is_git_repository', return_value=True)
+    @mock.patch('cli.GitConfig.write')
+    @mock.patch('cli.GitConfig.read', side_effect=local_config)
     @mock.patch('cli.os.path.exists', return_value=False)
     @mock.patch('cli.os.remove')
     @mock.patch('builtins.open', new_callable=mock.mock_open)
-    def test_can_uninstall_when_files_do_not_exist(self, mock_file_open, mock_os_remove,  mock_path_exists, mock_is_git_repository, mock_run):
+    def test_can_uninstall_when_files_do_not_exist(self, mock_file_open, mock_os_remove,  mock_path_exists, mock_read_config, mock_write):
         installer = cli.Installer(mode='local', path='\\path\\to\\repository')
         installer.uninstall()
-        mock_run.assert_called_once_with(['git', 'config', '--list'], cwd='\\path\\to\\repository', stderr=-1, stdout=-1, universal_newlines=True, encoding='utf-8')
+        self.assertEqual(installer.config.changes, [])
+        mock_write.assert_called_once_with()
         mock_os_remove.assert_has_calls([])
 
+    @mock.patch('cli.GitConfig.write')
+    @mock.patch('cli.GitConfig.read',
+                side_effect=lambda path: local_config(path, [('local', 'file:.git/config', 'diff.xl.command', 'x')]))
+    @mock.patch('cli.os.path.exists', return_value=False)
+    @mock.patch('cli.os.remove')
+    @mock.patch('builtins.open', new_callable=mock.mock_open)
+    def test_uninstall_removes_config_section(self, mock_file_open, mock_os_remove, mock_path_exists,
+                                              mock_read_config, mock_write):
+        installer = cli.Installer(mode='local', path='\\path\\to\\repository')
+        installer.uninstall()
+        self.assertEqual(installer.config.changes, [('remove-section', 'local', 'diff.xl', None)])
+        mock_write.assert_called_once_with()
+
+    @mock.patch('cli.GitConfig.read', side_effect=lambda path: gitconfig.GitConfig([], path=path))
+    def test_not_a_repository(self, mock_read_config):
+        with self.assertRaises(ValueError):
+            cli.Installer(mode='local', path='\\path\\to\\repository')
 
-    @mock.patch('cli.subprocess.run')
-    @mock.patch('cli.is_git_repository', return_value=True)
+    @mock.patch('cli.GitConfig.write')
+    @mock.patch('cli.GitConfig.read', side_effect=local_config)
     @mock.patch('cli.os.path.exists', return_value=True)
     @mock.patch('cli.os.remove')
     @mock.patch('builtins.open', new_callable=mock.mock_open, read_data='something')
-    def test_can_uninstall_when_files_exist(self, mock_file_open, mock_os_remove,  mock_path_exists, mock_is_git_repository, mock_run):
+    def test_can_uninstall_when_files_exist(self, mock_file_open, mock_os_remove,  mock_path_exists, mock_read_config, mock_write):
         installer = cli.Installer(mode='local', path='\\path\\to\\repository')
         installer.uninstall()
-        mock_run.assert_called_once_with(['git', 'config', '--list'], cwd='\\path\\to\\repository', stderr=-1, stdout=-1, universal_newlines=True, encoding='utf-8')
+        self.assertEqual(installer.config.changes, [])
+        mock_write.assert_called_once_with()
         self.assertEqual(mock_os_remove.call_count, 0)
         mock_file_open.assert_has_calls([
             mock.call('\\path\\to\\repository\\.gitattributes', 'r'),
             mock.call().__enter__(),
             mock.call().read(),
             mock.call().__exit__(None, None, None),
-            mock.call('\\path\\to\\repository\\.gitattributes', 'w'),
-            mock.call().__enter__(),
-            mock.call().writelines('something'),
-            mock.call().__exit__(None, None, None),
             mock.call('\\path\\to\\repository\\.gitattributes', 'r'),
             mock.call().__enter__(),
             mock.call().read(),
-            mock.call().__exit__(None, None, None),
-            mock.call('\\path\\to\\repository\\.gitattributes', 'w'),
-            mock.call().__enter__(),
-            mock.call().writelines('something'),
             mock.call().__exit__(None, None, None)
         ])
+        # both files already have that content and are not rewritten
+        self.assertNotIn(mock.call('\\path\\to\\repository\\.gitattributes', 'w'), mock_file_open.mock_calls)
 
 
 class TestGlobalInstaller(TestCase):
 
-    @mock.patch('cli.subprocess.run')
-    @mock.patch('cli.Installer.get_git_attributes_path')
-    @mock.patch('cli.Installer.get_git_ignore_path')
-    def test_global_gitconfig_dir(self, mock_get_git_ignore_path, mock_get_git_attributes_path, mock_run):
+    @mock.patch.dict(os.environ, {'HOME': '/home/user', 'XDG_CONFIG_HOME': '', 'GIT_CONFIG_GLOBAL': ''})
+    @mock.patch('cli.GitConfig.read', side_effect=global_config)
+    def test_global_gitconfig_dir(self, mock_read_config):
         installer = cli.Installer(mode='global')
-        self.assertEqual(mock_run.call_count, 2)
-        mock_run.assert_has_calls([
-            mock.call(['git', 'config', '--global', '--list', '--show-origin'], cwd=None, stderr=-1, stdout=-1, universal_newlines=True, encoding='utf-8'),
-            mock.call(['git', 'config', '--global', '--list'], cwd=None, stderr=-1, stdout=-1, universal_newlines=True, encoding='utf-8')
-        ])
+        self.assertEqual(installer.get_global_gitconfig_dir(), '/home/user')
+        self.assertEqual(installer.git_attributes_path, cli.os.path.join('/home/user', '.gitattributes'))
+        mock_read_config.assert_called_once_with(None)
 
-    @mock.patch('cli.subprocess.run')
-    @mock.patch('cli.Installer.get_global_gitconfig_dir')
-    @mock.patch('cli.Installer.get_git_ignore_path')
-    def test_global_gitattributes_path(self, mock_get_git_ignore_path, get_global_gitconfig_dir, mock_run):
-        mock_completed_process = mock.Mock()
-        mock_completed_process.configure_mock(**{'stdout': '.gitconfig'})
-        mock_run.return_value = mock_completed_process
+    @mock.patch('cli.GitConfig.read', side_effect=lambda path: global_config(
+        path, [('global', 'file:/home/user/.gitconfig', 'core.attributesfile', '/etc/attributes')]))
+    def test_global_gitattributes_path(self, mock_read_config):
         installer = cli.Installer(mode='global')
-        self.assertEqual(mock_run.call_count, 1)
-        mock_run.assert_called_once_with(['git', 'config', '--global', '--get', 'core.attributesfile'], cwd=None, stderr=-1, stdout=-1, universal_newlines=True, encoding='utf-8')
+        self.assertEqual(installer.git_attributes_path, '/etc/attributes')
+
+    @mock.patch('cli.GitConfig.write')
+    @mock.patch('cli.GitConfig.read', side_effect=lambda path: global_config(
+        path, [('global', 'file:/home/user/.gitconfig', 'diff.xl.command', 'git-xl-diff.exe'),
+               ('global', 'file:/home/user/.gitconfig', 'core.attributesfile', '/etc/attributes'),
+               ('global', 'file:/home/user/.gitconfig', 'core.excludesfile', '/etc/ignore')]))
+    @mock.patch('cli.is_frozen', return_value=True)
+    @mock.patch('cli.os.path.exists', return_value=False)
+    @mock.patch('builtins.open', new_callable=mock.mock_open)
+    def test_reinstall_writes_nothing(self, mock_file_open, mock_path_exists, mock_is_frozen, mock_read_config,
+                                      mock_write):
+        installer = cli.Installer(mode='global')
+        installer.install()
+        self.assertEqual(installer.config.changes, [])
+
+
+class TestHook(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        subprocess.run(['git', 'init', '-q', '.'], cwd=self.tmp, check=True)
+        self.hook_path = os.path.join(self.tmp, '.git', 'hooks', 'pre-commit')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    @mock.patch('cli.is_frozen', return_value=True)
+    def test_install_and_uninstall(self, mock_is_frozen):
+        cli.Installer(mode='local', path=self.tmp, hook=True).install()
+        with open(self.hook_path, 'r') as f:
+            self.assertEqual(f.read(), f'#!/bin/sh\n{cli.GIT_XL_HOOK}\nexec git-xl.exe export --staged\n')
+        # installing twice keeps the hook, uninstalling removes it
+        cli.Installer(mode='local', path=self.tmp, hook=True).install()
+        cli.Installer(mode='local', path=self.tmp).uninstall()
+        self.assertFalse(os.path.exists(self.hook_path))
+
+    def test_existing_hook_is_kept(self):
+        with open(self.hook_path, 'w') as f:
+            f.write('#!/bin/sh\nmake lint\n')
+        self.assertRaises(ValueError, cli.Installer(mode='local', path=self.tmp, hook=True).install_hook)
+        cli.Installer(mode='local', path=self.tmp).uninstall()
+        self.assertTrue(os.path.exists(self.hook_path))
+
+    def test_global_hook(self):
+        self.assertRaises(ValueError, cli.Installer, mode='global', hook=True)
 
 
 class TestHelp(TestCase):
@@ -156,6 +238,12 @@ class TestHelp(TestCase):
         command_parser.execute()
         self.assertEqual(mock_stdout.getvalue(), cli.HELP_UNINSTALL + '\n')
 
+    @mock.patch('sys.stdout', new_callable=StringIO)
+    def test_help_daemon(self, mock_stdout):
+        command_parser = cli.CommandParser(['help', 'daemon'])
+        command_parser.execute()
+        self.assertEqual(mock_stdout.getvalue(), cli.HELP_DAEMON + '\n')
+
 
 class CommandParser(TestCase):
 
@@ -165,6 +253,37 @@ class CommandParser(TestCase):
         command_parser.execute()
         self.assertEqual(mock_stdout.getvalue(), cli.GIT_XL_VERSION + '\n')
 
+    @mock.patch('sys.stdout', new_callable=StringIO)
+    @mock.patch('batch.run', side_effect=subprocess.CalledProcessError(
+        128, ['git', 'diff'], stderr=b"fatal: bad revision 'nosuchrev'\n"))
+    def test_diff_unknown_revision(self, mock_run, mock_stdout):
+        mock_stdout.reconfigure = mock.Mock()
+        self.assertEqual(cli.CommandParser(['diff', 'nosuchrev']).execute(), 1)
+        self.assertEqual(mock_stdout.getvalue(), "Error: fatal: bad revision 'nosuchrev'\n")
+
+    @mock.patch('sys.stdout', new_callable=StringIO)
+    @mock.patch('batch.stat', side_effect=subprocess.CalledProcessError(
+        128, ['git', 'diff'], stderr=b"fatal: bad revision 'nosuchrev'\n"))
+    def test_stat_unknown_revision(self, mock_stat, mock_stdout):
+        self.assertEqual(cli.CommandParser(['stat', 'nosuchrev']).execute(), 1)
+        self.assertEqual(mock_stdout.getvalue(), "Error: fatal: bad revision 'nosuchrev'\n")
+
+    @mock.patch('sys.stdout', new_callable=StringIO)
+    @mock.patch('history.run', return_value=1)
+    def test_log_status(self, mock_run, mock_stdout):
+        self.assertEqual(cli.CommandParser(['log', 'Book1.xlsb/Module1']).execute(), 1)
+
+    def test_invalid_numbers(self):
+        for args, option in ((['diff', '-jabc', 'HEAD'], '-jabc'), (['stat', '-j0', 'HEAD'], '-j0'),
+                             (['index', '--jobs', '-1'], '--jobs'), (['scan', '--jobs='], '--jobs='),
+                             (['export', '-j'], '-j'), (['diff', '-Ux', 'HEAD'], '-Ux'),
+                             (['log', '--unified=', 'Book1.xlsb/Module1'], '--unified='),
+                             (['install', '--local', '--repos', '*', '-j0'], '-j0')):
+            with mock.patch('sys.stdout', new_callable=StringIO) as mock_stdout:
+                cli.CommandParser(args).execute()
+            self.assertEqual(mock_stdout.getvalue(), f'Invalid option "{option}" for "git-xl {args[0]}"\n'
+                                                     "Run 'git-xl --help' for usage.\n")
+
     @mock.patch('sys.stdout', new_callable=StringIO)
     def test_env(self, mock_stdout):
         command_parser = cli.CommandParser(['env'])
@@ -0,0 +1,104 @@
+import io
+import os
+import json
+import socket
+import tempfile
+import threading
+import diff_client
+from unittest import TestCase, mock, skipUnless
+
+BOOK1 = os.path.join(os.path.dirname(__file__), 'Book1.xlsb')
+
+
+@skipUnless(hasattr(socket, 'AF_UNIX') and hasattr(os, 'fork'), 'requires Unix domain sockets')
+class TestDaemon(TestCase):
+
+    def setUp(self):
+        import daemon
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'daemon.sock')
+        self.env = mock.patch.dict('os.environ', {'GIT_XL_DAEMON_SOCKET': self.path, 'GIT_XL_CACHE': '0'})
+        self.env.start()
+        self.thread = threading.Thread(target=daemon.serve, kwargs={'path': self.path, 'idle_timeout': 10})
+        self.thread.start()
+        for _ in range(100):
+            if os.path.exists(self.path):
+                break
+            threading.Event().wait(0.01)
+
+    def tearDown(self):
+        diff_client.stop()
+        self.thread.join()
+        self.env.stop()
+        self.tmp.cleanup()
+
+    def test_forward(self):
+        stdout = io.TextIOWrapper(io.BytesIO(), encoding='utf-8')
+        with mock.patch('sys.stdout', stdout):
+            status = diff_client.forward(['Book1.xlsb', '/dev/null', '.', '.', BOOK1, '.', '100644'])
+            stdout.flush()
+        self.assertEqual(status, 0)
+        output = stdout.buffer.getvalue().decode('utf-8')
+        self.assertIn('diff --xl a/Book1.xlsb b/Book1.xlsb', output)
+        self.assertIn('+++ b/Book1.xlsb/VBA/Module1', output)
+
+    def test_stalled_client(self):
+        # a client that connects and sends nothing does not block the diffs of everyone else
+        stalled = diff_client.connect(self.path)
+        try:
+            with mock.patch('daemon.REQUEST_TIMEOUT', 0.2):
+                thread = threading.Thread(target=diff_client.forward, args=(['Book1.xlsb'],))
+                with mock.patch('sys.stdout', io.TextIOWrapper(io.BytesIO(), encoding='utf-8')):
+                    thread.start()
+                    thread.join(5)
+                self.assertFalse(thread.is_alive())
+        finally:
+            stalled.close()
+
+    def test_environment(self):
+        # the daemon's own GIT_* variables are replaced by the client's
+        def main(args, out, tty):
+            out.write(f"{os.environ.get('GIT_XL_TEST_DAEMON')} {os.environ.get('GIT_XL_TEST_CLIENT')}")
+
+        sock = diff_client.connect(self.path)
+        with mock.patch.dict('os.environ', {'GIT_XL_TEST_DAEMON': 'daemon'}), mock.patch('diff.main', main), sock:
+            request = {'args': [], 'cwd': os.getcwd(), 'env': {'GIT_XL_TEST_CLIENT': 'client'}}
+            sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+            output = b''.join(data for kind, data in diff_client.read_frames(sock) if kind == b'o')
+        self.assertEqual(output, b'None client')
+
+    def test_stop(self):
+        self.assertTrue(diff_client.stop())
+        self.thread.join()
+        self.assertFalse(os.path.exists(self.path))
+        self.assertIsNone(diff_client.forward(['Book1.xlsb', '/dev/null', '.', '.', BOOK1, '.', '100644']))
+
+
+@skipUnless(hasattr(socket, 'AF_UNIX') and hasattr(os, 'fork'), 'requires Unix domain sockets')
+class TestSocketDirectory(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'daemon.sock')
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(self.path)
+        self.server.listen()
+
+    def tearDown(self):
+        self.server.close()
+        self.tmp.cleanup()
+
+    def test_private_directory(self):
+        sock = diff_client.connect(self.path)
+        self.assertIsNotNone(sock)
+        sock.close()
+
+    def test_directory_others_can_write_to(self):
+        import daemon
+        os.chmod(self.tmp.name, 0o777)
+        self.assertIsNone(diff_client.connect(self.path))
+        self.assertRaises(OSError, daemon.serve, path=self.path)
+
+    def test_directory_of_another_user(self):
+        with mock.patch('os.getuid', return_value=os.getuid() + 1):
+            self.assertIsNone(diff_client.connect(self.path))
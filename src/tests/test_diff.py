@@ -0,0 +1,240 @@
+import io
+import os
+import json
+import zipfile
+import tempfile
+import multiprocessing
+import diff
+import cache
+from limits import Limits, LimitExceeded
+from unittest import TestCase, mock, skipUnless
+
+BOOK1 = os.path.join(os.path.dirname(__file__), 'Book1.xlsb')
+
+
+class TestGetVba(TestCase):
+
+    def test_modules(self):
+        modules = diff.get_vba(BOOK1)
+        self.assertEqual(list(modules), ['ThisWorkbook', 'Sheet1', 'Module1', 'Module2', 'Module3', 'newModule'])
+        self.assertEqual(modules['Module1'], 'Option Explicit\n\'test1\nSub test()\n    Debug.Print "hello1"\nEnd Sub')
+
+    def test_in_memory_workbooks(self):
+        with open(BOOK1, 'rb') as f:
+            content = f.read()
+        modules = diff.get_vba(BOOK1)
+        self.assertEqual(diff.get_vba(content), modules)
+        self.assertEqual(diff.get_vba(memoryview(content)), modules)
+        self.assertEqual(diff.get_vba(io.BytesIO(content)), modules)
+
+    def test_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            extraction_cache = cache.ExtractionCache(path=tmp)
+            read = diff.VBAModules.read
+            with mock.patch.object(diff.VBAModules, 'read', autospec=True, side_effect=read) as mock_read:
+                modules = diff.get_vba(BOOK1, oid='a' * 40, cache=extraction_cache)
+                self.assertEqual(mock_read.call_count, 1)
+                # the second lookup does not open the VBA project
+                self.assertEqual(diff.get_vba(BOOK1, oid='a' * 40, cache=extraction_cache), modules)
+                self.assertEqual(mock_read.call_count, 1)
+
+    def test_workbook_without_vba_does_not_load_oletools(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'Book2.xlsx')
+            with zipfile.ZipFile(path, 'w') as z:
+                z.writestr('xl/workbook.xml', '<workbook/>')
+            with mock.patch('oletools.olevba3.VBA_Parser') as mock_vba_parser:
+                self.assertEqual(diff.get_vba(path), {})
+                self.assertEqual(mock_vba_parser.call_count, 0)
+
+
+class TestChangedModules(TestCase):
+
+    def test_unchanged_modules_are_not_decoded(self):
+        workbook_a = diff.VBAModules(BOOK1)
+        workbook_b = diff.VBAModules(BOOK1)
+        with mock.patch.object(diff.VBAModules, 'decode') as mock_decode:
+            self.assertEqual(diff.changed_modules(workbook_a, workbook_b), ({}, {}))
+            self.assertEqual(mock_decode.call_count, 0)
+
+    def test_changed_module(self):
+        workbook_a = diff.VBAModules(BOOK1)
+        workbook_b = diff.VBAModules(BOOK1)
+        workbook_b.digests['Module1'] = 'b' * 40
+        workbook_b.sources['Module1'] = 'Option Explicit'
+        del workbook_b.digests['Module2']
+        modules_a, modules_b = diff.changed_modules(workbook_a, workbook_b)
+        self.assertEqual(sorted(modules_a), ['Module1', 'Module2'])
+        self.assertEqual(modules_a['Module1'], diff.get_vba(BOOK1)['Module1'])
+        self.assertEqual(modules_b, {'Module1': 'Option Explicit'})
+
+    def test_missing_workbook(self):
+        modules_a, modules_b = diff.changed_modules(diff.VBAModules(BOOK1), diff.VBAModules(None))
+        self.assertEqual(modules_a, diff.get_vba(BOOK1))
+        self.assertEqual(modules_b, {})
+
+
+class TestExtractChanges(TestCase):
+
+    @skipUnless('fork' in multiprocessing.get_all_start_methods(), 'children inherit the mocked cache')
+    def test_child_processes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            extraction_cache = cache.ExtractionCache(path=tmp)
+            # the old version has another Module1 and no Module2
+            old_digests = dict(diff.VBAModules(BOOK1).digests, Module1='b' * 40)
+            del old_digests['Module2']
+            extraction_cache.set('b' * 40, list(old_digests.items()))
+            extraction_cache.set('module-' + 'b' * 40, 'Option Explicit')
+            with mock.patch.object(diff, 'PARALLEL_SIZE', 0), mock.patch('os.cpu_count', return_value=2), \
+                    mock.patch.object(cache.ExtractionCache, 'from_environment', return_value=extraction_cache):
+                with diff.extract_changes(BOOK1, 'a' * 40, BOOK1, 'b' * 40, Limits()) as changes:
+                    digests_a, digests_b, modules_a, modules_b = changes
+                    self.assertIsInstance(modules_b, diff.ReceivedModules)
+                    self.assertEqual(digests_b, old_digests)
+                    self.assertEqual(list(modules_a), ['Module1', 'Module2'])
+                    self.assertEqual(modules_a['Module2'], diff.get_vba(BOOK1)['Module2'])
+                    self.assertEqual(dict(modules_b.items()), {'Module1': 'Option Explicit'})
+                # limits tripped in a child are raised when its modules are asked for
+                with self.assertRaises(LimitExceeded):
+                    with diff.extract_changes(BOOK1, 'a' * 40, BOOK1, 'b' * 40, Limits(max_lines=2)) as changes:
+                        dict(changes[2].items())
+
+    @skipUnless('fork' in multiprocessing.get_all_start_methods(), 'children inherit the mock')
+    def test_child_that_dies(self):
+        # as if the OOM killer ended it
+        with mock.patch.object(diff, 'PARALLEL_SIZE', 0), mock.patch('os.cpu_count', return_value=2), \
+                mock.patch('diff.VBAModules', side_effect=lambda *args, **kwargs: os._exit(3)):
+            with self.assertRaises(LimitExceeded) as context:
+                with diff.extract_changes(BOOK1, 'a' * 40, BOOK1, 'b' * 40, Limits()):
+                    pass
+        self.assertEqual(str(context.exception), 'extracting process ended unexpectedly (exit code 3)')
+
+
+class TestPrintDiffs(TestCase):
+
+    def test_without_color(self):
+        out = io.StringIO()
+        diffs = diff.diff_modules('Book1.xlsb', {'Module1': 'a\nc', 'Module2': 'x'}, {'Module1': 'a\nb'}, 3)
+        diff.print_diffs('Book1.xlsb', diffs, out, color=False)
+        self.assertEqual(out.getvalue(), 'diff --xl a/Book1.xlsb b/Book1.xlsb\n'
+                                         '--- a/Book1.xlsb/VBA/Module1\n+++ b/Book1.xlsb/VBA/Module1\n'
+                                         '@@ -1,2 +1,2 @@\n a\n-b\n+c\n\n'
+                                         '--- /dev/null\n+++ b/Book1.xlsb/VBA/Module2\n+x\n\n')
+
+    def test_with_color(self):
+        out = io.StringIO()
+        diff.print_diffs('Book1.xlsb', diff.diff_modules('Book1.xlsb', {}, {'Module1': 'a'}, 3), out)
+        self.assertEqual(out.getvalue(), '\x1b[1mdiff --xl a/Book1.xlsb b/Book1.xlsb\n'
+                                         '\x1b[1m--- b/Book1.xlsb/VBA/Module1\n\x1b[1m+++ /dev/null\n'
+                                         '\x1b[31m-a\n\n')
+
+    def test_renamed_modules(self):
+        out = io.StringIO()
+        old = {'Old': 'a\nb\nc\nd', 'Gone': 'x\ny'}
+        new = {'New': 'a\nb\nc\ne', 'Moved': 'x\ny'}
+        found = {'New': ('Old', 0.75, 'rename'), 'Moved': ('Gone', 1.0, 'rename')}
+        diff.print_diffs('Book1.xlsb', diff.diff_modules('Book1.xlsb', new, old, 3, renames=found), out, color=False)
+        self.assertEqual(out.getvalue(), 'diff --xl a/Book1.xlsb b/Book1.xlsb\n'
+                                         'similarity index 75%\nrename from Book1.xlsb/VBA/Old\n'
+                                         'rename to Book1.xlsb/VBA/New\n'
+                                         '--- a/Book1.xlsb/VBA/Old\n+++ b/Book1.xlsb/VBA/New\n'
+                                         '@@ -1,4 +1,4 @@\n a\n b\n c\n-d\n+e\n\n'
+                                         'similarity index 100%\nrename from Book1.xlsb/VBA/Gone\n'
+                                         'rename to Book1.xlsb/VBA/Moved\n\n')
+
+    def test_json(self):
+        found = {'New': ('Old', 0.75, 'rename')}
+        diffs = diff.diff_modules('Book1.xlsb', {'New': 'a\nb\nc\ne', 'Module2': 'x'}, {'Old': 'a\nb\nc\nd'}, 3,
+                                  renames=found)
+        out = io.StringIO()
+        diff.print_json('Book1.xlsb', diffs, out, ndjson=True)
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([(record['workbook'], record['module'], record['status']) for record in records],
+                         [('Book1.xlsb', 'New', 'renamed'), ('Book1.xlsb', 'Module2', 'added')])
+        self.assertEqual((records[0]['old_module'], records[0]['similarity']), ('Old', 0.75))
+        self.assertEqual(records[1]['hunks'][0]['lines'], [{'type': 'added', 'new': 1, 'text': 'x'}])
+
+        out = io.StringIO()
+        diff.print_json('Book1.xlsb', [], out, skipped='took too long')
+        self.assertEqual(json.loads(out.getvalue()), {'workbook': 'Book1.xlsb', 'modules': [],
+                                                      'skipped': 'took too long'})
+
+    def test_get_renames(self):
+        self.assertEqual(diff.get_renames({}), (0.5, False))
+        self.assertEqual(diff.get_renames({'diff.renames': 'copies'}), (0.5, True))
+        self.assertEqual(diff.get_renames({'diff.renames': 'false'}), (None, False))
+
+    @mock.patch.dict(os.environ, {'GIT_PAGER_IN_USE': ''})
+    def test_use_color(self):
+        self.assertTrue(diff.use_color(True, {}))
+        self.assertFalse(diff.use_color(False, {}))
+        self.assertTrue(diff.use_color(False, {'color.diff': 'always'}))
+        self.assertFalse(diff.use_color(True, {'color.ui': 'never'}))
+        self.assertTrue(diff.use_color(True, {'color.ui': 'never', 'color.diff': 'auto'}))
+        with mock.patch.dict(os.environ, {'GIT_PAGER_IN_USE': 'true'}):
+            self.assertTrue(diff.use_color(False, {}))
+
+
+class TestStat(TestCase):
+
+    def test_count_changes(self):
+        stats = diff.count_changes({'Module1': 'a\nc\nd', 'Module2': 'x\ny'}, {'Module1': 'a\nb', 'Module3': 'z'})
+        self.assertEqual(stats, [('Module1', 2, 1, None, None), ('Module2', 2, 0, 'new', None),
+                                 ('Module3', 0, 1, 'deleted', None)])
+
+    def test_moved_lines_are_unchanged(self):
+        self.assertEqual(diff.count_changes({'Module1': 'b\na\na'}, {'Module1': 'a\nb'}), [('Module1', 1, 0, None, None)])
+
+    def test_print_stat(self):
+        out = io.StringIO()
+        diff.print_stat('Book1.xlsb', [('Module1', 2, 1, None, None), ('Module10', 0, 12, 'deleted', None)], out,
+                        color=False, width=6)
+        self.assertEqual(out.getvalue(), ' Book1.xlsb/VBA/Module1  |  3 +-\n'
+                                         ' Book1.xlsb/VBA/Module10 | 12 ------\n'
+                                         ' 2 modules changed, 2 insertions(+), 13 deletions(-)\n'
+                                         ' delete module Book1.xlsb/VBA/Module10\n')
+
+    def test_print_numstat(self):
+        out = io.StringIO()
+        diff.print_numstat('Book1.xlsb', [('Module1', 2, 1, None, None), ('Module2', 0, 1, 'deleted', None)], out,
+                           z=True)
+        self.assertEqual(out.getvalue(), '2\t1\tBook1.xlsb/VBA/Module1\0' '0\t1\tBook1.xlsb/VBA/Module2\0')
+
+    def test_renamed_modules(self):
+        # a renamed module is counted against its old version instead of as a created and a deleted module
+        found = {'Renamed': ('Module3', 0.75, 'rename')}
+        stats = diff.count_changes({'Renamed': 'a\nb\nc\nd'}, {'Module3': 'a\nb\nc\ne'}, found)
+        self.assertEqual(stats, [('Renamed', 1, 1, 'renamed', ('Module3', 0.75))])
+        out = io.StringIO()
+        diff.print_stat('Book1.xlsb', stats, out, color=False)
+        self.assertEqual(out.getvalue(), ' Book1.xlsb/VBA/{Module3 => Renamed} | 2 +-\n'
+                                         ' 1 module changed, 1 insertion(+), 1 deletion(-)\n'
+                                         ' rename Book1.xlsb/VBA/{Module3 => Renamed} (75%)\n')
+        out = io.StringIO()
+        diff.print_numstat('Book1.xlsb', stats, out)
+        diff.print_numstat('Book1.xlsb', stats, out, z=True)
+        self.assertEqual(out.getvalue(), '1\t1\tBook1.xlsb/VBA/{Module3 => Renamed}\n'
+                                         '1\t1\t\0Book1.xlsb/VBA/Module3\0Book1.xlsb/VBA/Renamed\0')
+
+
+class TestTextconv(TestCase):
+
+    def test_modules_sorted_by_name(self):
+        out = io.StringIO()
+        diff.textconv(BOOK1, out)
+        names = [line for line in out.getvalue().split('\n') if line.startswith('Attribute VB_Name')]
+        self.assertEqual(names, ['Attribute VB_Name = "Module1"', 'Attribute VB_Name = "Module2"',
+                                 'Attribute VB_Name = "Module3"', 'Attribute VB_Name = "newModule"',
+                                 'Attribute VB_Name = "Sheet1"', 'Attribute VB_Name = "ThisWorkbook"'])
+        self.assertIn('Attribute VB_Name = "Module1"\n' + diff.get_vba(BOOK1)['Module1'] + '\n\n', out.getvalue())
+
+
+class TestIsIdentical(TestCase):
+
+    def test_blob_oids(self):
+        self.assertTrue(diff.is_identical(BOOK1, 'a' * 40, BOOK1, 'a' * 40))
+        self.assertFalse(diff.is_identical(BOOK1, 'a' * 40, BOOK1, 'b' * 40))
+
+    def test_file_content(self):
+        self.assertTrue(diff.is_identical(BOOK1, '0' * 40, BOOK1, 'a' * 40))
+        self.assertFalse(diff.is_identical(None, '.', BOOK1, 'a' * 40))
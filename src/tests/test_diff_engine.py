@@ -0,0 +1,58 @@
+import difflib
+import diff_engine
+import procedures
+from unittest import TestCase
+
+OLD = ['Option Explicit', '', 'Sub test()', '    Debug.Print "hello"', 'End Sub', '', 'Sub other()', '    x = 1',
+       '    y = 2', 'End Sub']
+NEW = ['Option Explicit', '', 'Sub test()', '    Debug.Print "hello world"', 'End Sub', '', 'Sub other()',
+       '    x = 1', '    z = 3', '    y = 2', 'End Sub', "'end"]
+
+
+class TestUnifiedDiff(TestCase):
+
+    def test_same_hunks_as_difflib(self):
+        expected = list(difflib.unified_diff(OLD, NEW, n=1, lineterm=''))[2:]
+        for algorithm in diff_engine.ALGORITHMS:
+            self.assertEqual(list(diff_engine.unified_diff(OLD, NEW, n=1, algorithm=algorithm)), expected)
+
+    def test_identical(self):
+        self.assertEqual(list(diff_engine.unified_diff(OLD, OLD)), [])
+
+    def test_added_and_removed_lines(self):
+        self.assertEqual(list(diff_engine.unified_diff([], ['a'])), ['@@ -0,0 +1 @@', '+a'])
+        self.assertEqual(list(diff_engine.unified_diff(['a', 'b'], [])), ['@@ -1,2 +0,0 @@', '-a', '-b'])
+
+    def test_opcodes_reproduce_new_lines(self):
+        old = ['a', 'b', 'c', 'a', 'b', 'b', 'a'] * 5
+        new = ['c', 'b', 'a', 'b', 'a', 'c'] * 5
+        for algorithm in diff_engine.ALGORITHMS:
+            result = []
+            for tag, i1, i2, j1, j2 in diff_engine.diff_opcodes(old, new, algorithm):
+                if tag == 'equal':
+                    self.assertEqual(old[i1:i2], new[j1:j2])
+                result += new[j1:j2]
+            self.assertEqual(result, new)
+
+    def test_structured_diff(self):
+        a = ['Sub a()', 'x = 1', 'End Sub']
+        b = ['Sub a()', 'x = 2', 'y = 3', 'End Sub']
+        hunk, = diff_engine.structured_diff(a, b, split=procedures.split_procedures)
+        self.assertEqual(hunk, {'old_start': 1, 'old_lines': 3, 'new_start': 1, 'new_lines': 4, 'function': None,
+                                'lines': [{'type': 'context', 'old': 1, 'new': 1, 'text': 'Sub a()'},
+                                          {'type': 'removed', 'old': 2, 'text': 'x = 1'},
+                                          {'type': 'added', 'new': 2, 'text': 'x = 2'},
+                                          {'type': 'added', 'new': 3, 'text': 'y = 3'},
+                                          {'type': 'context', 'old': 3, 'new': 4, 'text': 'End Sub'}]})
+        self.assertEqual(next(diff_engine.unified_diff(a, b)), '@@ -1,3 +1,4 @@')
+
+    def test_procedure_headers(self):
+        old = OLD + ['', 'Sub last()'] + ['    x = %d' % i for i in range(10)] + ['End Sub']
+        new = NEW + ['', 'Sub last()'] + ['    x = %d' % i for i in range(10) if i != 5] + ['End Sub']
+        for algorithm in diff_engine.ALGORITHMS:
+            headers = [line for line in diff_engine.unified_diff(old, new, n=1, algorithm=algorithm,
+                                                                 split=procedures.split_procedures)
+                       if line.startswith('@@')]
+            # the first hunk starts on a declaration: like git, only lines before the hunk are searched
+            self.assertEqual(headers, ['@@ -3,3 +3,3 @@', '@@ -8,4 +8,6 @@ Sub other()',
+                                       '@@ -17,3 +19,2 @@ Sub last()'])
@@ -0,0 +1,99 @@
+import io
+import os
+import json
+import shutil
+import tempfile
+import subprocess
+import export
+from unittest import TestCase, mock
+
+BOOK1 = os.path.join(os.path.dirname(__file__), 'Book1.xlsb')
+
+
+@mock.patch.dict(os.environ, {'GIT_XL_CACHE': '0'})
+class TestExport(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        subprocess.run(['git', 'init', '-q', '.'], cwd=self.tmp, check=True)
+        os.mkdir(os.path.join(self.tmp, 'models'))
+        shutil.copy(BOOK1, os.path.join(self.tmp, 'models', 'Book1.xlsb'))
+        self.manifest_path = os.path.join(self.tmp, '.git', 'xl', 'export.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_incremental_export(self):
+        changes = export.export(self.tmp, self.manifest_path, jobs=1)
+        self.assertEqual(changes[0], ('A', 'models/Book1.xlsb.vba/ThisWorkbook.bas'))
+        self.assertEqual(len(changes), 6)
+        with open(os.path.join(self.tmp, 'models', 'Book1.xlsb.vba', 'Module1.bas'), 'r') as f:
+            self.assertEqual(f.read(), 'Option Explicit\n\'test1\nSub test()\n    Debug.Print "hello1"\nEnd Sub\n')
+
+        # an unchanged workbook is not even opened
+        with mock.patch('export.export_workbook') as mock_export_workbook:
+            self.assertEqual(export.export(self.tmp, self.manifest_path, jobs=1), [])
+            self.assertEqual(mock_export_workbook.call_count, 0)
+
+        # a module that changed since the last export is written again, a module that is gone is deleted
+        with open(self.manifest_path, 'r') as f:
+            manifest = json.load(f)
+        modules = manifest['workbooks']['models/Book1.xlsb']['modules']
+        modules['Module2'] = 'b' * 40
+        modules['Module4'] = 'c' * 40
+        with open(self.manifest_path, 'w') as f:
+            json.dump(manifest, f)
+        os.utime(os.path.join(self.tmp, 'models', 'Book1.xlsb'), (0, 0))
+        with open(os.path.join(self.tmp, 'models', 'Book1.xlsb.vba', 'Module4.bas'), 'w') as f:
+            f.write('Sub removed()\nEnd Sub\n')
+        # Module2.bas still has the content of Module2 and is left alone
+        self.assertEqual(export.export(self.tmp, self.manifest_path, jobs=1),
+                         [('D', 'models/Book1.xlsb.vba/Module4.bas')])
+
+    def test_deleted_workbook(self):
+        export.export(self.tmp, self.manifest_path, jobs=1)
+        os.remove(os.path.join(self.tmp, 'models', 'Book1.xlsb'))
+        changes = export.export(self.tmp, self.manifest_path, jobs=1)
+        self.assertEqual(len(changes), 6)
+        self.assertEqual({status for status, _ in changes}, {'D'})
+        self.assertFalse(os.path.exists(os.path.join(self.tmp, 'models', 'Book1.xlsb.vba')))
+        with open(self.manifest_path, 'r') as f:
+            self.assertEqual(json.load(f)['workbooks'], {})
+
+    def test_unsafe_module_names(self):
+        workbook = mock.Mock(digests={'../../evil': 'a' * 40, 'C:evil': 'b' * 40, 'Module1': 'c' * 40})
+        workbook.source.side_effect = lambda name: 'Sub x()\nEnd Sub'
+        with mock.patch('diff.VBAModules', return_value=workbook):
+            changes = export.export(self.tmp, self.manifest_path, jobs=1)
+        self.assertEqual(changes, [('A', 'models/Book1.xlsb.vba/Module1.bas')])
+        self.assertEqual(sorted(os.listdir(self.tmp)), ['.git', 'models'])
+        self.assertEqual(sorted(os.listdir(os.path.join(self.tmp, 'models'))), ['Book1.xlsb', 'Book1.xlsb.vba'])
+        self.assertTrue(export.is_safe_module_name('Módulo1'))
+        for name in ('', '..', 'a/b', 'a\\b', 'a\0b', 'C:x'):
+            self.assertFalse(export.is_safe_module_name(name), name)
+
+    def test_staged(self):
+        shutil.copy(BOOK1, os.path.join(self.tmp, 'Book2.xlsb'))
+        subprocess.run(['git', 'add', 'models/Book1.xlsb'], cwd=self.tmp, check=True)
+        export.run(staged=True, out=io.StringIO(), path=self.tmp)
+        staged = subprocess.run(['git', 'diff', '--cached', '--name-only'], cwd=self.tmp, stdout=subprocess.PIPE,
+                                universal_newlines=True, check=True).stdout.split()
+        self.assertIn('models/Book1.xlsb.vba/Module1.bas', staged)
+        # only staged workbooks are exported
+        self.assertFalse(os.path.exists(os.path.join(self.tmp, 'Book2.xlsb.vba')))
+
+    def test_staged_exports_the_index(self):
+        subprocess.run(['git', 'add', 'models/Book1.xlsb'], cwd=self.tmp, check=True)
+        # saved again after `git add`: the commit still gets the staged version
+        with open(os.path.join(self.tmp, 'models', 'Book1.xlsb'), 'wb') as f:
+            f.write(b'not staged')
+        export.run(staged=True, out=io.StringIO(), path=self.tmp)
+        with open(os.path.join(self.tmp, 'models', 'Book1.xlsb.vba', 'Module1.bas'), 'r') as f:
+            self.assertEqual(f.read(), 'Option Explicit\n\'test1\nSub test()\n    Debug.Print "hello1"\nEnd Sub\n')
+
+        # a staged deletion removes the modules
+        subprocess.run(['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com', 'commit', '-q', '-m', 'add'],
+                       cwd=self.tmp, check=True)
+        subprocess.run(['git', 'rm', '-q', '-f', '--cached', 'models/Book1.xlsb'], cwd=self.tmp, check=True)
+        export.run(staged=True, out=io.StringIO(), path=self.tmp)
+        self.assertFalse(os.path.exists(os.path.join(self.tmp, 'models', 'Book1.xlsb.vba')))
@@ -0,0 +1,46 @@
+import io
+import os
+import shutil
+import tempfile
+import subprocess
+import fleet
+from unittest import TestCase, mock
+
+
+@mock.patch('cli.is_frozen', return_value=True)
+class TestFleet(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        for name in ('a', 'b'):
+            subprocess.run(['git', 'init', '-q', name], cwd=self.tmp, check=True)
+        os.mkdir(os.path.join(self.tmp, 'c'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def run_fleet(self, spec, **kwargs):
+        out = io.StringIO()
+        status = fleet.run(os.path.join(self.tmp, spec), out=out, jobs=2, **kwargs)
+        return status, out.getvalue().replace(self.tmp + os.sep, '').split('\n')
+
+    def test_install_and_verify(self, mock_is_frozen):
+        self.assertEqual(self.run_fleet('*'),
+                         (1, ['installed a', 'installed b', 'error     c: not a Git repository', '1 error, 2 installed', '']))
+        self.assertEqual(self.run_fleet('*', verifying=True),
+                         (1, ['ok        a', 'ok        b', 'error     c: not a Git repository', '1 error, 2 ok', '']))
+
+        # repositories that are set up are not written again
+        attributes_path = os.path.join(self.tmp, 'a', '.gitattributes')
+        os.utime(attributes_path, (0, 0))
+        os.remove(os.path.join(self.tmp, 'b', '.gitignore'))
+        self.assertEqual(self.run_fleet('[ab]', verifying=True),
+                         (1, ['ok        a', 'failed    b: .gitignore is missing 9 of 9 entries', '1 failed, 1 ok', '']))
+        self.assertEqual(self.run_fleet('[ab]'), (0, ['unchanged a', 'installed b', '1 installed, 1 unchanged', '']))
+        self.assertEqual(os.stat(attributes_path).st_mtime, 0)
+
+    def test_repository_list(self, mock_is_frozen):
+        with open(os.path.join(self.tmp, 'repos.txt'), 'w') as f:
+            f.write('# build agents\nb\n\na\n')
+        self.assertEqual(fleet.list_repositories(os.path.join(self.tmp, 'repos.txt')),
+                         [os.path.join(self.tmp, 'a'), os.path.join(self.tmp, 'b')])
@@ -0,0 +1,99 @@
+import os
+import stat
+import subprocess
+import tempfile
+import gitconfig
+from unittest import TestCase, mock, skipIf
+
+CONFIG = ['[core]\n', '\tbare = false\n', '# comment\n', '[diff "xl"]\n', '\tcommand = old\n']
+
+
+class TestApplyChange(TestCase):
+
+    def test_replace_value(self):
+        lines = gitconfig.apply_change(CONFIG, 'set', 'diff.xl.command', 'new')
+        self.assertEqual(lines, CONFIG[:4] + ['\tcommand = new\n'])
+
+    def test_add_to_existing_section(self):
+        lines = gitconfig.apply_change(CONFIG, 'set', 'core.attributesFile', '~/.gitattributes')
+        self.assertEqual(lines, CONFIG[:2] + ['\tattributesfile = ~/.gitattributes\n'] + CONFIG[2:])
+
+    def test_add_section(self):
+        lines = gitconfig.apply_change(CONFIG, 'set', 'diff.other.textconv', 'cat #x')
+        self.assertEqual(lines, CONFIG + ['[diff "other"]\n', '\ttextconv = "cat #x"\n'])
+
+    def test_unset_and_remove_section(self):
+        self.assertEqual(gitconfig.apply_change(CONFIG, 'unset', 'core.bare', None), [CONFIG[0]] + CONFIG[2:])
+        self.assertEqual(gitconfig.apply_change(CONFIG, 'remove-section', 'diff.xl', None), CONFIG[:3])
+
+    def test_unsupported(self):
+        with self.assertRaises(gitconfig.UnsupportedConfigFile):
+            gitconfig.apply_change(['[core]\n', '\tbare = \\\n', 'false\n'], 'set', 'core.bare', 'true')
+
+
+class TestGitConfig(TestCase):
+
+    def test_set_skips_unchanged_values(self):
+        config = gitconfig.GitConfig([('local', 'file:.git/config', 'diff.xl.command', 'x')])
+        config.set('diff.xl.command', 'x', 'local')
+        config.set('diff.xl.textconv', 'y', 'local')
+        self.assertEqual(config.changes, [('set', 'local', 'diff.xl.textconv', 'y')])
+        self.assertEqual(config.get('diff.xl.textconv'), 'y')
+
+    def test_read_and_write(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            subprocess.run(['git', 'init', '-q', tmp], check=True)
+            config = gitconfig.GitConfig.read(tmp)
+            self.assertTrue(config.is_repository)
+            config.set('diff.xl.command', 'git-xl-diff', 'local')
+            config.set('diff.xl.cachetextconv', 'true', 'local')
+            config.write()
+            self.assertFalse(os.path.exists(os.path.join(tmp, '.git', 'config.lock')))
+
+            config = gitconfig.GitConfig.read(tmp)
+            self.assertEqual(config.get('diff.xl.command', 'local'), 'git-xl-diff')
+            config.remove_section('diff.xl', 'local')
+            config.write()
+            self.assertIsNone(gitconfig.GitConfig.read(tmp).get('diff.xl.command'))
+
+    def test_global_write(self):
+        with tempfile.TemporaryDirectory() as home:
+            environment = {'HOME': home, 'XDG_CONFIG_HOME': os.path.join(home, '.config'), 'GIT_CONFIG_NOSYSTEM': '1'}
+            with mock.patch.dict(os.environ, environment):
+                os.environ.pop('GIT_CONFIG_GLOBAL', None)
+                config = gitconfig.GitConfig.read(home)
+                config.set('diff.xl.command', 'git-xl-diff', 'global')
+                # pending values have no origin
+                self.assertEqual(config.file_path('global'), os.path.join(home, '.gitconfig'))
+                config.write()
+                self.assertEqual(gitconfig.GitConfig.read(home).get('diff.xl.command', 'global'), 'git-xl-diff')
+
+    def test_global_file_path(self):
+        # ~/.gitconfig wins over the XDG file whenever it exists, like in git
+        with tempfile.TemporaryDirectory() as home:
+            xdg_path = os.path.join(home, '.config', 'git', 'config')
+            os.makedirs(os.path.dirname(xdg_path))
+            with open(xdg_path, 'w') as f:
+                f.write('[user]\n\tname = xdg\n')
+            environment = {'HOME': home, 'XDG_CONFIG_HOME': os.path.join(home, '.config'), 'GIT_CONFIG_NOSYSTEM': '1'}
+            with mock.patch.dict(os.environ, environment):
+                os.environ.pop('GIT_CONFIG_GLOBAL', None)
+                self.assertEqual(gitconfig.GitConfig.read(home).file_path('global'), xdg_path)
+                with open(os.path.join(home, '.gitconfig'), 'w') as f:
+                    f.write('[user]\n\temail = home\n')
+                self.assertEqual(gitconfig.GitConfig.read(home).file_path('global'), os.path.join(home, '.gitconfig'))
+
+    @skipIf(os.name == 'nt', 'symlinks and file modes')
+    def test_write_through_symlink_and_keep_mode(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            target = os.path.join(tmp, 'dotfiles-gitconfig')
+            with open(target, 'w') as f:
+                f.write('[user]\n\tname = x\n')
+            os.chmod(target, 0o600)
+            link = os.path.join(tmp, '.gitconfig')
+            os.symlink(target, link)
+            gitconfig.write_config_file(link, [('set', 'global', 'diff.xl.command', 'git-xl-diff')])
+            self.assertTrue(os.path.islink(link))
+            self.assertEqual(stat.S_IMODE(os.stat(target).st_mode), 0o600)
+            with open(target, 'r') as f:
+                self.assertEqual(f.read(), '[user]\n\tname = x\n[diff "xl"]\n\tcommand = git-xl-diff\n')
@@ -0,0 +1,122 @@
+import io
+import os
+import shutil
+import tempfile
+import subprocess
+import history
+from unittest import TestCase, mock
+
+BOOK1 = os.path.join(os.path.dirname(__file__), 'Book1.xlsb')
+
+
+def git(repository, *args):
+    subprocess.run(['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com'] + list(args),
+                   cwd=repository, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+
+
+class TestSplitModulePath(TestCase):
+
+    def test_split(self):
+        self.assertEqual(history.split_module_path('dir/Model.xlsm/Pricing'), ('dir/Model.xlsm', 'Pricing'))
+        self.assertEqual(history.split_module_path('Model.xlsm/VBA/Pricing'), ('Model.xlsm', 'Pricing'))
+
+
+@mock.patch.dict(os.environ, {'GIT_XL_CACHE': '0'})
+class TestHistoryIndex(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        git(self.tmp, 'init', '-q', '.')
+        shutil.copy(BOOK1, os.path.join(self.tmp, 'Book1.xlsb'))
+        git(self.tmp, 'add', 'Book1.xlsb')
+        git(self.tmp, 'commit', '-q', '-m', 'add workbook')
+        git(self.tmp, 'rm', '-q', 'Book1.xlsb')
+        git(self.tmp, 'commit', '-q', '-m', 'remove workbook')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_incremental_update(self):
+        with history.HistoryIndex.from_repository(self.tmp) as index:
+            self.assertEqual(index.update(self.tmp, jobs=1), 2)
+            self.assertEqual(index.update(self.tmp, jobs=1), 0)
+            log = index.log('Book1.xlsb', 'Module1')
+            self.assertEqual([row[3] for row in log], ['remove workbook', 'add workbook'])
+            _, _, _, _, hash, old_hash = log[1]
+            self.assertIsNone(old_hash)
+            self.assertTrue(index.source(hash).startswith('Option Explicit'))
+            self.assertEqual(index.log('Book1.xlsb', 'Module1')[0][4], None)
+
+            git(self.tmp, 'commit', '-q', '--allow-empty', '-m', 'empty')
+            self.assertEqual(index.update(self.tmp, jobs=1), 0)
+
+    def test_print_log(self):
+        with history.HistoryIndex.from_repository(self.tmp) as index:
+            index.update(self.tmp, jobs=1)
+            out = io.StringIO()
+            history.print_log(index, 'Book1.xlsb', 'Module1', out, patch=True, color=False)
+        lines = out.getvalue().split('\n')
+        self.assertTrue(lines[0].endswith(' test remove workbook (deleted module)'))
+        self.assertIn('+++ b/Book1.xlsb/VBA/Module1', lines)
+
+    @mock.patch('sys.stderr', new_callable=io.StringIO)
+    def test_run_without_commits(self, mock_stderr):
+        out = io.StringIO()
+        with mock.patch('history.HistoryIndex.from_repository', return_value=None):
+            self.assertEqual(history.run('Book1.xlsb/Module1', out=out), 1)
+        with history.HistoryIndex.from_repository(self.tmp) as index:
+            index.update(self.tmp, jobs=1)
+        index = history.HistoryIndex.from_repository(self.tmp)
+        with mock.patch('history.HistoryIndex.from_repository', return_value=index):
+            self.assertEqual(history.run('Book1.xlsb/Module9', out=out), 1)
+        self.assertEqual(out.getvalue(), '')
+        self.assertEqual(mock_stderr.getvalue().split('\n')[:2], [
+            'Error: no history index, run "git xl index" first',
+            'No commits found for module "Module9", the index knows: Module1, Module2, Module3, Sheet1, ThisWorkbook, newModule'])
+
+    def test_failed_walk_is_not_recorded(self):
+        with history.HistoryIndex.from_repository(self.tmp) as index:
+            # the tips are read, then `git log` fails, like a git without --diff-merges
+            with mock.patch('history.revisions', side_effect=[['--branches'], ['--branches', '--no-such-option']]):
+                self.assertRaises(subprocess.CalledProcessError, index.update, self.tmp, jobs=1)
+            self.assertEqual(index.tips(), [])
+            self.assertEqual(index.update(self.tmp, jobs=1), 2)
+
+    def test_empty_repository(self):
+        empty = tempfile.mkdtemp()
+        try:
+            git(empty, 'init', '-q', '.')
+            with history.HistoryIndex.from_repository(empty) as index:
+                self.assertEqual(index.update(empty, jobs=1), 0)
+        finally:
+            shutil.rmtree(empty)
+
+    def test_modules_are_identified_by_their_text(self):
+        with history.HistoryIndex.from_repository(self.tmp) as index:
+            index.update(self.tmp, jobs=1)
+            hash = index.log('Book1.xlsb', 'Module1')[1][4]
+            self.assertEqual(hash, history.source_hash(index.source(hash)))
+
+            # a version that is not in the index is reported instead of diffed
+            index.connection.execute('DELETE FROM sources')
+            out = io.StringIO()
+            history.print_log(index, 'Book1.xlsb', 'Module1', out, patch=True, color=False)
+        self.assertIn('(the source of Module1 in this commit is missing from the index)', out.getvalue())
+
+    def test_same_text_from_either_parser_is_unchanged(self):
+        with open(BOOK1, 'rb') as f:
+            data = f.read()
+        open_vba_project = history.diff.open_vba_project
+        calls = []
+
+        def open_new_version_only(data, max_size):
+            # the old version is read by oletools, as if the dir stream parser had failed on it
+            calls.append(data)
+            if len(calls) > 1:
+                raise ValueError('unsupported dir stream')
+            return open_vba_project(data, max_size)
+
+        with mock.patch('diff.open_vba_project', side_effect=open_new_version_only):
+            changes, sources = history.extract(data, None, data, None)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(changes, [])
@@ -0,0 +1,96 @@
+import io
+import os
+import time
+import limits
+import diff
+from unittest import TestCase, mock
+
+BOOK1 = os.path.join(os.path.dirname(__file__), 'Book1.xlsb')
+
+
+class TestLimits(TestCase):
+
+    def test_checks(self):
+        guard = limits.Limits(max_size=100, max_lines=2)
+        guard.check_size(100)
+        self.assertRaises(limits.LimitExceeded, guard.check_size, 101)
+        guard.check_lines({'Module1': 'a\nb'})
+        self.assertRaises(limits.LimitExceeded, guard.check_lines, {'Module1': 'a\nb\nc'})
+        limits.Limits(max_size=0).check_size(1 << 40)
+
+    def test_timeout(self):
+        with self.assertRaises(limits.LimitExceeded):
+            with limits.Limits(timeout=0.05).guard():
+                time.sleep(1)
+        # the timer does not outlive the guard
+        with limits.Limits(timeout=0.05).guard():
+            pass
+        time.sleep(0.1)
+
+    def test_timeout_is_not_swallowed(self):
+        # oletools catches Exception around its parsing
+        with self.assertRaises(limits.LimitExceeded):
+            with limits.Limits(timeout=0.05).guard():
+                for _ in range(20):
+                    try:
+                        time.sleep(0.05)
+                    except Exception:
+                        pass
+
+    def test_paused(self):
+        # time spent writing to git's pager does not count
+        guard = limits.Limits(timeout=0.1)
+        with guard.guard():
+            with guard.paused():
+                time.sleep(0.2)
+            time.sleep(0.05)
+        with self.assertRaises(limits.LimitExceeded):
+            with guard.guard():
+                with guard.paused():
+                    time.sleep(0.05)
+                time.sleep(0.2)
+
+    def test_deadline_writer_streams(self):
+        # the output of a huge module is handed on in chunks, not kept until the module is done
+        out = io.StringIO()
+        writer = diff.DeadlineWriter(out, limits.Limits())
+        line = 'x' * 1023 + '\n'
+        for _ in range(100):
+            writer.write(line)
+        self.assertEqual(len(out.getvalue()), 64 * 1024)
+        writer.flush()
+        self.assertEqual(out.getvalue(), line * 100)
+
+    def test_decompressed_vba_size(self):
+        # vbaProject.bin is checked while it is inflated, module sources while they are decompressed
+        self.assertRaises(limits.LimitExceeded, diff.VBAModules, BOOK1, limits=limits.Limits(max_vba_size=100))
+        modules = diff.VBAModules(BOOK1, limits=limits.Limits(max_vba_size=0))
+        modules.limits.max_vba_size = 100
+        modules.source('Module3')
+        self.assertRaises(limits.LimitExceeded, modules.source, 'Module1')
+
+
+class TestMain(TestCase):
+
+    @mock.patch.dict(os.environ, {'GIT_XL_CACHE': '0', 'GIT_XL_MAX_SIZE': '1000'})
+    def test_diff_skipped(self):
+        out = io.StringIO()
+        diff.main(['Book1.xlsb', BOOK1, '0' * 40, '100644', '/dev/null', '0' * 40, '100644'], out=out, tty=False)
+        self.assertEqual(out.getvalue().split('\n')[1],
+                         'diff skipped: workbook is 8021 bytes, more than GIT_XL_MAX_SIZE (1000 bytes)')
+
+    @mock.patch.dict(os.environ, {'GIT_XL_CACHE': '0', 'GIT_XL_TIMEOUT': '1'})
+    def test_slow_reader_is_not_a_timeout(self):
+        class Pager(io.StringIO):
+            # a user reading the first page for longer than GIT_XL_TIMEOUT
+            waited = False
+
+            def flush(self):
+                if not self.waited:
+                    self.waited = True
+                    time.sleep(1.2)
+
+        out = Pager()
+        diff.main(['Book1.xlsb', BOOK1, '0' * 40, '100644', '/dev/null', '0' * 40, '100644'], out=out, tty=False)
+        self.assertNotIn('diff skipped', out.getvalue())
+        self.assertIn('--- b/Book1.xlsb/VBA/Module1', out.getvalue())
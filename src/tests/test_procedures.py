@@ -0,0 +1,14 @@
+import procedures
+from unittest import TestCase
+
+
+class TestSplitProcedures(TestCase):
+
+    def test_blocks(self):
+        lines = ['Option Explicit', '', 'Public Function Version() As String', '    Version = "v1"', 'End Function',
+                 '', "' comment", 'Private Property Get Name()', 'End Property', 'Sub Unfinished()', '    x = 1']
+        self.assertEqual(procedures.split_procedures(lines), [
+            (None, 0, 2), ('Version', 2, 5), (None, 5, 7), ('Name', 7, 9), ('Unfinished', 9, 11)])
+
+    def test_end_outside_procedure(self):
+        self.assertEqual(procedures.split_procedures(['End Sub', 'x = 1']), [(None, 0, 2)])
@@ -0,0 +1,43 @@
+import renames
+from unittest import TestCase
+
+BODY = '\n'.join(f'    total = total + {i}' for i in range(40))
+
+
+class TestParseScore(TestCase):
+
+    def test_scores(self):
+        self.assertEqual(renames.parse_score(''), 0.5)
+        self.assertEqual(renames.parse_score('90%'), 0.9)
+        self.assertEqual(renames.parse_score('9'), 0.9)
+        self.assertEqual(renames.parse_score('05'), 0.05)
+        self.assertRaises(ValueError, renames.parse_score, 'x')
+
+    def test_options(self):
+        self.assertEqual(renames.parse_option('-M70%'), (0.7, False))
+        self.assertEqual(renames.parse_option('--find-copies'), (0.5, True))
+        self.assertEqual(renames.parse_option('--no-renames', 0.5, True), (None, False))
+        self.assertIsNone(renames.parse_option('-U5'))
+
+
+class TestFindRenames(TestCase):
+
+    def test_exact_and_similar_renames(self):
+        new = {'Renamed': 'Sub a()\n' + BODY + '\nEnd Sub', 'Edited': 'Sub b()\n' + BODY + '\n    x = 1\nEnd Sub'}
+        old = {'Module1': 'Sub a()\n' + BODY + '\nEnd Sub', 'Module2': 'Sub b()\n' + BODY + '\nEnd Sub'}
+        found = renames.find_renames(new, old)
+        self.assertEqual(found['Renamed'], ('Module1', 1.0, 'rename'))
+        self.assertEqual(found['Edited'][::2], ('Module2', 'rename'))
+        self.assertGreater(found['Edited'][1], 0.9)
+
+    def test_threshold(self):
+        new = {'New': 'Sub a()\n' + BODY + '\nEnd Sub'}
+        old = {'Old': 'Sub a()\n' + BODY[:len(BODY) // 2] + '\nEnd Sub'}
+        self.assertEqual(renames.find_renames(new, old, threshold=0.9), {})
+        self.assertEqual(list(renames.find_renames(new, old, threshold=0.4)), ['New'])
+
+    def test_copies(self):
+        new = {'Module1': 'Sub a()\n' + BODY + '\n    x = 1\nEnd Sub', 'Copy': 'Sub a()\n' + BODY + '\nEnd Sub'}
+        old = {'Module1': 'Sub a()\n' + BODY + '\nEnd Sub'}
+        self.assertEqual(renames.find_renames(new, old), {})
+        self.assertEqual(renames.find_renames(new, old, copies=True), {'Copy': ('Module1', 1.0, 'copy')})
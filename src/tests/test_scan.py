@@ -0,0 +1,63 @@
+import io
+import os
+import shutil
+import tempfile
+import subprocess
+import renames
+import scan
+from unittest import TestCase, mock
+
+BOOK1 = os.path.join(os.path.dirname(__file__), 'Book1.xlsb')
+BODY = '\n'.join(f'    total = total + {i}' for i in range(40))
+
+
+def module(source):
+    import hashlib
+    return [hashlib.sha1(source.encode('utf-8')).hexdigest(), source.count('\n') + 1,
+            list(renames.signature(renames.features(source)))]
+
+
+class TestFindDuplicates(TestCase):
+
+    def test_groups(self):
+        utils = 'Sub a()\n' + BODY + '\nEnd Sub'
+        workbooks = {
+            'A.xlsm': {'Utils': module(utils), 'Other': module('Sub other()\n    x = 1\nEnd Sub')},
+            'B.xlsm': {'Utils': module(utils)},
+            'C.xlsm': {'Helpers': module(utils.replace('+ 3\n', '- 3\n'))},
+        }
+        groups = scan.find_duplicates(workbooks)
+        self.assertEqual(len(groups), 1)
+        first, second = groups[0]['variants']
+        self.assertEqual(first['modules'], [{'workbook': 'A.xlsm', 'module': 'Utils'},
+                                            {'workbook': 'B.xlsm', 'module': 'Utils'}])
+        self.assertEqual(second['modules'], [{'workbook': 'C.xlsm', 'module': 'Helpers'}])
+        self.assertGreater(second['similarity'], 0.8)
+        self.assertEqual(scan.find_duplicates(workbooks, similarity=1.0)[0]['variants'], [first])
+
+        out = io.StringIO()
+        scan.print_groups(groups, out, color=False)
+        self.assertTrue(out.getvalue().startswith('3 modules in 2 versions\n'))
+
+
+@mock.patch.dict(os.environ, {'GIT_XL_CACHE': '0'})
+class TestScan(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        subprocess.run(['git', 'init', '-q', '.'], cwd=self.tmp, check=True)
+        shutil.copy(BOOK1, os.path.join(self.tmp, 'Book1.xlsb'))
+        shutil.copy(BOOK1, os.path.join(self.tmp, 'Book2.xlsb'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_rescan_reuses_state(self):
+        state_path = os.path.join(self.tmp, '.git', 'xl', 'scan.json')
+        workbooks = scan.scan(self.tmp, jobs=1, state_path=state_path)
+        self.assertEqual(sorted(workbooks), ['Book1.xlsb', 'Book2.xlsb'])
+        # empty document modules are left out
+        self.assertEqual(sorted(workbooks['Book1.xlsb']), ['Module1', 'Module2', 'Module3'])
+        with mock.patch('scan.ProcessPoolExecutor') as mock_pool:
+            self.assertEqual(scan.scan(self.tmp, jobs=1, state_path=state_path), workbooks)
+            self.assertEqual(mock_pool.call_count, 0)
@@ -0,0 +1,39 @@
+import os
+import json
+import tempfile
+import tracing
+from unittest import TestCase, mock
+
+
+class TestTracing(TestCase):
+
+    @mock.patch.dict(os.environ, {'GIT_XL_TRACE': ''})
+    def test_disabled(self):
+        self.assertFalse(tracing.enabled())
+        self.assertIs(tracing.region('extract'), tracing.NULL_REGION)
+
+    def test_file_target(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'trace.jsonl')
+            with mock.patch.dict(os.environ, {'GIT_XL_TRACE': path}):
+                with tracing.region('extract', size=10) as region:
+                    region.set(modules=2)
+                    region.add('bytes', 5)
+                    region.add('bytes', 5)
+                tracing.exit(1)
+            # closes the trace file
+            with mock.patch.dict(os.environ, {'GIT_XL_TRACE': ''}):
+                tracing.get_fd()
+            with open(path) as f:
+                events = [json.loads(line) for line in f]
+        self.assertEqual([event['event'] for event in events], ['region', 'exit'])
+        self.assertEqual(events[0]['name'], 'extract')
+        self.assertEqual((events[0]['size'], events[0]['modules'], events[0]['bytes']), (10, 2, 10))
+        self.assertGreaterEqual(events[0]['duration'], 0)
+        self.assertEqual(events[1]['status'], 1)
+
+    def test_open_target(self):
+        self.assertIsNone(tracing.open_target('0'))
+        self.assertEqual(tracing.open_target('true'), 2)
+        self.assertEqual(tracing.open_target('3'), 3)
+        self.assertIsNone(tracing.open_target('relative/path'))
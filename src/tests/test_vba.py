@@ -0,0 +1,108 @@
+import io
+import os
+import zipfile
+import tempfile
+import vba
+from unittest import TestCase
+
+BOOK1 = os.path.join(os.path.dirname(__file__), 'Book1.xlsb')
+
+
+class TestHasVbaProject(TestCase):
+
+    def test_workbook_with_vba(self):
+        with vba.open_workbook(BOOK1) as data:
+            self.assertTrue(vba.has_vba_project(data))
+
+    def test_workbook_without_vba(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'Book2.xlsx')
+            with zipfile.ZipFile(path, 'w') as z:
+                z.writestr('[Content_Types].xml', '<Types/>')
+                z.writestr('xl/workbook.xml', '<workbook/>')
+            with open(path, 'rb') as f:
+                self.assertFalse(vba.has_vba_project(f.read()))
+
+    def test_unknown_container(self):
+        self.assertTrue(vba.has_vba_project(b'not a workbook'))
+
+    def test_ole_storage_names(self):
+        with zipfile.ZipFile(BOOK1) as z:
+            vba_project = z.read('xl/vbaProject.bin')
+        self.assertIn('VBA', vba.ole_storage_names(vba_project))
+
+
+class TestOpenWorkbook(TestCase):
+
+    def test_inputs(self):
+        with open(BOOK1, 'rb') as f:
+            content = f.read()
+        for workbook in (BOOK1, content, memoryview(content), io.BytesIO(content)):
+            with vba.open_workbook(workbook) as data:
+                self.assertEqual(bytes(data), content)
+        with open(BOOK1, 'rb') as f:
+            with vba.open_workbook(f) as data:
+                self.assertEqual(data[:], content)
+
+
+class TestVBAProject(TestCase):
+
+    def test_module_streams(self):
+        with vba.open_workbook(BOOK1) as data:
+            project = vba.open_vba_project(data)
+            streams = dict(project.module_streams())
+        self.assertEqual(project.codepage, 1252)
+        self.assertEqual(list(streams), ['ThisWorkbook', 'Sheet1', 'Module1', 'Module2', 'Module3', 'newModule'])
+        self.assertTrue(project.decode(streams['Module1']).startswith('Attribute VB_Name = "Module1"'))
+
+    def test_workbook_without_vba(self):
+        data = io.BytesIO()
+        with zipfile.ZipFile(data, 'w') as z:
+            z.writestr('xl/workbook.xml', '<workbook/>')
+        self.assertIsNone(vba.open_vba_project(data.getvalue()))
+
+
+class TestDecompress(TestCase):
+
+    def assertSameAsOletools(self, compressed):
+        from oletools.olevba import decompress_stream
+        try:
+            expected = bytes(decompress_stream(bytearray(compressed)))
+        except Exception:
+            self.assertRaises(Exception, vba.decompress, compressed)
+        else:
+            self.assertEqual(vba.decompress(compressed), expected)
+
+    def test_module_streams(self):
+        with vba.open_workbook(BOOK1) as data:
+            project = vba.open_vba_project(data)
+            streams = [project.ole.openstream(project.root + ['VBA', 'dir']).read()]
+            streams += [stream for _, stream in project.module_streams()]
+        for stream in streams:
+            self.assertSameAsOletools(stream)
+            # corrupt streams fail or decompress to the same garbage
+            for position in range(1, len(stream), 7):
+                self.assertSameAsOletools(stream[:position] + bytes([~stream[position] & 0xFF]) + stream[position + 1:])
+                self.assertSameAsOletools(stream[:position])
+
+    def test_tokens(self):
+        # a literal and a copy token that repeats it 10 times, overlapping its own output
+        self.assertEqual(vba.decompress(b'\x01\x03\xb0\x02a\x07\x00'), b'a' * 11)
+        # an uncompressed chunk
+        self.assertEqual(vba.decompress(b'\x01\xff\x3f' + b'x' * 4096), b'x' * 4096)
+        for compressed in (b'', b'\x00', b'\x01\x03\x30', b'\x01\x03\xb0\x01\x07\x00'):
+            self.assertRaises(Exception, vba.decompress, compressed)
+
+
+class TestZipMemberStream(TestCase):
+
+    def test_read_in_chunks(self):
+        content = os.urandom(100000) + b'x' * 500000
+        for method in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            f = io.BytesIO()
+            with zipfile.ZipFile(f, 'w', method) as z:
+                z.writestr('xl/worksheets/sheet1.xml', content)
+            entry, = vba.zip_directory(f.getvalue())
+            self.assertEqual(entry['crc'], zipfile.crc32(content))
+            stream = io.BufferedReader(vba.ZipMemberStream(f.getvalue(), entry))
+            self.assertEqual(b''.join(iter(lambda: stream.read(10000), b'')), content)
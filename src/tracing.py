@@ -0,0 +1,108 @@
+import os
+import time
+
+
+# JSON-lines trace of where the time goes, modelled on GIT_TRACE2's event target:
+# GIT_XL_TRACE=1 writes to stderr, 2-9 to that file descriptor and an absolute path appends to a file
+START = time.perf_counter()
+
+target = None
+target_fd = None
+
+
+def open_target(value):
+    if value.lower() in ('', '0', 'false', 'no', 'off'):
+        return None
+    if value.lower() in ('1', 'true', 'yes', 'on'):
+        return 2
+    if value.isdigit() and 2 <= int(value) <= 9:
+        return int(value)
+    if os.path.isabs(value):
+        try:
+            return os.open(value, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o666)
+        except OSError:
+            return None
+    return None
+
+
+def get_fd():
+    # re-checked on every call: the daemon's forked workers get GIT_XL_TRACE from each client
+    global target, target_fd
+    value = os.environ.get('GIT_XL_TRACE', '')
+    if value != target:
+        if target_fd is not None and target_fd > 9:
+            os.close(target_fd)
+        target = value
+        target_fd = open_target(value)
+    return target_fd
+
+
+def enabled():
+    return get_fd() is not None
+
+
+def event(kind, **fields):
+    fd = get_fd()
+    if fd is None:
+        return
+    import json
+    record = {'event': kind, 'pid': os.getpid(), 't_abs': round(time.perf_counter() - START, 6)}
+    record.update(fields)
+    try:
+        # a single write per event, O_APPEND keeps lines of concurrent processes intact
+        os.write(fd, (json.dumps(record) + '\n').encode('utf-8'))
+    except OSError:
+        pass
+
+
+class Region:
+
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+        self.start = None
+
+    def set(self, **fields):
+        self.fields.update(fields)
+
+    def add(self, key, value):
+        self.fields[key] = self.fields.get(key, 0) + value
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        event('region', name=self.name, duration=round(time.perf_counter() - self.start, 6), **self.fields)
+
+
+class NullRegion:
+    # returned while tracing is off: entering, leaving and setting fields do nothing
+
+    def set(self, **fields):
+        pass
+
+    def add(self, key, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+NULL_REGION = NullRegion()
+
+
+def region(name, **fields):
+    return Region(name, fields) if get_fd() is not None else NULL_REGION
+
+
+def start(argv):
+    # process_time() is the CPU time spent before the command started: interpreter start-up and imports
+    event('start', argv=argv, startup_cpu=round(time.process_time(), 6))
+
+
+def exit(status=0):
+    event('exit', status=status, duration=round(time.perf_counter() - START, 6))
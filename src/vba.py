@@ -0,0 +1,405 @@
+import io
+import os
+import mmap
+import struct
+from contextlib import contextmanager
+
+import tracing
+
+
+OLE_MAGIC = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+ZIP_MAGIC = b'PK'
+ZIP_END_OF_CENTRAL_DIRECTORY = b'PK\x05\x06'
+ZIP_CENTRAL_DIRECTORY_ENTRY = b'PK\x01\x02'
+ZIP_LOCAL_FILE_HEADER = b'PK\x03\x04'
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+ENDOFCHAIN = 0xFFFFFFFE
+STGTY_STORAGE = 1
+
+# records of the VBA project's dir stream (MS-OVBA 2.3.4.2)
+PROJECTCODEPAGE = 0x0003
+PROJECTVERSION = 0x0009
+PROJECTTERMINATOR = 0x0010
+MODULENAME = 0x0019
+MODULENAMEUNICODE = 0x0047
+MODULESTREAMNAME = 0x001A
+MODULESTREAMNAMEUNICODE = 0x0032
+MODULEOFFSET = 0x0031
+OVBA_CHUNK_SIZE = 4096
+# output of one flag byte and its eight tokens, at most 4098 bytes each
+OVBA_MAX_GROUP_SIZE = 8 * 4098
+
+
+@contextmanager
+def open_workbook(workbook):
+    # yields the workbook content as a bytes-like object: bytes, memoryview or a read-only mmap
+    if isinstance(workbook, (bytes, bytearray, memoryview, mmap.mmap)):
+        yield workbook
+    elif isinstance(workbook, io.BytesIO):
+        with workbook.getbuffer() as buffer:
+            yield buffer
+    elif hasattr(workbook, 'read'):
+        with map_file(workbook) as data:
+            yield data
+    else:
+        with open(workbook, 'rb') as f:
+            with map_file(f) as data:
+                yield data
+
+
+@contextmanager
+def map_file(f):
+    # workbooks on disk are mapped instead of being copied into memory: the pre-check and the
+    # VBA extraction only touch the pages they need
+    try:
+        size = os.fstat(f.fileno()).st_size
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        size = None
+    if not size:
+        f.seek(0)
+        yield f.read()
+    else:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield data
+
+
+def has_vba_project(data):
+    # cheap pre-check that avoids loading oletools for workbooks without macros:
+    # only the zip central directory or the OLE directory is read
+    magic = bytes(data[:8])
+    if magic.startswith(ZIP_MAGIC):
+        try:
+            names = zip_member_names(data)
+        except (struct.error, ValueError):
+            return True
+        return any(name.rsplit('/', 1)[-1].lower() == 'vbaproject.bin' for name in names)
+    if magic == OLE_MAGIC:
+        try:
+            return 'VBA' in ole_storage_names(data)
+        except (struct.error, ValueError):
+            return True
+    # unknown container, leave it to oletools
+    return True
+
+
+def zip_member_names(data):
+    return [entry['name'] for entry in zip_directory(data)]
+
+
+def zip_directory(data):
+    # reads the central directory directly, importing zipfile alone costs more than the whole pre-check
+    tail = bytes(data[-min(len(data), 22 + 65535):])
+    end = tail.rfind(ZIP_END_OF_CENTRAL_DIRECTORY)
+    if end < 0 or len(tail) < end + 22:
+        raise ValueError('no zip central directory')
+    entry_count, directory_size, directory_offset = struct.unpack_from('<HII', tail, end + 10)
+    if entry_count == 0xFFFF or directory_offset == 0xFFFFFFFF:
+        # zip64 archive, rare enough to leave to zipfile
+        import zipfile
+        with zipfile.ZipFile(io.BytesIO(data)) as z:
+            return [{'name': info.filename, 'method': info.compress_type, 'size': info.compress_size,
+                     'offset': info.header_offset, 'crc': info.CRC} for info in z.infolist()]
+
+    directory = bytes(data[directory_offset:directory_offset + directory_size])
+    entries = []
+    offset = 0
+    for _ in range(entry_count):
+        if directory[offset:offset + 4] != ZIP_CENTRAL_DIRECTORY_ENTRY:
+            raise ValueError('invalid zip central directory')
+        flags, method = struct.unpack_from('<HH', directory, offset + 8)
+        crc, compressed_size = struct.unpack_from('<II', directory, offset + 16)
+        name_length, extra_length, comment_length = struct.unpack_from('<HHH', directory, offset + 28)
+        header_offset, = struct.unpack_from('<I', directory, offset + 42)
+        name = directory[offset + 46:offset + 46 + name_length]
+        entries.append({'name': name.decode('utf-8' if flags & 0x800 else 'cp437'), 'method': method,
+                        'size': compressed_size, 'offset': header_offset, 'crc': crc})
+        offset += 46 + name_length + extra_length + comment_length
+    return entries
+
+
+def zip_member_start(data, entry):
+    header = bytes(data[entry['offset']:entry['offset'] + 30])
+    if header[:4] != ZIP_LOCAL_FILE_HEADER:
+        raise ValueError('invalid zip local file header')
+    name_length, extra_length = struct.unpack_from('<HH', header, 26)
+    if entry['method'] not in (ZIP_STORED, ZIP_DEFLATED):
+        raise ValueError(f'unsupported zip compression method {entry["method"]}')
+    return entry['offset'] + 30 + name_length + extra_length
+
+
+def read_zip_member(data, entry, max_size=None):
+    # max_size: limits.LimitExceeded is raised before more than max_size bytes are decompressed
+    start = zip_member_start(data, entry)
+    content = bytes(data[start:start + entry['size']])
+    if entry['method'] == ZIP_STORED:
+        return content
+    import zlib
+    if not max_size:
+        return zlib.decompress(content, -15)
+    decompressor = zlib.decompressobj(-15)
+    content = decompressor.decompress(content, max_size + 1)
+    if len(content) > max_size:
+        from limits import LimitExceeded, format_size
+        raise LimitExceeded(f'VBA project is more than {format_size(max_size)} decompressed')
+    return content
+
+
+class ZipMemberStream(io.RawIOBase):
+    # reads a zip member in chunks, never holding more than one chunk of its decompressed content
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, data, entry):
+        import zlib
+        self.data = data
+        self.position = zip_member_start(data, entry)
+        self.end = self.position + entry['size']
+        self.decompressor = zlib.decompressobj(-15) if entry['method'] == ZIP_DEFLATED else None
+        self.buffer = b''
+        self.finished = False
+
+    def readable(self):
+        return True
+
+    def read_chunk(self):
+        if self.decompressor is not None and self.decompressor.unconsumed_tail:
+            # output is limited to one chunk, the input that produced the rest is kept by the decompressor
+            return self.decompressor.decompress(self.decompressor.unconsumed_tail, self.CHUNK_SIZE)
+        if self.position < self.end:
+            chunk = bytes(self.data[self.position:min(self.position + self.CHUNK_SIZE, self.end)])
+            self.position += len(chunk)
+            if self.decompressor is None:
+                return chunk
+            return self.decompressor.decompress(chunk, self.CHUNK_SIZE)
+        self.finished = True
+        return self.decompressor.flush() if self.decompressor is not None else b''
+
+    def readinto(self, b):
+        while not self.buffer and not self.finished:
+            self.buffer = self.read_chunk()
+        size = min(len(b), len(self.buffer))
+        b[:size] = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+        return size
+
+
+def ole_storage_names(data):
+    # upper-cased names of all storages in an OLE compound file, read from the directory sectors only
+    header = bytes(data[:512])
+    if len(header) < 512 or header[:8] != OLE_MAGIC:
+        raise ValueError('not an OLE file')
+    sector_shift, = struct.unpack_from('<H', header, 0x1E)
+    sector_size = 1 << sector_shift
+    fat_sector_count, first_directory_sector = struct.unpack_from('<II', header, 0x2C)
+    first_difat_sector, difat_sector_count = struct.unpack_from('<II', header, 0x44)
+    difat = list(struct.unpack_from('<109I', header, 0x4C))
+
+    def read_sector(sector):
+        offset = (sector + 1) * sector_size
+        if offset + sector_size > len(data):
+            raise ValueError('truncated OLE file')
+        return bytes(data[offset:offset + sector_size])
+
+    # FAT sectors beyond the first 109 are listed in the DIFAT chain
+    entries_per_sector = sector_size // 4
+    sector = first_difat_sector
+    for _ in range(difat_sector_count):
+        if sector >= ENDOFCHAIN:
+            break
+        values = struct.unpack(f'<{entries_per_sector}I', read_sector(sector))
+        difat.extend(values[:-1])
+        sector = values[-1]
+    difat = difat[:fat_sector_count]
+
+    fat_cache = {}
+
+    def next_sector(sector):
+        index = sector // entries_per_sector
+        if index not in fat_cache:
+            if index >= len(difat):
+                raise ValueError('invalid sector chain')
+            fat_cache[index] = struct.unpack(f'<{entries_per_sector}I', read_sector(difat[index]))
+        return fat_cache[index][sector % entries_per_sector]
+
+    names = set()
+    sector = first_directory_sector
+    visited = set()
+    while sector < ENDOFCHAIN:
+        if sector in visited:
+            raise ValueError('cyclic sector chain')
+        visited.add(sector)
+        entries = read_sector(sector)
+        for offset in range(0, sector_size, 128):
+            name_length, entry_type = struct.unpack_from('<HB', entries, offset + 0x40)
+            if entry_type == STGTY_STORAGE and 2 <= name_length <= 64:
+                names.add(entries[offset:offset + name_length - 2].decode('utf-16-le', 'replace').upper())
+        sector = next_sector(sector)
+    return names
+
+
+def as_file(data):
+    # file-like view for libraries that need one; mmaps already are file-like and bytes are shared, not copied
+    if isinstance(data, mmap.mmap):
+        data.seek(0)
+        return data
+    return io.BytesIO(data)
+
+
+class VBAProject:
+    # reads the dir stream and the raw module streams of a VBA project without decompressing the
+    # module sources: unchanged modules can be recognised by a hash of their compressed stream
+
+    def __init__(self, ole, root):
+        from oletools.common.codepages import codepage2codec
+        self.ole = ole
+        self.root = root
+        self.codepage, self.modules = parse_dir_stream(decompress(ole.openstream(root + ['VBA', 'dir']).read()))
+        self.codec = codepage2codec(self.codepage)
+
+    def module_name(self, module):
+        return module['name'].decode(self.codec, 'replace')
+
+    def module_streams(self):
+        # yields (module name, compressed source) in the order of the dir stream
+        for module in self.modules:
+            stream_name = module.get('stream_name', module['name']).decode(self.codec, 'replace')
+            data = self.ole.openstream(self.root + ['VBA', stream_name]).read()
+            yield self.module_name(module), data[module.get('offset', 0):]
+
+    def decode(self, compressed_source):
+        with tracing.region('decompress', compressed_bytes=len(compressed_source)) as region:
+            source = decompress(compressed_source)
+            region.set(bytes=len(source))
+        return source.decode(self.codec, 'replace')
+
+
+def parse_dir_stream(data):
+    codepage = 1252
+    modules = []
+    offset = 0
+    while offset + 6 <= len(data):
+        record_id, size = struct.unpack_from('<HI', data, offset)
+        offset += 6
+        if record_id == PROJECTVERSION:
+            # the only record whose size field is a reserved value: it is always followed by 6 bytes
+            size = 6
+        value = data[offset:offset + size]
+        offset += size
+        if record_id == PROJECTCODEPAGE:
+            codepage, = struct.unpack('<H', value)
+        elif record_id == MODULENAME:
+            modules.append({'name': bytes(value)})
+        elif modules and record_id == MODULESTREAMNAME:
+            modules[-1]['stream_name'] = bytes(value)
+        elif modules and record_id == MODULEOFFSET:
+            modules[-1]['offset'], = struct.unpack('<I', value)
+        elif record_id == PROJECTTERMINATOR:
+            break
+    else:
+        raise ValueError('truncated dir stream')
+    return codepage, modules
+
+
+def decompress(data):
+    # MS-OVBA 2.4.1 decompression with the same output and errors as oletools' decompress_stream, which extends
+    # a bytearray one byte at a time. Here runs of literals and copy tokens are slice copies into an output
+    # buffer that is allocated up front
+    data = bytes(data)
+    if not data or data[0] != 1:
+        raise ValueError('invalid signature byte in compressed container')
+    end = len(data)
+    # a chunk inflates to at most 4096 bytes, the chunk headers give the size of the output
+    chunks = 0
+    position = 1
+    while position + 1 < end:
+        chunks += 1
+        position += (data[position] | data[position + 1] << 8 & 0xFFF) + 3
+    out = bytearray(min(chunks * OVBA_CHUNK_SIZE, end * 8))
+    size = 0
+    current = 1
+    while current < end:
+        chunk_start = current
+        header, = struct.unpack('<H', data[current:current + 2])
+        chunk_size = (header & 0xFFF) + 3
+        if (header >> 12) & 0b111 != 0b011:
+            raise ValueError('invalid chunk signature in compressed container')
+        compressed = header >> 15
+        if compressed and chunk_size > OVBA_CHUNK_SIZE + 2:
+            raise ValueError('compressed chunk is larger than 4098 bytes')
+        if not compressed and chunk_size != OVBA_CHUNK_SIZE + 2:
+            raise ValueError('uncompressed chunk is not 4098 bytes')
+        chunk_end = min(end, chunk_start + chunk_size)
+        current = chunk_start + 2
+        if not compressed:
+            raw = data[current:current + OVBA_CHUNK_SIZE]
+            out[size:size + len(raw)] = raw
+            size += len(raw)
+            current += OVBA_CHUNK_SIZE
+            continue
+        decompressed_start = size
+        while current < chunk_end:
+            if len(out) < size + OVBA_MAX_GROUP_SIZE:
+                # only corrupt chunks inflate to more than 4096 bytes
+                out.extend(bytes(max(len(out), OVBA_MAX_GROUP_SIZE)))
+            flags = data[current]
+            current += 1
+            if not flags and current + 8 <= chunk_end:
+                # eight literals, the most common token sequence in source code
+                out[size:size + 8] = data[current:current + 8]
+                size += 8
+                current += 8
+                continue
+            for bit in range(8):
+                if current >= chunk_end:
+                    break
+                if not flags >> bit & 1:
+                    out[size] = data[current]
+                    size += 1
+                    current += 1
+                    continue
+                token, = struct.unpack('<H', data[current:current + 2])
+                current += 2
+                difference = size - decompressed_start
+                if not difference:
+                    raise ValueError('copy token at the start of a chunk')
+                bit_count = max((difference - 1).bit_length(), 4)
+                length_mask = 0xFFFF >> bit_count
+                length = (token & length_mask) + 3
+                offset = ((token & ~length_mask) >> (16 - bit_count)) + 1
+                source = size - offset
+                if source < 0:
+                    # corrupt offsets index from the end of the output, as with oletools' bytearray
+                    for index in range(source, source + length):
+                        if index < 0:
+                            index += size
+                            if index < 0:
+                                raise IndexError('copy token before the start of the output')
+                        out[size] = out[index]
+                        size += 1
+                elif offset >= length:
+                    out[size:size + length] = out[source:source + length]
+                    size += length
+                else:
+                    # the copy overlaps its own output and repeats the last `offset` bytes
+                    out[size:size + length] = (out[source:size] * (length // offset + 1))[:length]
+                    size += length
+    del out[size:]
+    return bytes(out)
+
+
+def open_vba_project(data, max_size=None):
+    # returns the VBA project of a workbook or None if it has none
+    import olefile
+    if bytes(data[:2]) == ZIP_MAGIC:
+        entries = [entry for entry in zip_directory(data)
+                   if entry['name'].rsplit('/', 1)[-1].lower() == 'vbaproject.bin']
+        if not entries:
+            return None
+        ole = olefile.OleFileIO(read_zip_member(data, entries[0], max_size))
+    else:
+        ole = olefile.OleFileIO(as_file(data))
+    for path in ole.listdir(streams=True, storages=False):
+        if len(path) >= 2 and path[-2].upper() == 'VBA' and path[-1].lower() == 'dir':
+            return VBAProject(ole, path[:-2])
+    return None